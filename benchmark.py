@@ -0,0 +1,293 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from generate_ecommerce_data import main as generate_main
+from ingest_to_database import (TABLE_LOAD_ORDER, create_database_schema, load_csv_to_table, bulk_load_csv_to_table,
+                                bulk_load_pragmas, build_review_stats, build_daily_sales, build_review_search,
+                                build_report_indexes)
+from query_orders import (SUMMARY_LABELS, SUMMARY_QUERY_TEMPLATE, ConnectionPool, customer_order_report,
+                          report_summary, fetch_report_window, compact_storage, stored_dates)
+
+DEFAULT_SCALES = '10,100,1000'
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 20.0
+DEFAULT_OUTPUT = 'benchmark_results.json'
+
+# Timings closer than this to the baseline are noise, whatever the percentage: the
+# generate, load and index stages run once, and a run of a few ms varies by more than 20%
+MIN_REGRESSION_SECONDS = 0.05
+
+# Measurements compared against the baseline; a larger value is worse for all of them
+COMPARED_METRICS = ['seconds', 'peak_rss_bytes']
+
+def peak_rss():
+    """Peak resident set size of this process in bytes (ru_maxrss is in KiB on Linux, bytes on macOS)."""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def isolated_call(func, *args):
+    """Run func(*args) with its progress output discarded: (its result, peak RSS of this process)."""
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        result = func(*args)
+    return result, peak_rss()
+
+def run_isolated(func, *args):
+    """
+    Run a stage function in a new process, so its peak RSS is its own and not that of the
+    stages before it: {stage: measurements} as returned by func, each with peak_rss_bytes added.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        stages, rss = executor.submit(isolated_call, func, *args).result()
+    for measurements in stages.values():
+        measurements['peak_rss_bytes'] = rss
+    return stages
+
+def timed(func, *args):
+    """(func(*args), seconds it took)."""
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+def best_of(repeat, func, *args):
+    """(result, seconds) of the fastest of repeat runs of func(*args); the first run warms the page cache."""
+    return min((timed(func, *args) for _ in range(repeat)), key=lambda run: run[1])
+
+def generate_stage(scale, seed, backend, csv_dir):
+    """Generate the CSV files of one scale factor."""
+    _, seconds = timed(generate_main, ['--scale', str(scale), '--seed', str(seed), '--backend', backend,
+                                       '--output-dir', csv_dir])
+    csv_bytes = sum(os.path.getsize(os.path.join(csv_dir, f'{table}.csv')) for _, table, _ in TABLE_LOAD_ORDER)
+    return {'generate': {'seconds': seconds, 'bytes': csv_bytes}}
+
+def load_stage(db_file, csv_file, table_name, columns, loader):
+    """Load one CSV file with load_csv_to_table (loader 'row') or bulk_load_csv_to_table ('bulk')."""
+    conn = sqlite3.connect(db_file)
+    conn.execute('PRAGMA foreign_keys = ON')
+    try:
+        if loader == 'bulk':
+            with bulk_load_pragmas(conn):
+                rows, seconds = timed(bulk_load_csv_to_table, conn, csv_file, table_name, columns)
+        else:
+            rows, seconds = timed(load_csv_to_table, conn, csv_file, table_name, columns)
+    finally:
+        conn.close()
+    return {f'load {table_name}': {'seconds': seconds, 'rows': rows}}
+
+def index_stage(db_file):
+    """Build the derived tables and the report indexes, as ingest_to_database.py does after loading."""
+    conn = sqlite3.connect(db_file)
+    conn.execute('PRAGMA foreign_keys = ON')
+    try:
+        start_time = time.perf_counter()
+        build_review_stats(conn)
+        build_daily_sales(conn)
+        build_review_search(conn)
+        derived_seconds = time.perf_counter() - start_time
+        _, index_seconds = timed(build_report_indexes, conn)
+    finally:
+        conn.close()
+    return {'derived tables': {'seconds': derived_seconds}, 'indexes': {'seconds': index_seconds}}
+
+def report_stage(db_file, days, repeat):
+    """Time reading every row of the main report."""
+    pool = ConnectionPool(db_file, size=1)
+    try:
+        rows, seconds = best_of(repeat, lambda: sum(1 for _ in customer_order_report(pool, days=days)))
+    finally:
+        pool.close()
+    return {'report': {'seconds': seconds, 'rows': rows}}
+
+def summary_statistic_queries():
+    """SUMMARY_QUERY_TEMPLATE cut down to each one of its statistics: [(label, sql)]."""
+    select_list, from_clause = SUMMARY_QUERY_TEMPLATE.split('\nFROM ', 1)
+    expressions = [line.strip().rstrip(',') for line in select_list.split('SELECT', 1)[1].splitlines()
+                   if line.strip()]
+    from_clause = from_clause.format(orders='orders', order_items='order_items', filters='')
+    return [(label, f'SELECT {expression}\nFROM {from_clause}')
+            for label, expression in zip(SUMMARY_LABELS, expressions)]
+
+def summary_stage(db_file, days, repeat):
+    """Time the summary statistics as the report computes them (in one query), and each one by itself."""
+    pool = ConnectionPool(db_file, size=1)
+    try:
+        _, seconds = best_of(repeat, report_summary, pool, days)
+        stages = {'summary': {'seconds': seconds}}
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            window = fetch_report_window(cursor, db_file, days)
+            params = stored_dates(window, compact_storage(cursor, db_file))
+            for label, sql in summary_statistic_queries():
+                _, seconds = best_of(repeat, lambda: cursor.execute(sql, params).fetchone())
+                stages[f'summary: {label.format(days=days)}'] = {'seconds': seconds}
+            cursor.close()
+    finally:
+        pool.close()
+    return stages
+
+def benchmark_scale(scale, args, work_dir):
+    """Run every stage at one scale factor: {'stages': {stage: measurements}, 'db_bytes': ...}."""
+    csv_dir = os.path.join(work_dir, f'scale_{scale:g}')
+    db_file = os.path.join(csv_dir, 'ecommerce.db')
+    os.makedirs(csv_dir, exist_ok=True)
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    
+    stages = run_isolated(generate_stage, scale, args.seed, args.backend, csv_dir)
+    conn = sqlite3.connect(db_file)
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        create_database_schema(conn)
+    conn.close()
+    for csv_file, table_name, columns in TABLE_LOAD_ORDER:
+        stages.update(run_isolated(load_stage, db_file, os.path.join(csv_dir, csv_file), table_name, columns,
+                                   args.loader))
+    stages['generate']['rows'] = sum(stages[f'load {table}']['rows'] for _, table, _ in TABLE_LOAD_ORDER)
+    stages.update(run_isolated(index_stage, db_file))
+    stages.update(run_isolated(report_stage, db_file, args.days, args.repeat))
+    stages.update(run_isolated(summary_stage, db_file, args.days, args.repeat))
+    
+    for measurements in stages.values():
+        if measurements.get('rows') and measurements['seconds']:
+            measurements['rows_per_sec'] = measurements['rows'] / measurements['seconds']
+    return {'stages': stages, 'db_bytes': os.path.getsize(db_file)}
+
+def compare_results(results, baseline, threshold):
+    """
+    Compare each measurement with the baseline's for the same scale and stage (and the
+    database sizes): {(scale, stage, metric): (value, baseline value, change in %)}, and
+    the keys of those worse than the baseline by more than threshold percent.
+    """
+    changes = {}
+    for scale, result in results['scales'].items():
+        base = baseline.get('scales', {}).get(scale)
+        if base is None:
+            continue
+        pairs = [((scale, 'database', 'db_bytes'), result['db_bytes'], base.get('db_bytes'))]
+        for stage, measurements in result['stages'].items():
+            for metric in COMPARED_METRICS:
+                pairs.append(((scale, stage, metric), measurements.get(metric),
+                              base['stages'].get(stage, {}).get(metric)))
+        for key, value, base_value in pairs:
+            if value is not None and base_value:
+                changes[key] = (value, base_value, (value - base_value) / base_value * 100)
+    
+    regressions = []
+    for key, (value, base_value, change) in changes.items():
+        if change > threshold and not (key[2] == 'seconds' and value - base_value < MIN_REGRESSION_SECONDS):
+            regressions.append(key)
+    return changes, regressions
+
+def format_change(changes, regressions, key):
+    """The change of one measurement against the baseline, e.g. '+3%', marked if it is a regression."""
+    if key not in changes:
+        return ''
+    return f"{changes[key][2]:+.0f}%{' REGRESSION' if key in regressions else ''}"
+
+def print_results(results, changes=None, regressions=()):
+    """Print one line per scale and stage, with the changes against the baseline if given."""
+    header = f"{'Scale':>7}  {'Stage':<40} {'Time (ms)':>10} {'Rows/sec':>11} {'Peak RSS':>9}"
+    print(header + (f"  {'Time vs baseline':<20} RSS vs baseline" if changes is not None else ""))
+    for scale, result in results['scales'].items():
+        for stage, measurements in result['stages'].items():
+            rate = measurements.get('rows_per_sec')
+            rate = f'{rate:,.0f}' if rate else ''
+            line = (f"{scale:>7}  {stage:<40} {measurements['seconds'] * 1000:>10.1f} {rate:>11} "
+                    f"{measurements['peak_rss_bytes'] / 2**20:>7.0f}MB")
+            if changes is not None:
+                line += (f"  {format_change(changes, regressions, (scale, stage, 'seconds')):<20} "
+                         f"{format_change(changes, regressions, (scale, stage, 'peak_rss_bytes'))}")
+            print(line.rstrip())
+        line = f"{scale:>7}  {'database size':<40} {result['db_bytes'] / 2**20:>9.1f}MB"
+        if changes is not None:
+            line += f"{'':>23}{format_change(changes, regressions, (scale, 'database', 'db_bytes'))}"
+        print(line.rstrip())
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='Time data generation, ingest and the report queries at several '
+                                                 'scale factors, and compare the results with a baseline.')
+    parser.add_argument('--scales', default=DEFAULT_SCALES,
+                        help=f'comma-separated generator scale factors (default: {DEFAULT_SCALES})')
+    parser.add_argument('--seed', type=int, default=42, help='generator random seed (default: 42)')
+    parser.add_argument('--backend', choices=['python', 'numpy'], default='python',
+                        help='generator backend (default: python)')
+    parser.add_argument('--loader', choices=['row', 'bulk'], default='row',
+                        help='row: load_csv_to_table; bulk: bulk_load_csv_to_table (default: row)')
+    parser.add_argument('--days', type=int, default=90, help='report window in days (default: 90)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f'runs of each query, the fastest counts (default: {DEFAULT_REPEAT})')
+    parser.add_argument('--work-dir', default=None,
+                        help='keep the CSV files and databases here (default: a temporary directory, '
+                             'deleted afterwards)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help=f'results JSON file (default: {DEFAULT_OUTPUT})')
+    parser.add_argument('--baseline', default=None, help='results JSON file of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'percent by which a time, peak RSS or database size may exceed the baseline '
+                             f'before it counts as a regression (default: {DEFAULT_THRESHOLD:g})')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='also write the results to --baseline, after comparing')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    scales = [float(scale) for scale in args.scales.split(',')]
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    elif args.baseline and not args.update_baseline:
+        sys.exit(f"Error: baseline {args.baseline} not found")
+    
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                        'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'settings': {'seed': args.seed, 'backend': args.backend, 'loader': args.loader,
+                     'days': args.days, 'repeat': args.repeat},
+        'scales': {},
+    }
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='ecommerce_benchmark_')
+    try:
+        for scale in scales:
+            print(f"Benchmarking scale {scale:g}...")
+            results['scales'][f'{scale:g}'] = benchmark_scale(scale, args, work_dir)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    if baseline and baseline.get('settings') != results['settings']:
+        print(f"Warning: {args.baseline} was run with other settings: {baseline.get('settings')}")
+    changes, regressions = compare_results(results, baseline, args.threshold) if baseline else (None, [])
+    print()
+    print_results(results, changes, regressions)
+    
+    results['regressions'] = []
+    for scale, stage, metric in regressions:
+        value, base_value, change = changes[scale, stage, metric]
+        results['regressions'].append({'scale': scale, 'stage': stage, 'metric': metric, 'value': value,
+                                       'baseline': base_value, 'change_percent': round(change, 1)})
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.update_baseline and args.baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline {args.baseline} updated")
+    
+    if regressions:
+        print(f"{len(regressions)} measurements regressed by more than {args.threshold:g}% against {args.baseline}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
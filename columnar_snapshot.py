@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+from ingest_to_database import DAY_TYPE, day_number, day_text
+from query_orders import (SUMMARY_LABELS, ConnectionPool, database_version, report_window, fetch_report_window,
+                          report_rows, summary_values, write_table_report)
+
+# Rows read from SQLite per fetchmany call while exporting
+DEFAULT_EXPORT_CHUNK = 100000
+
+# Snapshot columns per table: (column, dtype, SQL for the standard schema, SQL for the
+# compact one). Rows are exported in primary key order. *_index columns are the row of the
+# referenced customer, order or product in its own table's arrays, so joins are array
+# lookups. Strings are dictionary encoded: an int32 code per row into a sorted array of
+# the distinct values, so comparing codes orders rows like comparing the strings. Prices
+# and ratings are rounded as the report rounds them, and dates are day numbers.
+SNAPSHOT_TABLES = {
+    'customers': ('customers', [
+        ('customer_id', 'int64', 'customer_id', 'customer_id'),
+        ('name', 'str', 'name', 'name'),
+    ]),
+    'products': ('products p LEFT JOIN product_review_stats s ON s.product_id = p.product_id', [
+        ('product_id', 'int64', 'p.product_id', 'p.product_id'),
+        ('name', 'str', 'p.name', 'p.name'),
+        ('category', 'str', 'p.category', 'p.category'),
+        ('price', 'float64', 'ROUND(p.price, 2)', 'ROUND(p.price / 100.0, 2)'),
+        ('review_count', 'int32', 'COALESCE(s.review_count, 0)', 'COALESCE(s.review_count, 0)'),
+        ('avg_rating', 'float64', 'ROUND(COALESCE(s.avg_rating, 0), 2)', 'ROUND(COALESCE(s.avg_rating, 0), 2)'),
+    ]),
+    'orders': ('orders', [
+        ('order_id', 'int64', 'order_id', 'order_id'),
+        ('customer_index', 'customers', 'customer_id', 'customer_id'),
+        ('order_date', 'int32', "CAST(julianday(order_date) - julianday('1970-01-01') AS INTEGER)", 'order_date'),
+    ]),
+    'order_items': ('order_items', [
+        ('order_item_id', 'int64', 'order_item_id', 'order_item_id'),
+        ('order_index', 'orders', 'order_id', 'order_id'),
+        ('product_index', 'products', 'product_id', 'product_id'),
+        ('quantity', 'int32', 'quantity', 'quantity'),
+        ('price', 'float64', 'ROUND(price, 2)', 'ROUND(price / 100.0, 2)'),
+    ]),
+}
+
+# Primary key column of each table, which *_index columns are looked up in
+SNAPSHOT_KEYS = {
+    'customers': 'customer_id',
+    'products': 'product_id',
+    'orders': 'order_id',
+}
+
+def column_path(snapshot_dir, table_name, column, suffix=''):
+    """Path of one snapshot column's .npy file (suffix '.dict' for a string dictionary)."""
+    return os.path.join(snapshot_dir, f'{table_name}.{column}{suffix}.npy')
+
+def string_dictionary(cursor, table_name, expression):
+    """Sorted array of the distinct values of a text column, as the column's dictionary."""
+    import numpy as np
+    values = [row[0] for row in cursor.execute(f'SELECT DISTINCT {expression} FROM {table_name} ORDER BY 1')]
+    return np.array(values, dtype=str)
+
+def export_table(conn, snapshot_dir, table_name, compact, snapshot, chunk_size=DEFAULT_EXPORT_CHUNK):
+    """Write one table's columns (see SNAPSHOT_TABLES) as .npy files, chunk_size rows at a time."""
+    import numpy as np
+    from numpy.lib.format import open_memmap
+    source, columns = SNAPSHOT_TABLES[table_name]
+    cursor = conn.cursor()
+    count = cursor.execute(f'SELECT COUNT(*) FROM {table_name}').fetchone()[0]
+    
+    arrays = []
+    codes = []
+    for column, dtype, standard_sql, compact_sql in columns:
+        if dtype == 'str':
+            dictionary = string_dictionary(cursor, source, compact_sql if compact else standard_sql)
+            np.save(column_path(snapshot_dir, table_name, column, '.dict'), dictionary)
+            codes.append({value: code for code, value in enumerate(dictionary.tolist())})
+            dtype = 'int32'
+        elif dtype in SNAPSHOT_KEYS:
+            codes.append(snapshot[f'{dtype}.{SNAPSHOT_KEYS[dtype]}'])
+            dtype = 'int32'
+        else:
+            codes.append(None)
+        arrays.append(open_memmap(column_path(snapshot_dir, table_name, column), mode='w+',
+                                  dtype=dtype, shape=(count,)))
+    
+    select = ', '.join(compact_sql if compact else standard_sql for _, _, standard_sql, compact_sql in columns)
+    cursor.execute(f'SELECT {select} FROM {source} ORDER BY 1')
+    start = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        stop = start + len(rows)
+        for values, array, coding in zip(zip(*rows), arrays, codes):
+            if isinstance(coding, dict):
+                array[start:stop] = [coding[value] for value in values]
+            elif coding is not None:
+                # Row of each referenced key in the parent's (sorted) key column
+                keys = np.array(values, dtype=np.int64)
+                index = np.searchsorted(coding, keys)
+                if np.any(index >= len(coding)) or np.any(coding[np.minimum(index, len(coding) - 1)] != keys):
+                    raise ValueError(f"{table_name} references a key missing from the snapshot")
+                array[start:stop] = index
+            else:
+                array[start:stop] = values
+        start = stop
+    for (column, _, _, _), array in zip(columns, arrays):
+        array.flush()
+        snapshot[f'{table_name}.{column}'] = np.load(column_path(snapshot_dir, table_name, column), mmap_mode='r')
+    return count
+
+def export_snapshot(db_file, snapshot_dir, chunk_size=DEFAULT_EXPORT_CHUNK):
+    """
+    Export customers, products (with their review aggregates), orders and order_items
+    into snapshot_dir as columnar .npy files, plus a manifest.json with the row counts and
+    the database version the snapshot was taken at.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = database_version(db_file)
+    conn = sqlite3.connect(Path(db_file).resolve().as_uri() + '?mode=ro', uri=True)
+    try:
+        declared = conn.execute("SELECT upper(type) FROM pragma_table_info('orders') "
+                                "WHERE name = 'order_date'").fetchone()
+        compact = declared is not None and declared[0] == DAY_TYPE
+        
+        # One read transaction, so all tables come from the same state of the database
+        conn.execute('BEGIN')
+        snapshot = {}
+        counts = {}
+        for table_name in SNAPSHOT_TABLES:
+            start_time = time.perf_counter()
+            counts[table_name] = export_table(conn, snapshot_dir, table_name, compact, snapshot, chunk_size)
+            print(f"Exported {counts[table_name]} {table_name} rows in {time.perf_counter() - start_time:.2f}s")
+        conn.rollback()
+    finally:
+        conn.close()
+    
+    manifest = {
+        'database': os.path.abspath(db_file),
+        'version': version,
+        'exported_at': datetime.now().isoformat(timespec='seconds'),
+        'rows': counts,
+    }
+    with open(os.path.join(snapshot_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Snapshot written to {snapshot_dir}")
+
+def load_snapshot(snapshot_dir):
+    """
+    Open every column of a snapshot memory-mapped, as {'table.column': array}. String
+    dictionaries are loaded as 'table.column.dict'.
+    """
+    import numpy as np
+    snapshot = {}
+    for table_name, (_, columns) in SNAPSHOT_TABLES.items():
+        for column, dtype, _, _ in columns:
+            snapshot[f'{table_name}.{column}'] = np.load(column_path(snapshot_dir, table_name, column),
+                                                         mmap_mode='r')
+            if dtype == 'str':
+                snapshot[f'{table_name}.{column}.dict'] = np.load(
+                    column_path(snapshot_dir, table_name, column, '.dict'), mmap_mode='r')
+    return snapshot
+
+def snapshot_window(snapshot, days=90, reference_date=None):
+    """(start, end) of the report window, as fetch_report_window computes it."""
+    order_dates = snapshot['orders.order_date']
+    max_order_date = day_text(int(order_dates.max())) if len(order_dates) else None
+    return report_window(max_order_date, days, reference_date)
+
+def snapshot_report(snapshot, window):
+    """
+    The report rows of a (start, end) window computed with NumPy over a snapshot: the same
+    rows, in the same order, as the SQL report (see REPORT_QUERY_TEMPLATE in query_orders.py).
+    """
+    import numpy as np
+    start, end = day_number(window[0]), day_number(window[1])
+    order_dates = snapshot['orders.order_date']
+    in_window = (order_dates >= start) & (order_dates <= end)
+    
+    # The window's order lines, and their orders, customers and products
+    order_index = snapshot['order_items.order_index']
+    lines = np.flatnonzero(in_window[order_index])
+    orders = order_index[lines]
+    products = snapshot['order_items.product_index'][lines]
+    customers = snapshot['orders.customer_index'][orders]
+    customer_names = snapshot['customers.name'][customers]
+    product_names = snapshot['products.name'][products]
+    dates = order_dates[orders]
+    
+    # ORDER BY order_date DESC, customer name, product name, order_id, order_item_id. The
+    # first three go into one int64 key (name codes sort like the names), and the lines
+    # are already in order_item_id order, which the stable lexsort keeps among ties
+    customer_count = len(snapshot['customers.name.dict'])
+    product_count = len(snapshot['products.name.dict'])
+    days_back = (end - dates).astype(np.int64)
+    key = (days_back * customer_count + customer_names) * product_count + product_names
+    order = np.lexsort((snapshot['orders.order_id'][orders], key))
+    
+    # Dates are formatted once per day of the window, not once per row
+    day_texts = np.arange(start, end + 1).astype('datetime64[D]').astype(str)
+    columns = [
+        snapshot['customers.name.dict'][customer_names[order]],
+        day_texts[dates[order] - start],
+        snapshot['products.name.dict'][product_names[order]],
+        snapshot['order_items.quantity'][lines][order],
+        snapshot['products.price'][products][order],
+        snapshot['products.avg_rating'][products][order],
+        snapshot['products.review_count'][products][order],
+    ]
+    return list(zip(*(column.tolist() for column in columns)))
+
+def snapshot_summary(snapshot, window):
+    """The summary statistics of a (start, end) window over a snapshot, in SUMMARY_LABELS order."""
+    import numpy as np
+    start, end = day_number(window[0]), day_number(window[1])
+    order_dates = snapshot['orders.order_date']
+    in_window = (order_dates >= start) & (order_dates <= end)
+    lines = in_window[snapshot['order_items.order_index']]
+    
+    # Distinct counts by marking the rows seen
+    customers = np.zeros(len(snapshot['customers.customer_id']), dtype=bool)
+    customers[snapshot['orders.customer_index'][in_window]] = True
+    products = np.zeros(len(snapshot['products.product_id']), dtype=bool)
+    products[snapshot['order_items.product_index'][lines]] = True
+    reviewed = products & (snapshot['products.review_count'] > 0)
+    return (int(in_window.sum()), int(customers.sum()), int(products.sum()), int(reviewed.sum()))
+
+def check_snapshot(db_file, snapshot_dir, days=90, reference_date=None):
+    """
+    Compute the report and summary statistics from the snapshot and with SQL, compare them
+    and print the time each took. Returns True if they match.
+    """
+    with open(os.path.join(snapshot_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    current = database_version(db_file)
+    if manifest['version'] != json.loads(json.dumps(current)):
+        print(f"Warning: {db_file} changed since the snapshot was exported; expect differences")
+    
+    start_time = time.perf_counter()
+    snapshot = load_snapshot(snapshot_dir)
+    window = snapshot_window(snapshot, days, reference_date)
+    snapshot_rows = snapshot_report(snapshot, window)
+    snapshot_stats = snapshot_summary(snapshot, window)
+    snapshot_time = time.perf_counter() - start_time
+    
+    start_time = time.perf_counter()
+    pool = ConnectionPool(db_file, size=1)
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            sql_window = fetch_report_window(cursor, db_file, days, reference_date)
+            _, rows = report_rows(cursor, db_file, sql_window)
+            sql_rows = list(rows)
+            sql_stats = tuple(summary_values(cursor, db_file, sql_window))
+            cursor.close()
+    finally:
+        pool.close()
+    sql_time = time.perf_counter() - start_time
+    
+    print(f"Window {window[0]} to {window[1]}: {len(sql_rows)} report rows "
+          f"from {manifest['rows']['order_items']} order lines")
+    print(f"SQL:      {sql_time:.3f}s")
+    print(f"Snapshot: {snapshot_time:.3f}s ({sql_time / snapshot_time:.1f}x faster)")
+    matches = window == sql_window and snapshot_rows == sql_rows and snapshot_stats == sql_stats
+    print("Report and summary statistics match." if matches else "MISMATCH between snapshot and SQL results.")
+    return matches
+
+def print_snapshot_report(snapshot_dir, out=None, days=90, reference_date=None):
+    """Print the report table and summary statistics computed from a snapshot, as query_orders.py does."""
+    out = out or sys.stdout
+    snapshot = load_snapshot(snapshot_dir)
+    window = snapshot_window(snapshot, days, reference_date)
+    write_table_report(snapshot_report(snapshot, window), out, window[0], days=days)
+    print("\n" + "=" * 120, file=out)
+    print("SUMMARY STATISTICS", file=out)
+    print("=" * 120, file=out)
+    for label, value in zip(SUMMARY_LABELS, snapshot_summary(snapshot, window)):
+        print(f"{label.format(days=days)}: {value}", file=out)
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='Export a columnar snapshot of the order data and report from it.')
+    parser.add_argument('--db', default='ecommerce.db', help='SQLite database file (default: ecommerce.db)')
+    parser.add_argument('--snapshot-dir', default='snapshot', help='snapshot directory (default: snapshot)')
+    parser.add_argument('--days', type=int, default=90, help='length of the report window in days (default: 90)')
+    parser.add_argument('--reference-date', default=None,
+                        help='last day of the window, YYYY-MM-DD (default: the most recent order date)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_EXPORT_CHUNK,
+                        help=f'rows read per fetch while exporting (default: {DEFAULT_EXPORT_CHUNK})')
+    parser.add_argument('command', choices=['export', 'report', 'check'],
+                        help='export: write the snapshot; report: print the report from it; '
+                             'check: compare the snapshot report with the SQL one and time both')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'export':
+        export_snapshot(args.db, args.snapshot_dir, args.chunk_size)
+    elif args.command == 'report':
+        print_snapshot_report(args.snapshot_dir, days=args.days, reference_date=args.reference_date)
+    elif not check_snapshot(args.db, args.snapshot_dir, args.days, args.reference_date):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,55 @@
 import csv
+import os
 import random
+import sqlite3
+import shutil
+import tempfile
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime, timedelta
 
-# Set seed for reproducibility
-random.seed(42)
+from ingest_to_database import (TABLE_LOAD_ORDER, DEFAULT_CHUNK_SIZE, create_database_schema, bulk_load_pragmas,
+                                build_review_stats, build_daily_sales, build_review_search,
+                                build_report_indexes, column_converters, convert_rows)
+from instrumentation import METRICS_FORMATS, instruments
 
 # Generate dates
 start_date = datetime(2020, 1, 1)
 end_date = datetime(2024, 12, 31)
 
+# Row counts at scale factor 1 (the original sample dataset); order items follow from orders
+BASE_ROW_COUNTS = {
+    'customers': 30,
+    'products': 35,
+    'orders': 25,
+    'reviews': 30,
+}
+
+# Products drawn for a review before it is handed to a later order because its customer
+# has already reviewed every product drawn
+MAX_REVIEW_DRAWS = 20
+
+# Rows per shard for the numpy backend when --shards is not given
+NUMPY_SHARD_ROWS = 1000000
+
+# Independent random streams of the numpy backend, combined with the seed and shard index
+NUMPY_STREAMS = {
+    'customers': 1,
+    'products': 2,
+    'orders': 3,
+    'item_counts': 4,
+}
+
+CSV_FIELDNAMES = {
+    'customers': ['customer_id', 'name', 'email', 'signup_date'],
+    'products': ['product_id', 'name', 'category', 'price'],
+    'orders': ['order_id', 'customer_id', 'order_date', 'total_amount'],
+    'order_items': ['order_item_id', 'order_id', 'product_id', 'quantity', 'price'],
+    'reviews': ['review_id', 'product_id', 'customer_id', 'rating', 'review_text', 'review_date'],
+}
+
 # Sample data pools
 first_names = [
     "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda",
@@ -29,7 +70,7 @@ last_names = [
 domains = ["gmail.com", "yahoo.com", "outlook.com", "hotmail.com", "company.com", "email.com"]
 
 categories = [
-    "Electronics", "Clothing", "Home & Garden", "Books", 
+    "Electronics", "Clothing", "Home & Garden", "Books",
     "Sports & Outdoors", "Beauty & Personal Care", "Toys & Games",
     "Automotive", "Health & Wellness", "Food & Beverages"
 ]
@@ -47,6 +88,8 @@ product_names_by_category = {
     "Food & Beverages": ["Coffee Beans", "Tea Set", "Chocolate Box", "Snack Mix", "Energy Bar", "Juice", "Honey", "Olive Oil", "Spice Set", "Wine"]
 }
 
+product_tiers = ['Pro', 'Premium', 'Deluxe', 'Standard', 'Elite', 'Basic', 'Plus', 'Max']
+
 review_texts = [
     "Great product! Highly recommend.",
     "Good quality for the price.",
@@ -70,12 +113,13 @@ review_texts = [
     "Not recommended."
 ]
 
-def random_date(start, end):
-    """Generate a random date between start and end."""
-    time_between = end - start
-    days_between = time_between.days
-    random_days = random.randrange(days_between)
-    return start + timedelta(days=random_days)
+def random_day(first_day, last_day):
+    """Generate a random day offset (days since start_date) in [first_day, last_day)."""
+    return first_day + random.randrange(last_day - first_day)
+
+def day_to_text(day):
+    """Format a day offset from start_date as 'YYYY-MM-DD'."""
+    return (start_date + timedelta(days=day)).strftime('%Y-%m-%d')
 
 def generate_email(name):
     """Generate a realistic email from a name."""
@@ -83,133 +127,548 @@ def generate_email(name):
     domain = random.choice(domains)
     return f"{first}.{last}@{domain}"
 
-# Generate Customers (30 customers)
-customers = []
-customer_ids = []
-for i in range(1, 31):
-    name = f"{random.choice(first_names)} {random.choice(last_names)}"
-    signup_date = random_date(start_date, end_date - timedelta(days=365))
-    customers.append({
-        'customer_id': i,
-        'name': name,
-        'email': generate_email(name),
-        'signup_date': signup_date.strftime('%Y-%m-%d')
-    })
-    customer_ids.append(i)
-
-# Generate Products (35 products)
-products = []
-product_ids = []
-for i in range(1, 36):
-    category = random.choice(categories)
-    product_base = random.choice(product_names_by_category[category])
-    product_name = f"{product_base} {random.choice(['Pro', 'Premium', 'Deluxe', 'Standard', 'Elite', 'Basic', 'Plus', 'Max'])}"
-    price = round(random.uniform(9.99, 999.99), 2)
-    products.append({
-        'product_id': i,
-        'name': product_name,
-        'category': category,
-        'price': price
-    })
-    product_ids.append(i)
-
-# Generate Orders (25 orders)
-orders = []
-order_ids = []
-customer_signup_dates = {c['customer_id']: datetime.strptime(c['signup_date'], '%Y-%m-%d') for c in customers}
-
-for i in range(1, 26):
-    customer_id = random.choice(customer_ids)
-    signup_date = customer_signup_dates[customer_id]
+def generate_customers(writer, count):
+    """
+    Write count customers and return their signup dates as an array of day offsets
+    (indexed by customer_id - 1), which is all later tables need to know about them.
+    """
+    last_signup_day = (end_date - timedelta(days=365) - start_date).days
+    signup_days = array('i')
+    for i in range(1, count + 1):
+        name = f"{random.choice(first_names)} {random.choice(last_names)}"
+        signup_day = random_day(0, last_signup_day)
+        writer.writerow((i, name, generate_email(name), day_to_text(signup_day)))
+        signup_days.append(signup_day)
+    return signup_days
+
+def generate_products(writer, count):
+    """Write count products and return their prices as an array indexed by product_id - 1."""
+    prices = array('d')
+    for i in range(1, count + 1):
+        category = random.choice(categories)
+        product_base = random.choice(product_names_by_category[category])
+        product_name = f"{product_base} {random.choice(product_tiers)}"
+        price = round(random.uniform(9.99, 999.99), 2)
+        writer.writerow((i, product_name, category, price))
+        prices.append(price)
+    return prices
+
+def generate_orders(order_writer, item_writer, review_writer, order_count, review_count,
+                    signup_days, prices):
+    """
+    Stream orders, their items and the reviews in a single pass, keeping nothing per order.
+    Each order gets 1-4 distinct products. Reviews are spread over the orders by selection
+    sampling, so customers are picked in proportion to how often they order (as before).
+    As before, a customer reviews a product at most once: the (product, customer) pairs
+    reviewed so far are kept, one int per review. A review whose customer keeps drawing
+    products they already reviewed is handed to a later order, so review_count reviews are
+    written unless the last orders' customers run out of products to review.
+    Returns (order_item_count, review_count).
+    """
+    customer_count = len(signup_days)
+    product_count = len(prices)
+    product_ids = range(1, product_count + 1)
+    last_day = (end_date - start_date).days
+    # (product_id - 1) * customer_count + customer_id of every review written
+    reviewed = set()
+
+    # Review slots per order; selection sampling picks exactly review_count of them
+    slots_per_order = -(-review_count // order_count) if order_count else 0
+    slots_left = order_count * slots_per_order
+    reviews_left = review_count
+
+    order_item_id = 1
+    review_id = 1
+    for order_id in range(1, order_count + 1):
+        customer_id = random.randint(1, customer_count)
+        signup_day = signup_days[customer_id - 1]
+        # Order date must be after signup date
+        order_day = random_day(signup_day + 1, last_day)
+        total_amount = round(random.uniform(20.00, 1500.00), 2)
+        order_writer.writerow((order_id, customer_id, day_to_text(order_day), total_amount))
+
+        # Each order has 1-4 items
+        num_items = random.randint(1, 4)
+        for product_id in random.sample(product_ids, min(num_items, len(product_ids))):
+            quantity = random.randint(1, 5)
+            price = round(prices[product_id - 1] * quantity, 2)
+            item_writer.writerow((order_item_id, order_id, product_id, quantity, price))
+            order_item_id += 1
+
+        num_reviews = 0
+        for _ in range(slots_per_order):
+            if random.randrange(slots_left) < reviews_left:
+                num_reviews += 1
+                reviews_left -= 1
+            slots_left -= 1
+        if not num_reviews or not product_count:
+            continue
+        # Review date should be at least a week after signup
+        for _ in range(num_reviews):
+            for _ in range(MAX_REVIEW_DRAWS):
+                product_id = random.randint(1, product_count)
+                pair = (product_id - 1) * customer_count + customer_id
+                if pair not in reviewed:
+                    break
+            else:
+                reviews_left += 1
+                continue
+            reviewed.add(pair)
+            review_day = random_day(signup_day + 7, last_day)
+            rating = random.randint(1, 5)
+            review_text = random.choice(review_texts)
+            review_writer.writerow((review_id, product_id, customer_id, rating, review_text,
+                                    day_to_text(review_day)))
+            review_id += 1
+
+    return order_item_id - 1, review_id - 1
+
+# NumPy backend: every shard draws its rows from its own stream, seeded by
+# (seed, table stream, shard index), and writes them to its own part file.
+# Part files are concatenated in shard order, so for a fixed seed and shard count
+# the output does not depend on how many worker processes ran the shards.
+
+def numpy_rng(seed, stream, shard):
+    """Create the numpy.random.Generator for one shard of one stream."""
+    import numpy as np
+    return np.random.default_rng([seed, NUMPY_STREAMS[stream], shard])
+
+def numpy_pool(values):
+    """Turn a list of strings into an object array that index arrays can select from."""
+    import numpy as np
+    pool = np.empty(len(values), dtype=object)
+    pool[:] = values
+    return pool
+
+def numpy_date_texts():
+    """Object array mapping every day offset up to end_date to its 'YYYY-MM-DD' text."""
+    return numpy_pool([day_to_text(day) for day in range((end_date - start_date).days + 1)])
+
+def shard_bounds(count, shards):
+    """Split range(count) into shards contiguous (start, stop) pieces."""
+    return [(count * s // shards, count * (s + 1) // shards) for s in range(shards)]
+
+def write_csv_part(path, columns, batch_rows=100000):
+    """Write equal-length NumPy columns as CSV rows (no header)."""
+    with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        for start in range(0, len(columns[0]), batch_rows):
+            writer.writerows(zip(*[col[start:start + batch_rows].tolist() for col in columns]))
+
+def numpy_customers_shard(seed, shard, start, stop):
+    """Generate customers start+1..stop; returns ({table: columns}, signup day offsets)."""
+    import numpy as np
+    rng = numpy_rng(seed, 'customers', shard)
+    count = stop - start
+    last_signup_day = (end_date - timedelta(days=365) - start_date).days
+
+    first = rng.integers(0, len(first_names), count)
+    last = rng.integers(0, len(last_names), count)
+    domain = rng.integers(0, len(domains), count)
+    signup_days = rng.integers(0, last_signup_day, count)
+
+    names = numpy_pool(first_names)[first] + ' ' + numpy_pool(last_names)[last]
+    emails = (numpy_pool([n.lower() for n in first_names])[first] + '.'
+              + numpy_pool([n.lower() for n in last_names])[last] + '@' + numpy_pool(domains)[domain])
+    columns = [np.arange(start + 1, stop + 1), names, emails, numpy_date_texts()[signup_days]]
+    return {'customers': columns}, signup_days.astype(np.int32)
+
+def numpy_products_shard(seed, shard, start, stop):
+    """Generate products start+1..stop; returns ({table: columns}, prices)."""
+    import numpy as np
+    rng = numpy_rng(seed, 'products', shard)
+    count = stop - start
+
+    # Product names of all categories in one pool, addressed by category offset + index
+    sizes = np.array([len(product_names_by_category[c]) for c in categories])
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    category = rng.integers(0, len(categories), count)
+    base = offsets[category] + rng.integers(0, sizes[category])
+    tier = rng.integers(0, len(product_tiers), count)
+    prices = np.round(rng.uniform(9.99, 999.99, count), 2)
+
+    names = (numpy_pool([name for c in categories for name in product_names_by_category[c]])[base]
+             + ' ' + numpy_pool(product_tiers)[tier])
+    columns = [np.arange(start + 1, stop + 1), names, numpy_pool(categories)[category], prices]
+    return {'products': columns}, prices
+
+def numpy_item_counts(seed, shard, count, product_count):
+    """Number of items (1-4, at most product_count) for each order of a shard."""
+    import numpy as np
+    return np.minimum(numpy_rng(seed, 'item_counts', shard).integers(1, 5, count), product_count)
+
+def distinct_products(rng, num_items, product_count):
+    """
+    Draw a (orders, 4) matrix of product indexes whose first num_items entries are
+    distinct in every row. Rows with a repeat are redrawn until none are left.
+    Returns (picks, mask of the entries in use).
+    """
+    import numpy as np
+    width = 4
+    picks = rng.integers(0, product_count, (len(num_items), width))
+    used = np.arange(width) < num_items[:, None]
+    while True:
+        repeated = np.zeros(len(num_items), dtype=bool)
+        for a in range(width):
+            for b in range(a + 1, width):
+                repeated |= used[:, b] & (picks[:, a] == picks[:, b])
+        rows = np.flatnonzero(repeated)
+        if not rows.size:
+            return picks, used
+        picks[rows] = rng.integers(0, product_count, (rows.size, width))
+
+def numpy_orders_shard(seed, shard, start, stop, first_item_id, review_start, review_stop,
+                       signup_path, prices_path, reviews_path):
+    """
+    Generate orders start+1..stop with their items, and draw review_stop - review_start
+    reviews for them. A customer reviews a product at most once within the shard: repeated
+    (product, customer) pairs are redrawn while that removes repeats, and the rest are
+    dropped. The reviews are saved to reviews_path for numpy_reviews_shard, which numbers
+    them. Returns ({table: columns}, number of reviews kept).
+    """
+    import numpy as np
+    rng = numpy_rng(seed, 'orders', shard)
+    signup_days = np.load(signup_path, mmap_mode='r')
+    prices = np.load(prices_path, mmap_mode='r')
+    customer_count, product_count = len(signup_days), len(prices)
+    last_day = (end_date - start_date).days
+    date_texts = numpy_date_texts()
+    count = stop - start
+
+    order_ids = np.arange(start + 1, stop + 1)
+    customers = rng.integers(1, customer_count + 1, count)
     # Order date must be after signup date
-    order_date = random_date(signup_date + timedelta(days=1), end_date)
-    total_amount = round(random.uniform(20.00, 1500.00), 2)
-    orders.append({
-        'order_id': i,
-        'customer_id': customer_id,
-        'order_date': order_date.strftime('%Y-%m-%d'),
-        'total_amount': total_amount
-    })
-    order_ids.append(i)
-
-# Generate Order Items (40 items)
-order_items = []
-order_item_id = 1
-order_product_map = {}  # Track products per order
-
-for order_id in order_ids:
-    # Each order has 1-4 items
-    num_items = random.randint(1, 4)
-    order_products = random.sample(product_ids, min(num_items, len(product_ids)))
-    
-    for product_id in order_products:
-        quantity = random.randint(1, 5)
-        # Get product price
-        product_price = next(p['price'] for p in products if p['product_id'] == product_id)
-        price = round(product_price * quantity, 2)
-        
-        order_items.append({
-            'order_item_id': order_item_id,
-            'order_id': order_id,
-            'product_id': product_id,
-            'quantity': quantity,
-            'price': price
-        })
-        order_item_id += 1
-        order_product_map.setdefault(order_id, []).append(product_id)
-
-# Generate Reviews (30 reviews)
-reviews = []
-review_id = 1
-
-# Only review products that have been ordered
-reviewed_combinations = set()
-for _ in range(30):
-    # Pick a customer who has made an order
-    customer_id = random.choice([o['customer_id'] for o in orders])
-    
-    # Pick a product that was ordered (by any customer)
-    product_id = random.choice(product_ids)
-    
-    # Avoid duplicate reviews
-    combo = (product_id, customer_id)
-    if combo in reviewed_combinations:
-        continue
-    reviewed_combinations.add(combo)
-    
-    # Review date should be after signup
-    signup_date = customer_signup_dates[customer_id]
-    review_date = random_date(signup_date + timedelta(days=7), end_date)
-    
-    rating = random.randint(1, 5)
-    review_text = random.choice(review_texts)
-    
-    reviews.append({
-        'review_id': review_id,
-        'product_id': product_id,
-        'customer_id': customer_id,
-        'rating': rating,
-        'review_text': review_text,
-        'review_date': review_date.strftime('%Y-%m-%d')
-    })
-    review_id += 1
-
-# Write CSV files
-def write_csv(filename, data, fieldnames):
-    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(data)
-
-write_csv('customers.csv', customers, ['customer_id', 'name', 'email', 'signup_date'])
-write_csv('products.csv', products, ['product_id', 'name', 'category', 'price'])
-write_csv('orders.csv', orders, ['order_id', 'customer_id', 'order_date', 'total_amount'])
-write_csv('order_items.csv', order_items, ['order_item_id', 'order_id', 'product_id', 'quantity', 'price'])
-write_csv('reviews.csv', reviews, ['review_id', 'product_id', 'customer_id', 'rating', 'review_text', 'review_date'])
-
-print("Generated CSV files:")
-print(f"- customers.csv: {len(customers)} rows")
-print(f"- products.csv: {len(products)} rows")
-print(f"- orders.csv: {len(orders)} rows")
-print(f"- order_items.csv: {len(order_items)} rows")
-print(f"- reviews.csv: {len(reviews)} rows")
+    order_days = rng.integers(signup_days[customers - 1] + 1, last_day)
+    totals = np.round(rng.uniform(20.00, 1500.00, count), 2)
+    tables = {'orders': [order_ids, customers, date_texts[order_days], totals]}
+
+    # Each order has 1-4 distinct products
+    num_items = numpy_item_counts(seed, shard, count, product_count)
+    picks, used = distinct_products(rng, num_items, product_count)
+    item_orders = np.repeat(order_ids, num_items)
+    item_products = picks[used] + 1
+    quantities = rng.integers(1, 6, len(item_orders))
+    item_prices = np.round(prices[item_products - 1] * quantities, 2)
+    item_ids = np.arange(first_item_id, first_item_id + len(item_orders))
+    tables['order_items'] = [item_ids, item_orders, item_products, quantities, item_prices]
+
+    # Reviews come from uniformly picked orders, so customers are weighted by how often they order
+    review_count = review_stop - review_start if count else 0
+    positions = np.sort(rng.integers(0, count, review_count))
+    review_customers = customers[positions]
+    review_products = rng.integers(1, product_count + 1, review_count)
+    repeats = review_count + 1
+    while True:
+        keys = review_products * (customer_count + 1) + review_customers
+        _, first_seen = np.unique(keys, return_index=True)
+        rows = np.setdiff1d(np.arange(review_count), first_seen, assume_unique=True)
+        if rows.size in (0, repeats):
+            break
+        repeats = rows.size
+        review_products[rows] = rng.integers(1, product_count + 1, rows.size)
+    # Customers who ran out of products to review keep one review per product
+    kept = np.sort(first_seen)
+    review_customers, review_products = review_customers[kept], review_products[kept]
+    # Review date should be at least a week after signup
+    review_days = rng.integers(signup_days[review_customers - 1] + 7, last_day)
+    ratings = rng.integers(1, 6, kept.size)
+    texts = rng.integers(0, len(review_texts), kept.size)
+    np.savez(reviews_path, products=review_products, customers=review_customers,
+             ratings=ratings, texts=texts, days=review_days)
+    return tables, int(kept.size)
+
+def numpy_reviews_shard(seed, shard, first_review_id, reviews_path):
+    """Number the reviews numpy_orders_shard saved to reviews_path; returns ({table: columns}, None)."""
+    import numpy as np
+    with np.load(reviews_path) as reviews:
+        ids = np.arange(first_review_id, first_review_id + len(reviews['products']))
+        columns = [ids, reviews['products'], reviews['customers'], reviews['ratings'],
+                   numpy_pool(review_texts)[reviews['texts']], numpy_date_texts()[reviews['days']]]
+    return {'reviews': columns}, None
+
+def run_numpy_shard(shard_func, part_paths, *args):
+    """
+    Run one shard in a worker process. With part_paths ({table: path}) the shard's tables
+    are written there and only the extra result is sent back; without, the columns are returned.
+    """
+    tables, extra = shard_func(*args)
+    if part_paths is None:
+        return tables, extra
+    for table, columns in tables.items():
+        write_csv_part(part_paths[table], columns)
+    return None, extra
+
+def concatenate_parts(output_dir, table, part_paths):
+    """Write the header of a table's CSV followed by its part files in shard order."""
+    with open(os.path.join(output_dir, f'{table}.csv'), 'w', newline='', encoding='utf-8') as csvfile:
+        csv.writer(csvfile).writerow(CSV_FIELDNAMES[table])
+        for path in part_paths:
+            with open(path, 'r', newline='', encoding='utf-8') as part:
+                shutil.copyfileobj(part, csvfile)
+
+def generate_numpy(counts, seed, output_dir, shards=None, workers=None, sinks=None):
+    """
+    Generate all tables with the vectorized backend, sharded over a process pool.
+    Customers and products are generated first; order shards then read their signup
+    days and prices from memory-mapped .npy files. Shards are written to CSV part files
+    under output_dir, or, if sinks ({table: writer}) is given, sent back and passed to
+    sinks[table].writerows in shard order. Returns the row counts written.
+    """
+    import numpy as np
+    shards = shards or max(1, -(-max(counts.values()) // NUMPY_SHARD_ROWS))
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    counts = dict(counts)
+
+    with tempfile.TemporaryDirectory(dir=output_dir) as work_dir, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = {table: [os.path.join(work_dir, f'{table}.{s:05d}.csv') for s in range(shards)]
+                 for table in CSV_FIELDNAMES}
+
+        def submit(shard_func, shard, *args):
+            part_paths = None if sinks else {table: paths[shard] for table, paths in parts.items()}
+            return pool.submit(run_numpy_shard, shard_func, part_paths, seed, shard, *args)
+
+        def collect(futures):
+            extras = []
+            for future in futures:
+                tables, extra = future.result()
+                for table, columns in (tables or {}).items():
+                    sinks[table].writerows(zip(*[col.tolist() for col in columns]))
+                extras.append(extra)
+            return extras
+
+        customer_futures = [submit(numpy_customers_shard, s, start, stop)
+                            for s, (start, stop) in enumerate(shard_bounds(counts['customers'], shards))]
+        product_futures = [submit(numpy_products_shard, s, start, stop)
+                           for s, (start, stop) in enumerate(shard_bounds(counts['products'], shards))]
+        signup_path = os.path.join(work_dir, 'signup_days.npy')
+        prices_path = os.path.join(work_dir, 'prices.npy')
+        np.save(signup_path, np.concatenate(collect(customer_futures)))
+        np.save(prices_path, np.concatenate(collect(product_futures)))
+
+        # Item ids must be contiguous across shards, so work out each shard's first id
+        order_bounds = shard_bounds(counts['orders'], shards)
+        item_counts = [int(numpy_item_counts(seed, s, stop - start, counts['products']).sum())
+                       for s, (start, stop) in enumerate(order_bounds)]
+        first_item_ids = np.concatenate(([1], 1 + np.cumsum(item_counts)[:-1])).tolist()
+        review_bounds = [(counts['reviews'] * start // max(counts['orders'], 1),
+                          counts['reviews'] * stop // max(counts['orders'], 1)) for start, stop in order_bounds]
+
+        reviews_paths = [os.path.join(work_dir, f'reviews.{s:05d}.npz') for s in range(shards)]
+        review_counts = collect([submit(numpy_orders_shard, s, start, stop, first_item_ids[s], *review_bounds[s],
+                                        signup_path, prices_path, reviews_paths[s])
+                                 for s, (start, stop) in enumerate(order_bounds)])
+        # Shards drop repeated reviews, so review ids are only known once every shard is done
+        first_review_ids = np.concatenate(([1], 1 + np.cumsum(review_counts)[:-1])).tolist()
+        collect([submit(numpy_reviews_shard, s, first_review_ids[s], reviews_paths[s])
+                 for s in range(shards)])
+
+        if not sinks:
+            for table, paths in parts.items():
+                concatenate_parts(output_dir, table, paths)
+
+    counts['order_items'] = sum(item_counts)
+    counts['reviews'] = sum(review_counts)
+    return counts
+
+class TableSink:
+    """
+    Stand-in for a csv.writer that inserts rows into a SQLite table with executemany,
+    batch_size rows at a time, and optionally copies them to a CSV writer as well.
+    Sinks of the tables a table depends on (parents) are flushed before it: child rows
+    inserted ahead of their parents would make SQLite scan the child table for every
+    parent row while foreign keys are deferred. converters (see column_converters) are
+    applied to the inserted rows only; the CSV copy keeps the generated text.
+    """
+
+    def __init__(self, cursor, table, columns, batch_size, csv_writer=None, parents=(), converters=None):
+        self.cursor = cursor
+        self.converters = converters
+        self.parents = list(parents)
+        self.insert_sql = f"INSERT INTO {table} ({','.join(columns)}) VALUES ({','.join('?' * len(columns))})"
+        self.batch_size = batch_size
+        self.csv_writer = csv_writer
+        self.batch = []
+
+    def writerow(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self):
+        if not self.batch:
+            return
+        for parent in self.parents:
+            parent.flush()
+        if self.converters:
+            self.cursor.executemany(self.insert_sql, convert_rows(self.batch, self.converters))
+        else:
+            self.cursor.executemany(self.insert_sql, self.batch)
+        if self.csv_writer is not None:
+            self.csv_writer.writerows(self.batch)
+        self.batch = []
+
+def build_database(args, counts):
+    """
+    Generate the data straight into a SQLite database, skipping the CSV round trip.
+    With --in-memory the database is built in :memory: and saved with the backup API.
+    Returns the row counts written.
+    """
+    if os.path.exists(args.db):
+        os.remove(args.db)
+        print(f"Removed existing {args.db}")
+    conn = sqlite3.connect(':memory:' if args.in_memory else args.db)
+    conn.execute('PRAGMA foreign_keys = ON')
+    instruments.watch(conn)
+
+    try:
+        with instruments.stage('create schema'):
+            create_database_schema(conn, args.compact)
+        with ExitStack() as stack:
+            csv_writers = open_csv_writers(stack, args.output_dir) if args.csv else {}
+            with bulk_load_pragmas(conn):
+                cursor = conn.cursor()
+                cursor.execute('BEGIN')
+                cursor.execute('PRAGMA defer_foreign_keys = ON')
+                # TABLE_LOAD_ORDER is in dependency order, so earlier sinks are safe parents
+                sinks = {}
+                for _, table, columns in TABLE_LOAD_ORDER:
+                    sinks[table] = TableSink(cursor, table, columns, DEFAULT_CHUNK_SIZE, csv_writers.get(table),
+                                             parents=list(sinks.values()),
+                                             converters=column_converters(conn, table, columns, compact_only=True))
+                with instruments.stage('generate and load') as stage:
+                    if args.backend == 'numpy':
+                        counts = generate_numpy(counts, args.seed, None, args.shards, args.workers, sinks)
+                    else:
+                        counts = generate_python(counts, args.seed, sinks)
+                    for sink in sinks.values():
+                        sink.flush()
+                    conn.commit()
+                    stage['rows'] = sum(counts.values())
+            with instruments.stage('build review stats'):
+                build_review_stats(conn)
+            with instruments.stage('build daily sales'):
+                build_daily_sales(conn)
+            with instruments.stage('build review search'):
+                build_review_search(conn)
+            with instruments.stage('build report indexes'):
+                build_report_indexes(conn)
+
+        if args.in_memory:
+            with instruments.stage('save to disk'):
+                disk = sqlite3.connect(args.db)
+                with disk:
+                    conn.backup(disk)
+                disk.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        instruments.done(conn)
+        conn.close()
+    return counts
+
+def generate_python(counts, seed, writers):
+    """Generate all tables with the random module into writers ({table: csv.writer-like})."""
+    counts = dict(counts)
+
+    # Set seed for reproducibility
+    random.seed(seed)
+
+    # Rows go straight to the writers; only customer signup days and product prices are kept
+    signup_days = generate_customers(writers['customers'], counts['customers'])
+    prices = generate_products(writers['products'], counts['products'])
+    counts['order_items'], counts['reviews'] = generate_orders(
+        writers['orders'], writers['order_items'], writers['reviews'],
+        counts['orders'], counts['reviews'], signup_days, prices)
+    return counts
+
+def row_counts(scale, overrides):
+    """Scale BASE_ROW_COUNTS by scale, then apply explicit per-table counts."""
+    counts = {table: max(1, round(base * scale)) for table, base in BASE_ROW_COUNTS.items()}
+    counts.update({table: count for table, count in overrides.items() if count is not None})
+    return counts
+
+def open_csv_writers(stack, output_dir):
+    """Open one csv.writer per table (header already written), closed when stack exits."""
+    os.makedirs(output_dir, exist_ok=True)
+    writers = {}
+    for table, fieldnames in CSV_FIELDNAMES.items():
+        csvfile = stack.enter_context(
+            open(os.path.join(output_dir, f'{table}.csv'), 'w', newline='', encoding='utf-8'))
+        writers[table] = csv.writer(csvfile)
+        writers[table].writerow(fieldnames)
+    return writers
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='Generate synthetic e-commerce CSV files.')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiply the base row counts (30 customers, 35 products, 25 orders, '
+                             '30 reviews) by this factor (default: 1)')
+    for table in BASE_ROW_COUNTS:
+        parser.add_argument(f'--{table}', type=int, default=None,
+                            help=f'number of {table} (overrides --scale)')
+    parser.add_argument('--seed', type=int, default=42, help='random seed (default: 42)')
+    parser.add_argument('--output-dir', default='.', help='directory for the CSV files (default: .)')
+    parser.add_argument('--backend', choices=['python', 'numpy'], default='python',
+                        help='python: row at a time with the random module; '
+                             'numpy: vectorized chunks, sharded over a process pool')
+    parser.add_argument('--shards', type=int, default=None,
+                        help=f'numpy backend: number of shards (default: one per {NUMPY_SHARD_ROWS:,} rows); '
+                             'together with --seed this fixes the output')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='numpy backend: worker processes (default: number of CPUs); does not affect the output')
+    parser.add_argument('--db', default=None,
+                        help='write the rows straight into this SQLite database instead of CSV files')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='with --db: build the database in memory and save it with the backup API')
+    parser.add_argument('--csv', action='store_true',
+                        help='with --db: also write the CSV files to --output-dir')
+    parser.add_argument('--compact', action='store_true',
+                        help='with --db: use the compact schema (day-number dates, amounts in cents)')
+    parser.add_argument('--metrics', default=None,
+                        help='write timings of the stages (generation, table loads, index builds) and '
+                             'SQLite statements to this file (off by default)')
+    parser.add_argument('--metrics-format', choices=METRICS_FORMATS, default='json',
+                        help='--metrics file format (default: json)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    counts = row_counts(args.scale, {table: getattr(args, table) for table in BASE_ROW_COUNTS})
+    if args.metrics:
+        instruments.enable('generate_ecommerce_data')
+
+    try:
+        if args.db:
+            counts = build_database(args, counts)
+        else:
+            with instruments.stage('generate') as stage:
+                if args.backend == 'numpy':
+                    counts = generate_numpy(counts, args.seed, args.output_dir, args.shards, args.workers)
+                else:
+                    with ExitStack() as stack:
+                        counts = generate_python(counts, args.seed, open_csv_writers(stack, args.output_dir))
+                stage['rows'] = sum(counts.values())
+    finally:
+        if args.metrics:
+            instruments.write(args.metrics, args.metrics_format)
+
+    if args.db:
+        print(f"Generated database '{args.db}':")
+        for table in CSV_FIELDNAMES:
+            print(f"- {table}: {counts[table]} rows")
+        return
+
+    print("Generated CSV files:")
+    for table in CSV_FIELDNAMES:
+        print(f"- {table}.csv: {counts[table]} rows")
+
+if __name__ == '__main__':
+    main()
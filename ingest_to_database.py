@@ -1,96 +1,251 @@
 import sqlite3
 import csv
 import os
-from datetime import datetime
+import time
+import argparse
+import hashlib
+import io
+import gzip
+import bz2
+import lzma
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from operator import itemgetter
+from datetime import date, datetime
 
-def create_database_schema(conn):
-    """Create all tables with proper schema, primary keys, and foreign keys."""
+from instrumentation import METRICS_FORMATS, instruments
+
+# Tables in foreign key dependency order: (csv_file, table_name, columns)
+TABLE_LOAD_ORDER = [
+    ('customers.csv', 'customers', ['customer_id', 'name', 'email', 'signup_date']),
+    ('products.csv', 'products', ['product_id', 'name', 'category', 'price']),
+    ('orders.csv', 'orders', ['order_id', 'customer_id', 'order_date', 'total_amount']),
+    ('order_items.csv', 'order_items', ['order_item_id', 'order_id', 'product_id', 'quantity', 'price']),
+    ('reviews.csv', 'reviews', ['review_id', 'product_id', 'customer_id', 'rating', 'review_text', 'review_date']),
+]
+
+# Rows handed to a single executemany call in bulk mode
+DEFAULT_CHUNK_SIZE = 50000
+
+# Read size used when hashing CSV files for the incremental manifest
+HASH_BLOCK_SIZE = 1 << 20
+
+# Size of the byte ranges a CSV file is split into for parallel parsing
+DEFAULT_SPLIT_BYTES = 4 << 20
+
+# Openers of compressed CSV files by suffix. A table's CSV file may also be given
+# compressed, e.g. orders.csv.gz for orders.csv, and is decompressed as it is read.
+COMPRESSED_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+    '.lzma': lzma.open,
+}
+
+# Declared types of the opt-in compact schema (create_database_schema(compact=True)).
+# Both contain "INT", so SQLite gives them INTEGER affinity; the loaders convert the
+# CSV text into them.
+DAY_TYPE = 'DAY INTEGER'  # date as the number of days since 1970-01-01
+CENTS_TYPE = 'CENTS INTEGER'  # amount in whole cents
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Columns stored with DAY_TYPE / CENTS_TYPE in the compact schema
+COMPACT_COLUMNS = {
+    'customers': {'signup_date': DAY_TYPE},
+    'products': {'price': CENTS_TYPE},
+    'orders': {'order_date': DAY_TYPE, 'total_amount': CENTS_TYPE},
+    'order_items': {'price': CENTS_TYPE},
+    'reviews': {'review_date': DAY_TYPE},
+}
+
+# SQL turning a compact column back into the standard schema's value, for the read-back views
+COMPACT_READ_EXPRESSIONS = {
+    DAY_TYPE: "date({column} * 86400, 'unixepoch')",
+    CENTS_TYPE: "{column} / 100.0",
+}
+
+def day_number(text):
+    """'YYYY-MM-DD' as days since 1970-01-01."""
+    return date.fromisoformat(text).toordinal() - EPOCH_ORDINAL
+
+def day_text(day):
+    """Days since 1970-01-01 as 'YYYY-MM-DD'."""
+    return date.fromordinal(day + EPOCH_ORDINAL).isoformat()
+
+def cents(amount):
+    """An amount (text or number) as whole cents."""
+    return round(float(amount) * 100)
+
+# Python converters applied by parse workers, keyed by declared SQLite column type
+TYPE_CONVERTERS = {
+    'INTEGER': int,
+    'REAL': float,
+    DAY_TYPE: day_number,
+    CENTS_TYPE: cents,
+}
+
+# Connection settings used while bulk loading; the previous values are restored afterwards.
+# The rollback journal is kept in memory (not OFF) so a failed load can still roll back.
+BULK_LOAD_PRAGMAS = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'cache_size': -262144,  # negative = KiB, i.e. 256 MB of page cache
+    'temp_store': 'MEMORY',
+}
+
+# The same for the resumable loader, which must survive a crash. With a write-ahead log,
+# synchronous NORMAL only risks the last commits on power loss, never corruption, and the
+# checkpoint of a lost chunk is lost with it, so the chunk is simply loaded again.
+RESUMABLE_LOAD_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -262144,
+    'temp_store': 'MEMORY',
+}
+
+# Secondary indexes for the reporting queries in query_orders.py: (name, table, columns).
+# They are built after the bulk load rather than maintained row by row during it.
+REPORT_INDEXES = [
+    ('idx_orders_date_customer', 'orders', ['order_date', 'customer_id']),
+    ('idx_order_items_order_product', 'order_items', ['order_id', 'product_id', 'quantity']),
+    ('idx_reviews_product_rating', 'reviews', ['product_id', 'rating']),
+]
+
+# Daily sales rollups kept by build_daily_sales: table -> (key column, its type, and the
+# SQL of an order line's key given its order as {order} and its product as p)
+DAILY_SALES_ROLLUPS = {
+    'daily_sales_by_category': ('category', 'TEXT', 'p.category'),
+    'daily_sales_by_customer': ('customer_id', 'INTEGER', '{order}.customer_id'),
+}
+
+# CHECK constraints from create_database_schema, as (reason, condition) for the staged loader
+CHECK_CONSTRAINTS = {
+    'reviews': [('CHECK(rating)', 'rating >= 1 AND rating <= 5')],
+}
+
+def create_database_schema(conn, compact=False):
+    """
+    Create all tables with proper schema, primary keys, and foreign keys.
+    With compact=True, dates are stored as DAY_TYPE and amounts as CENTS_TYPE integers
+    (see COMPACT_COLUMNS), and a <table>_view per table reads them back as before.
+    """
     cursor = conn.cursor()
+    date_type = DAY_TYPE if compact else 'DATE'
+    money_type = CENTS_TYPE if compact else 'REAL'
     
     # Create customers table
-    cursor.execute('''
+    cursor.execute(f'''
         CREATE TABLE IF NOT EXISTS customers (
             customer_id INTEGER PRIMARY KEY,
             name TEXT NOT NULL,
             email TEXT NOT NULL,
-            signup_date DATE NOT NULL
+            signup_date {date_type} NOT NULL
         )
     ''')
     
     # Create products table
-    cursor.execute('''
+    cursor.execute(f'''
         CREATE TABLE IF NOT EXISTS products (
             product_id INTEGER PRIMARY KEY,
             name TEXT NOT NULL,
             category TEXT NOT NULL,
-            price REAL NOT NULL
+            price {money_type} NOT NULL
         )
     ''')
     
     # Create orders table
-    cursor.execute('''
+    cursor.execute(f'''
         CREATE TABLE IF NOT EXISTS orders (
             order_id INTEGER PRIMARY KEY,
             customer_id INTEGER NOT NULL,
-            order_date DATE NOT NULL,
-            total_amount REAL NOT NULL,
+            order_date {date_type} NOT NULL,
+            total_amount {money_type} NOT NULL,
             FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
         )
     ''')
     
     # Create order_items table
-    cursor.execute('''
+    cursor.execute(f'''
         CREATE TABLE IF NOT EXISTS order_items (
             order_item_id INTEGER PRIMARY KEY,
             order_id INTEGER NOT NULL,
             product_id INTEGER NOT NULL,
             quantity INTEGER NOT NULL,
-            price REAL NOT NULL,
+            price {money_type} NOT NULL,
             FOREIGN KEY (order_id) REFERENCES orders(order_id),
             FOREIGN KEY (product_id) REFERENCES products(product_id)
         )
     ''')
     
     # Create reviews table
-    cursor.execute('''
+    cursor.execute(f'''
         CREATE TABLE IF NOT EXISTS reviews (
             review_id INTEGER PRIMARY KEY,
             product_id INTEGER NOT NULL,
             customer_id INTEGER NOT NULL,
             rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
             review_text TEXT,
-            review_date DATE NOT NULL,
+            review_date {date_type} NOT NULL,
             FOREIGN KEY (product_id) REFERENCES products(product_id),
             FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
         )
     ''')
     
+    if compact:
+        # Read-back views with the standard schema's text dates and decimal amounts
+        for _, table_name, columns in TABLE_LOAD_ORDER:
+            compact_columns = COMPACT_COLUMNS.get(table_name, {})
+            select = ', '.join(
+                f"{COMPACT_READ_EXPRESSIONS[compact_columns[col]].format(column=col)} AS {col}"
+                if col in compact_columns else col
+                for col in columns)
+            cursor.execute(f'CREATE VIEW IF NOT EXISTS {table_name}_view AS SELECT {select} FROM {table_name}')
+    
     conn.commit()
-    print("Database schema created successfully.")
+    print("Database schema created successfully." + (" (compact)" if compact else ""))
+
+def find_csv_source(csv_file):
+    """csv_file, or else the first of its compressed variants (csv_file + '.gz', ...) that exists, or None."""
+    for path in [csv_file] + [csv_file + suffix for suffix in COMPRESSED_OPENERS]:
+        if os.path.exists(path):
+            return path
+    return None
+
+def open_csv_source(csv_file):
+    """Open a CSV file for binary reading, decompressing it while it is read if its suffix says so."""
+    opener = COMPRESSED_OPENERS.get(os.path.splitext(csv_file)[1].lower(), open)
+    return opener(csv_file, 'rb')
 
 def load_csv_to_table(conn, csv_file, table_name, columns):
-    """Load data from CSV file into database table."""
+    """Load data from CSV file (plain or compressed, see find_csv_source) into database table."""
     cursor = conn.cursor()
     
-    if not os.path.exists(csv_file):
+    source = find_csv_source(csv_file)
+    if source is None:
         print(f"Warning: {csv_file} not found. Skipping...")
         return 0
     
-    with open(csv_file, 'r', encoding='utf-8') as f:
+    placeholders = ','.join(['?' for _ in columns])
+    column_names = ','.join(columns)
+    insert_sql = f'INSERT INTO {table_name} ({column_names}) VALUES ({placeholders})'
+    start_time = time.perf_counter()
+    
+    with io.TextIOWrapper(open_csv_source(source), encoding='utf-8', newline='') as f:
         reader = csv.DictReader(f)
         rows_inserted = 0
         
-        for row in reader:
+        converters = column_converters(conn, table_name, columns, compact_only=True)
+        for row in instruments.counted(f'parse {os.path.basename(source)}', reader):
             # Prepare values in the correct order
             values = [row[col] for col in columns]
-            placeholders = ','.join(['?' for _ in columns])
-            column_names = ','.join(columns)
+            if converters:
+                values = next(convert_rows([values], converters))
             
             try:
-                cursor.execute(f'''
-                    INSERT INTO {table_name} ({column_names})
-                    VALUES ({placeholders})
-                ''', values)
+                cursor.execute(insert_sql, values)
                 rows_inserted += 1
             except sqlite3.IntegrityError as e:
                 print(f"Error inserting row into {table_name}: {e}")
@@ -100,61 +255,1084 @@ def load_csv_to_table(conn, csv_file, table_name, columns):
                 print(f"Row data: {row}")
     
     conn.commit()
-    print(f"Loaded {rows_inserted} rows into {table_name} from {csv_file}")
+    report_load(table_name, source, rows_inserted, time.perf_counter() - start_time)
+    return rows_inserted
+
+def report_load(table_name, csv_file, rows, elapsed):
+    """Print the row count and throughput of a finished table load, and record it as a stage."""
+    instruments.record(f'load {table_name}', elapsed, rows)
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"Loaded {rows} rows into {table_name} from {csv_file} "
+          f"in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+
+def column_indexes(header, columns):
+    """Positions of columns in a CSV header; ValueError if any is missing."""
+    missing = [col for col in columns if col not in header]
+    if missing:
+        raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+    return [header.index(col) for col in columns]
+
+def select_columns(reader, header, columns):
+    """Yield CSV records from reader as tuples ordered like columns."""
+    indexes = column_indexes(header, columns)
+    if header == columns:
+        # Fast path: the file already has the table's column order
+        yield from reader
+        return
+    
+    if len(indexes) == 1:
+        for record in reader:
+            yield (record[indexes[0]],)
+    else:
+        yield from map(itemgetter(*indexes), reader)
+
+@contextmanager
+def bulk_load_pragmas(conn, pragmas=BULK_LOAD_PRAGMAS):
+    """Apply BULK_LOAD_PRAGMAS (or pragmas) for the duration of a load, then restore the previous values."""
+    saved = {name: conn.execute(f'PRAGMA {name}').fetchone()[0] for name in pragmas}
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    try:
+        yield conn
+    finally:
+        for name, value in saved.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+
+def iter_csv_rows(csv_file, columns):
+    """Yield the data rows of a CSV file (plain or compressed) as tuples ordered like columns."""
+    with io.TextIOWrapper(open_csv_source(csv_file), encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        yield from instruments.counted(f'parse {os.path.basename(csv_file)}', select_columns(reader, header, columns))
+
+def insert_in_chunks(cursor, insert_sql, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Run insert_sql with executemany over rows, chunk_size rows at a time. Returns the row count."""
+    rows_inserted = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        cursor.executemany(insert_sql, chunk)
+        rows_inserted += len(chunk)
+    return rows_inserted
+
+def bulk_load_csv_to_table(conn, csv_file, table_name, columns, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream a CSV file into a table with executemany in a single transaction.
+    Foreign keys are deferred to commit time, so any violation aborts the whole table load.
+    """
+    source = find_csv_source(csv_file)
+    if source is None:
+        print(f"Warning: {csv_file} not found. Skipping...")
+        return 0
+    
+    placeholders = ','.join(['?' for _ in columns])
+    column_names = ','.join(columns)
+    insert_sql = f'INSERT INTO {table_name} ({column_names}) VALUES ({placeholders})'
+    start_time = time.perf_counter()
+    
+    cursor = conn.cursor()
+    cursor.execute('BEGIN')
+    try:
+        # Only lasts until the end of this transaction
+        cursor.execute('PRAGMA defer_foreign_keys = ON')
+        rows = compact_rows(conn, table_name, columns, iter_csv_rows(source, columns))
+        rows_inserted = insert_in_chunks(cursor, insert_sql, rows, chunk_size)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    report_load(table_name, source, rows_inserted, time.perf_counter() - start_time)
     return rows_inserted
 
-def main():
+def create_quarantine_table(conn):
+    """
+    Create the table that holds rows rejected by the staged loader. source_row is the
+    1-based number of the data row in its file: the header is not counted, and a row
+    whose quoted fields span several lines counts once.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_rejects (
+            table_name TEXT NOT NULL,
+            source_row INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            row_data TEXT,
+            PRIMARY KEY (table_name, source_row)
+        )
+    ''')
+    conn.commit()
+
+def staging_rules(conn, table_name, columns, staging_table):
+    """
+    Build the (reason, condition) checks for rows of staging_table, in the order they are applied.
+    BAD_ROW comes first; NOT NULL, primary key and foreign key rules are read from the target
+    table's schema.
+    """
+    table_info = conn.execute(f'PRAGMA table_info({table_name})').fetchall()
+    pk_column = primary_key_column(conn, table_name)
+    not_null = [row[1] for row in table_info if (row[3] or row[5]) and row[1] in columns]
+    foreign_keys = conn.execute(f'PRAGMA foreign_key_list({table_name})').fetchall()
+    
+    rules = [('BAD_ROW', 's.bad_row')]
+    for col in not_null:
+        rules.append((f'NOT_NULL({col})', f"s.{col} IS NULL OR s.{col} = ''"))
+    rules.append(('BAD_KEY', f"typeof(s.{pk_column}) != 'integer'"))
+    for row in table_info:
+        if row[2].upper() in (DAY_TYPE, CENTS_TYPE) and row[1] in columns:
+            # A compact date or amount that the loader could not convert
+            rules.append((f'BAD_VALUE({row[1]})', f"typeof(s.{row[1]}) != 'integer'"))
+    for reason, condition in CHECK_CONSTRAINTS.get(table_name, []):
+        rules.append((reason, f'NOT ({condition})'))
+    for fk in foreign_keys:
+        parent, child_col, parent_col = fk[2], fk[3], fk[4]
+        rules.append((f'FK({child_col})',
+                      f'NOT EXISTS (SELECT 1 FROM {parent} p WHERE p.{parent_col} = s.{child_col})'))
+    # Duplicates are checked last so a row is only a duplicate of an earlier row that was kept
+    rules.append(('DUPLICATE_KEY',
+                  f'''EXISTS (SELECT 1 FROM {table_name} t WHERE t.{pk_column} = s.{pk_column})
+                  OR EXISTS (SELECT 1 FROM {staging_table} d
+                             WHERE d.{pk_column} = s.{pk_column} AND d.rowid < s.rowid
+                               AND NOT EXISTS (SELECT 1 FROM ingest_rejects r
+                                               WHERE r.table_name = :table AND r.source_row = d.rowid))'''))
+    return pk_column, rules
+
+def iter_staged_rows(csv_file, columns):
+    """
+    Yield the data rows of a CSV file as tuples ordered like columns, plus a bad_row flag:
+    1 for a record with more or fewer fields than the header, padded with empty fields
+    (extra fields dropped) so it can still be staged and rejected, else None. Blank lines
+    are skipped.
+    """
+    with io.TextIOWrapper(open_csv_source(csv_file), encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        indexes = column_indexes(header, columns)
+        select = itemgetter(*indexes) if len(indexes) > 1 else lambda record: (record[indexes[0]],)
+        width = len(header)
+        padding = [''] * width
+        for record in instruments.counted(f'parse {os.path.basename(csv_file)}', reader):
+            bad_row = None
+            if len(record) != width:
+                if not record:
+                    continue
+                record = (record + padding)[:width]
+                bad_row = 1
+            if header == columns:
+                # Fast path: the record already has the table's column order
+                record.append(bad_row)
+                yield record
+            else:
+                yield (*select(record), bad_row)
+
+def staged_load_csv_to_table(conn, csv_file, table_name, columns, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Load a CSV file through an unconstrained staging table.
+    Constraint violations are found with set-based SQL and written to ingest_rejects with a
+    reason code; the remaining rows are moved into the real table with one INSERT ... SELECT.
+    Returns (rows_loaded, rows_rejected).
+    """
+    source = find_csv_source(csv_file)
+    if source is None:
+        print(f"Warning: {csv_file} not found. Skipping...")
+        return 0, 0
+    
+    staging_table = f'staging_{table_name}'
+    column_names = ','.join(columns)
+    placeholders = ','.join(['?' for _ in columns])
+    start_time = time.perf_counter()
+    
+    cursor = conn.cursor()
+    cursor.execute('BEGIN')
+    try:
+        cursor.execute('PRAGMA defer_foreign_keys = ON')
+        
+        # Same column types as the target (so values get the same affinity), but no constraints;
+        # bad_row marks records whose field count does not match the header
+        cursor.execute(f'DROP TABLE IF EXISTS {staging_table}')
+        cursor.execute(f'CREATE TABLE {staging_table} AS SELECT {column_names} FROM {table_name} WHERE 0')
+        cursor.execute(f'ALTER TABLE {staging_table} ADD COLUMN bad_row INTEGER')
+        rows = iter_staged_rows(source, columns)
+        converters = column_converters(conn, table_name, columns, compact_only=True)
+        if converters:
+            rows = convert_rows(rows, converters + [None])
+        staged = insert_in_chunks(cursor, f'INSERT INTO {staging_table} VALUES ({placeholders}, ?)',
+                                  rows, chunk_size)
+        
+        pk_column, rules = staging_rules(conn, table_name, columns, staging_table)
+        cursor.execute(f'CREATE INDEX {staging_table}_pk ON {staging_table} ({pk_column})')
+        
+        # Rejects from a previous load of this table are replaced
+        cursor.execute('DELETE FROM ingest_rejects WHERE table_name = ?', (table_name,))
+        row_json = ', '.join(f"'{col}', s.{col}" for col in columns)
+        for reason, condition in rules:
+            # INSERT OR IGNORE keeps the first reason found for each row
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO ingest_rejects (table_name, source_row, reason, row_data)
+                SELECT :table, s.rowid, :reason, json_object({row_json})
+                FROM {staging_table} s
+                WHERE {condition}
+            ''', {'table': table_name, 'reason': reason})
+        
+        cursor.execute(f'''
+            INSERT INTO {table_name} ({column_names})
+            SELECT {column_names} FROM {staging_table} s
+            WHERE NOT EXISTS (SELECT 1 FROM ingest_rejects r
+                              WHERE r.table_name = ? AND r.source_row = s.rowid)
+        ''', (table_name,))
+        rows_loaded = cursor.rowcount
+        cursor.execute(f'DROP TABLE {staging_table}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    report_load(table_name, source, rows_loaded, time.perf_counter() - start_time)
+    return rows_loaded, staged - rows_loaded
+
+def print_reject_summary(conn):
+    """Print the number of quarantined rows per table and reason."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT table_name, reason, COUNT(*)
+        FROM ingest_rejects
+        GROUP BY table_name, reason
+        ORDER BY table_name, reason
+    ''')
+    rows = cursor.fetchall()
+    print("\n" + "="*50)
+    print("Rejected Rows (see ingest_rejects):")
+    print("="*50)
+    if not rows:
+        print("none")
+    for table_name, reason, count in rows:
+        print(f"{table_name}: {count} rows ({reason})")
+
+def create_manifest_table(conn):
+    """Create the table that records what the incremental loader has already ingested."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_manifest (
+            file_path TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            byte_offset INTEGER NOT NULL,
+            last_key INTEGER,
+            loaded_at TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+
+def hash_file(f, start, end, hasher):
+    """Feed bytes [start, end) of the binary file f into hasher."""
+    f.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = f.read(min(HASH_BLOCK_SIZE, remaining))
+        if not block:
+            break
+        hasher.update(block)
+        remaining -= len(block)
+    return hasher
+
+def iter_csv_rows_from_offset(csv_file, columns, byte_offset):
+    """Yield CSV rows as tuples ordered like columns, starting at byte_offset (a line boundary)."""
+    with open(csv_file, 'rb') as raw:
+        header_text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        header = next(csv.reader(header_text), None)
+        header_text.detach()  # keep raw open for the seek below
+        if header is None:
+            return
+        raw.seek(byte_offset)
+        reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8', newline=''))
+        if byte_offset == 0:
+            next(reader)  # header
+        yield from instruments.counted(f'parse {os.path.basename(csv_file)}', select_columns(reader, header, columns))
+
+def primary_key_column(conn, table_name):
+    """Name of the (single) primary key column of a table; ValueError if it has none (e.g. a view)."""
+    pk_column = next((row[1] for row in conn.execute(f'PRAGMA table_info({table_name})') if row[5] == 1), None)
+    if pk_column is None:
+        raise ValueError(f"{table_name} has no primary key column")
+    return pk_column
+
+def is_view(conn, name):
+    """True if name is a view, as orders and order_items are once partition_orders.py has split them."""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row is not None and row[0] == 'view'
+
+def upsert_sql(conn, table_name, columns):
+    """Build an INSERT ... ON CONFLICT statement that only rewrites rows whose values changed."""
+    pk_column = primary_key_column(conn, table_name)
+    column_names = ','.join(columns)
+    placeholders = ','.join(['?' for _ in columns])
+    updated = [col for col in columns if col != pk_column]
+    assignments = ', '.join(f'{col} = excluded.{col}' for col in updated)
+    current = ', '.join(f'{table_name}.{col}' for col in updated)
+    incoming = ', '.join(f'excluded.{col}' for col in updated)
+    return pk_column, f'''
+        INSERT INTO {table_name} ({column_names}) VALUES ({placeholders})
+        ON CONFLICT({pk_column}) DO UPDATE SET {assignments}
+        WHERE ({current}) IS NOT ({incoming})
+    '''
+
+def incremental_load_csv_to_table(conn, csv_file, table_name, columns, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Upsert only the new or changed rows of a CSV file, using ingest_manifest to remember
+    what was loaded before. Unchanged files (same size and mtime) are not even opened;
+    files that only grew are read from the previous end offset; anything else is re-upserted.
+    Returns the number of rows read from the file.
+    """
+    if not os.path.exists(csv_file):
+        print(f"Warning: {csv_file} not found. Skipping...")
+        return 0
+    
+    file_path = os.path.abspath(csv_file)
+    stat = os.stat(file_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT file_size, mtime_ns, content_hash, byte_offset
+        FROM ingest_manifest WHERE file_path = ?
+    ''', (file_path,))
+    entry = cursor.fetchone()
+    
+    if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+        print(f"{table_name}: {csv_file} unchanged, skipped")
+        return 0
+    
+    start_time = time.perf_counter()
+    hasher = hashlib.sha256()
+    start_offset = 0
+    with open(file_path, 'rb') as f:
+        if entry and stat.st_size >= entry[3]:
+            hash_file(f, 0, entry[3], hasher)
+            if hasher.hexdigest() == entry[2]:
+                # Previously loaded bytes are intact: only the appended part is new
+                start_offset = entry[3]
+            else:
+                hasher = hashlib.sha256()
+                hash_file(f, 0, stat.st_size, hasher)
+        else:
+            hash_file(f, 0, stat.st_size, hasher)
+        if start_offset:
+            hash_file(f, start_offset, stat.st_size, hasher)
+    
+    if start_offset == stat.st_size:
+        # Touched but not modified: just remember the new mtime
+        record_manifest(cursor, file_path, table_name, stat, hasher.hexdigest(), None)
+        conn.commit()
+        print(f"{table_name}: {csv_file} content unchanged, skipped")
+        return 0
+    if start_offset:
+        print(f"{table_name}: {csv_file} grew, reading from byte {start_offset}")
+    
+    pk_column, sql = upsert_sql(conn, table_name, columns)
+    cursor.execute('BEGIN')
+    try:
+        cursor.execute('PRAGMA defer_foreign_keys = ON')
+        rows = compact_rows(conn, table_name, columns, iter_csv_rows_from_offset(file_path, columns, start_offset))
+        rows_read = insert_in_chunks(cursor, sql, rows, chunk_size)
+        last_key = cursor.execute(f'SELECT MAX({pk_column}) FROM {table_name}').fetchone()[0]
+        record_manifest(cursor, file_path, table_name, stat, hasher.hexdigest(), last_key)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    report_load(table_name, csv_file, rows_read, time.perf_counter() - start_time)
+    return rows_read
+
+def record_manifest(cursor, file_path, table_name, stat, content_hash, last_key):
+    """Insert or update the manifest entry for a loaded file."""
+    cursor.execute('''
+        INSERT INTO ingest_manifest
+            (file_path, table_name, file_size, mtime_ns, content_hash, byte_offset, last_key, loaded_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(file_path) DO UPDATE SET
+            table_name = excluded.table_name,
+            file_size = excluded.file_size,
+            mtime_ns = excluded.mtime_ns,
+            content_hash = excluded.content_hash,
+            byte_offset = excluded.byte_offset,
+            last_key = COALESCE(excluded.last_key, ingest_manifest.last_key),
+            loaded_at = excluded.loaded_at
+    ''', (file_path, table_name, stat.st_size, stat.st_mtime_ns, content_hash, stat.st_size,
+          last_key, datetime.now().isoformat(timespec='seconds')))
+
+def create_checkpoint_table(conn):
+    """Create the table where the resumable loader records how far it got in each file."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+            file_path TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            byte_offset INTEGER NOT NULL,
+            line_number INTEGER NOT NULL,
+            rows_loaded INTEGER NOT NULL,
+            last_key INTEGER,
+            completed INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+
+def iter_csv_rows_tracked(f, columns, position):
+    """
+    Yield the data rows of the binary CSV stream f as tuples ordered like columns, keeping
+    position, a [byte_offset, line_number] list, just past the last row yielded: the
+    uncompressed byte offset and the number of lines, header included. Reading starts at
+    the position given, one kept by an earlier call ([0, 0]: the first data row).
+    """
+    header_line = f.readline()
+    header = next(csv.reader([header_line.decode('utf-8')]), None)
+    if header is None:
+        return
+    if position[0]:
+        # A compressed stream gets there by decompressing and discarding what comes before
+        f.seek(position[0])
+    else:
+        position[:] = [len(header_line), 1]
+    
+    def lines():
+        # csv.reader only asks for the next line once it needs it, so this is always just
+        # past the last line of the row it returned
+        for line in f:
+            position[0] += len(line)
+            position[1] += 1
+            yield line.decode('utf-8')
+    
+    yield from select_columns(csv.reader(lines()), header, columns)
+
+def resumable_load_csv_to_table(conn, csv_file, table_name, columns, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream a CSV file, plain or compressed (see find_csv_source), into a table, committing
+    every chunk_size rows together with a checkpoint in ingest_checkpoints: the position
+    just past the last committed row and its primary key. Run again after a crash, the
+    load continues from the checkpoint, so no committed row is read or inserted twice; a
+    completed file is skipped. Returns the number of rows loaded by this call.
+    """
+    source = find_csv_source(csv_file)
+    if source is None:
+        print(f"Warning: {csv_file} not found. Skipping...")
+        return 0
+    
+    file_path = os.path.abspath(source)
+    stat = os.stat(file_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT file_size, mtime_ns, byte_offset, line_number, rows_loaded, completed
+        FROM ingest_checkpoints WHERE file_path = ?
+    ''', (file_path,))
+    checkpoint = cursor.fetchone()
+    position = [0, 0]
+    rows_before = 0
+    if checkpoint:
+        if (checkpoint[0], checkpoint[1]) != (stat.st_size, stat.st_mtime_ns):
+            raise ValueError(f"{source} changed since it was (partly) loaded; a checkpoint only resumes "
+                             f"the same file (--mode incremental loads changes)")
+        if checkpoint[5]:
+            print(f"{table_name}: {source} already loaded, skipped")
+            return 0
+        position[:] = checkpoint[2:4]
+        rows_before = checkpoint[4]
+        print(f"{table_name}: resuming {source} after line {position[1]} "
+              f"({rows_before} rows loaded before)")
+    
+    pk_index = columns.index(primary_key_column(conn, table_name))
+    insert_sql = f"INSERT INTO {table_name} ({','.join(columns)}) VALUES ({','.join('?' * len(columns))})"
+    converters = column_converters(conn, table_name, columns, compact_only=True)
+    start_time = time.perf_counter()
+    rows_loaded = 0
+    with open_csv_source(file_path) as f:
+        records = instruments.counted(f'parse {os.path.basename(source)}',
+                                      iter_csv_rows_tracked(f, columns, position))
+        while True:
+            rows = list(islice(records, chunk_size))
+            if converters:
+                rows = list(convert_rows(rows, converters))
+            last_key = rows[-1][pk_index] if rows else None
+            
+            # The rows and the checkpoint that covers them are committed together
+            cursor.execute('BEGIN')
+            try:
+                cursor.execute('PRAGMA defer_foreign_keys = ON')
+                cursor.executemany(insert_sql, rows)
+                record_checkpoint(cursor, file_path, table_name, stat, position,
+                                  rows_before + rows_loaded + len(rows), last_key, len(rows) < chunk_size)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            rows_loaded += len(rows)
+            if len(rows) < chunk_size:
+                break
+    
+    report_load(table_name, source, rows_loaded, time.perf_counter() - start_time)
+    return rows_loaded
+
+def record_checkpoint(cursor, file_path, table_name, stat, position, rows_loaded, last_key, completed):
+    """Insert or update the checkpoint of a file being loaded by resumable_load_csv_to_table."""
+    cursor.execute('''
+        INSERT INTO ingest_checkpoints
+            (file_path, table_name, file_size, mtime_ns, byte_offset, line_number,
+             rows_loaded, last_key, completed, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(file_path) DO UPDATE SET
+            byte_offset = excluded.byte_offset,
+            line_number = excluded.line_number,
+            rows_loaded = excluded.rows_loaded,
+            last_key = COALESCE(excluded.last_key, ingest_checkpoints.last_key),
+            completed = excluded.completed,
+            updated_at = excluded.updated_at
+    ''', (file_path, table_name, stat.st_size, stat.st_mtime_ns, *position,
+          rows_loaded, last_key, int(completed), datetime.now().isoformat(timespec='seconds')))
+
+def table_dependencies(conn, table_names):
+    """Map each table to the tables its foreign keys reference."""
+    return {
+        table: sorted({fk[2] for fk in conn.execute(f'PRAGMA foreign_key_list({table})')} & set(table_names))
+        for table in table_names
+    }
+
+def dependency_levels(dependencies):
+    """
+    Group tables into levels: every table only depends on tables in earlier levels,
+    so the tables within one level can be loaded independently of each other.
+    """
+    levels = []
+    done = set()
+    remaining = dict(dependencies)
+    while remaining:
+        ready = sorted(t for t, deps in remaining.items() if set(deps) <= done)
+        if not ready:
+            raise ValueError(f"Foreign key cycle between tables: {', '.join(sorted(remaining))}")
+        levels.append(ready)
+        done.update(ready)
+        for table in ready:
+            del remaining[table]
+    return levels
+
+def split_csv_file(csv_file, split_bytes=DEFAULT_SPLIT_BYTES):
+    """
+    Read the header of a CSV file and cut the rest into (start, end) byte ranges that begin
+    and end on line boundaries. Assumes quoted fields do not contain newlines.
+    """
+    with open(csv_file, 'rb') as f:
+        header_line = f.readline()
+        header = next(csv.reader([header_line.decode('utf-8')]), None)
+        start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        ranges = []
+        while start < size:
+            f.seek(min(start + split_bytes, size))
+            f.readline()  # move to the start of the next line
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+def parse_csv_range(csv_file, header, columns, converters, start, end):
+    """Parse one byte range of a CSV file into typed tuples (runs in a worker process)."""
+    with open(csv_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).decode('utf-8')
+    records = select_columns(csv.reader(io.StringIO(data, newline='')), header, columns)
+    return list(convert_rows(records, converters))
+
+def convert_rows(records, converters):
+    """Yield records as lists with each value passed through its converter (None: unchanged)."""
+    for record in records:
+        row = []
+        for value, convert in zip(record, converters):
+            if convert is not None and value != '':
+                try:
+                    value = convert(value)
+                except ValueError:
+                    pass  # leave it to SQLite's type affinity, as the other loaders do
+            row.append(value)
+        yield row
+
+def column_converters(conn, table_name, columns, compact_only=False):
+    """
+    Return the TYPE_CONVERTERS entry (or None) for each column of a table. With
+    compact_only, only the compact schema's conversions, which SQLite's affinity
+    cannot do by itself; the result is None when the table has no compact columns.
+    """
+    declared = {row[1]: row[2].upper() for row in conn.execute(f'PRAGMA table_info({table_name})')}
+    if not compact_only:
+        return [TYPE_CONVERTERS.get(declared[col]) for col in columns]
+    converters = [TYPE_CONVERTERS.get(declared[col]) if declared[col] in (DAY_TYPE, CENTS_TYPE) else None
+                  for col in columns]
+    return converters if any(converters) else None
+
+def compact_rows(conn, table_name, columns, rows):
+    """rows with the compact schema's conversions applied, if the table has compact columns."""
+    converters = column_converters(conn, table_name, columns, compact_only=True)
+    return convert_rows(rows, converters) if converters else rows
+
+def parallel_load_tables(conn, tables, workers=None, queue_size=None, split_bytes=DEFAULT_SPLIT_BYTES):
+    """
+    Load tables with CSV parsing and type conversion spread over a process pool while
+    this process is the only writer. Byte ranges are submitted level by level in foreign
+    key dependency order; at most queue_size parsed ranges are in flight at once, and the
+    writer consumes them in submission order, committing after each dependency level.
+    Returns {table_name: rows_loaded}.
+    """
+    specs = {}
+    for csv_file, table_name, columns in tables:
+        if not os.path.exists(csv_file):
+            print(f"Warning: {csv_file} not found. Skipping...")
+            continue
+        specs[table_name] = (csv_file, columns)
+    levels = dependency_levels(table_dependencies(conn, list(specs)))
+    workers = workers or os.cpu_count() or 1
+    queue_size = queue_size or 2 * workers
+    
+    tasks = []
+    for level_index, level in enumerate(levels):
+        for table_name in level:
+            csv_file, columns = specs[table_name]
+            header, ranges = split_csv_file(csv_file, split_bytes)
+            if header is None:
+                continue
+            converters = column_converters(conn, table_name, columns)
+            for start, end in ranges:
+                tasks.append((level_index, table_name, (csv_file, header, columns, converters, start, end)))
+    
+    insert_sql = {
+        table_name: f"INSERT INTO {table_name} ({','.join(columns)}) VALUES ({','.join('?' * len(columns))})"
+        for table_name, (_, columns) in specs.items()
+    }
+    rows_loaded = {table_name: 0 for table_name in specs}
+    started = {}
+    finished = {}
+    
+    cursor = conn.cursor()
+    in_flight = deque()
+    next_task = 0
+    current_level = None
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            while next_task < len(tasks) or in_flight:
+                # Keep the bounded queue topped up
+                while next_task < len(tasks) and len(in_flight) < queue_size:
+                    level_index, table_name, args = tasks[next_task]
+                    in_flight.append((level_index, table_name, pool.submit(parse_csv_range, *args)))
+                    next_task += 1
+                
+                level_index, table_name, future = in_flight.popleft()
+                rows = future.result()
+                if level_index != current_level:
+                    if current_level is not None:
+                        conn.commit()
+                    cursor.execute('BEGIN')
+                    cursor.execute('PRAGMA defer_foreign_keys = ON')
+                    current_level = level_index
+                started.setdefault(table_name, time.perf_counter())
+                cursor.executemany(insert_sql[table_name], rows)
+                rows_loaded[table_name] += len(rows)
+                finished[table_name] = time.perf_counter()
+            if current_level is not None:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            for _, _, future in in_flight:
+                future.cancel()
+            raise
+    
+    for table_name in specs:
+        elapsed = finished.get(table_name, 0) - started.get(table_name, 0)
+        report_load(table_name, specs[table_name][0], rows_loaded[table_name], elapsed)
+    return rows_loaded
+
+def build_review_stats(conn):
+    """
+    Create product_review_stats (review count, rating sum and average per product) and the
+    triggers that keep it in step with reviews. When the table is first created it is filled
+    with one GROUP BY over reviews; from then on, e.g. for incremental loads, the triggers
+    maintain it row by row.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_review_stats'")
+    if cursor.fetchone():
+        return
+    
+    start_time = time.perf_counter()
+    cursor.execute('''
+        CREATE TABLE product_review_stats (
+            product_id INTEGER PRIMARY KEY,
+            review_count INTEGER NOT NULL,
+            rating_sum INTEGER NOT NULL,
+            avg_rating REAL NOT NULL,
+            FOREIGN KEY (product_id) REFERENCES products(product_id)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO product_review_stats (product_id, review_count, rating_sum, avg_rating)
+        SELECT product_id, COUNT(*), SUM(rating), AVG(rating)
+        FROM reviews
+        GROUP BY product_id
+    ''')
+    
+    # In an upsert's SET clause the column names still refer to the values before the update
+    add_review = '''
+        INSERT INTO product_review_stats (product_id, review_count, rating_sum, avg_rating)
+        VALUES (NEW.product_id, 1, NEW.rating, NEW.rating)
+        ON CONFLICT(product_id) DO UPDATE SET
+            review_count = review_count + 1,
+            rating_sum = rating_sum + NEW.rating,
+            avg_rating = (rating_sum + NEW.rating) * 1.0 / (review_count + 1);
+    '''
+    remove_review = '''
+        UPDATE product_review_stats SET
+            review_count = review_count - 1,
+            rating_sum = rating_sum - OLD.rating,
+            avg_rating = CASE WHEN review_count > 1
+                              THEN (rating_sum - OLD.rating) * 1.0 / (review_count - 1) ELSE 0 END
+        WHERE product_id = OLD.product_id;
+        DELETE FROM product_review_stats WHERE product_id = OLD.product_id AND review_count = 0;
+    '''
+    cursor.execute(f'CREATE TRIGGER reviews_stats_insert AFTER INSERT ON reviews BEGIN {add_review} END')
+    cursor.execute(f'CREATE TRIGGER reviews_stats_delete AFTER DELETE ON reviews BEGIN {remove_review} END')
+    cursor.execute(f'''
+        CREATE TRIGGER reviews_stats_update AFTER UPDATE OF product_id, rating ON reviews
+        BEGIN {remove_review} {add_review} END
+    ''')
+    conn.commit()
+    print(f"Built product_review_stats in {time.perf_counter() - start_time:.2f}s")
+
+def build_review_search(conn):
+    """
+    Create reviews_fts, an FTS5 index over reviews.review_text that stores no copy of the
+    text (external content: the text is read back from reviews), and the triggers that keep
+    it in step with reviews. The index is built from the loaded reviews when it is first
+    created; after that the triggers update it row by row, e.g. for incremental loads.
+    Skipped when this SQLite build has no FTS5.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reviews_fts'")
+    if cursor.fetchone():
+        return
+    
+    start_time = time.perf_counter()
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE reviews_fts USING fts5(review_text, content='reviews', "
+                       "content_rowid='review_id')")
+    except sqlite3.OperationalError as e:
+        print(f"Skipped the review search index: {e}")
+        return
+    cursor.execute("INSERT INTO reviews_fts (reviews_fts) VALUES ('rebuild')")
+    
+    # An external content index is told the old text of a row to remove it
+    add_review = 'INSERT INTO reviews_fts (rowid, review_text) VALUES (NEW.review_id, NEW.review_text);'
+    remove_review = '''
+        INSERT INTO reviews_fts (reviews_fts, rowid, review_text) VALUES ('delete', OLD.review_id, OLD.review_text);
+    '''
+    cursor.execute(f'CREATE TRIGGER reviews_fts_insert AFTER INSERT ON reviews BEGIN {add_review} END')
+    cursor.execute(f'CREATE TRIGGER reviews_fts_delete AFTER DELETE ON reviews BEGIN {remove_review} END')
+    cursor.execute(f'''
+        CREATE TRIGGER reviews_fts_update AFTER UPDATE OF review_id, review_text ON reviews
+        WHEN OLD.review_id IS NOT NEW.review_id OR OLD.review_text IS NOT NEW.review_text
+        BEGIN {remove_review} {add_review} END
+    ''')
+    conn.commit()
+    print(f"Built reviews_fts in {time.perf_counter() - start_time:.2f}s")
+
+def daily_sales_changes(orders_table, order_items_table, row, sign=''):
+    """
+    SQL adding the lines of row to every rollup (subtracting them with sign='-', which also
+    drops rollup rows left with no lines). row is NEW or OLD in a trigger on order_items,
+    or 'ORDER NEW' / 'ORDER OLD' for all lines of an order in a trigger on orders.
+    """
+    statements = []
+    for table, (key, _, key_sql) in DAILY_SALES_ROLLUPS.items():
+        if row.startswith('ORDER '):
+            order = row.split()[1]
+            lines = f'''
+                SELECT {order}.order_date, {key_sql.format(order=order)},
+                       {sign}COUNT(*), {sign}SUM(oi.quantity), {sign}SUM(oi.price)
+                FROM {order_items_table} oi, products p
+                WHERE oi.order_id = {order}.order_id AND p.product_id = oi.product_id
+                GROUP BY 1, 2'''
+            sale_date = f'{order}.order_date'
+        else:
+            lines = f'''
+                SELECT o.order_date, {key_sql.format(order='o')}, {sign}1, {sign}{row}.quantity, {sign}{row}.price
+                FROM {orders_table} o, products p
+                WHERE o.order_id = {row}.order_id AND p.product_id = {row}.product_id'''
+            sale_date = f'(SELECT order_date FROM {orders_table} WHERE order_id = {row}.order_id)'
+        statements.append(f'''
+            INSERT INTO {table} (sale_date, {key}, line_count, units, revenue) {lines}
+            ON CONFLICT(sale_date, {key}) DO UPDATE SET
+                line_count = line_count + excluded.line_count,
+                units = units + excluded.units,
+                revenue = revenue + excluded.revenue;''')
+        if sign:
+            statements.append(f'''
+            DELETE FROM {table} WHERE sale_date = {sale_date} AND line_count = 0;''')
+    return ''.join(statements)
+
+def category_changes(orders_table, order_items_table, category, sign=''):
+    """
+    SQL adding the lines of the updated product in a pair of orders and order_items tables
+    to daily_sales_by_category under category (OLD.category or NEW.category), or
+    subtracting them with sign='-', which also drops rows left with no lines.
+    """
+    statements = [f'''
+            INSERT INTO daily_sales_by_category (sale_date, category, line_count, units, revenue)
+            SELECT o.order_date, {category}, {sign}COUNT(*), {sign}SUM(oi.quantity), {sign}SUM(oi.price)
+            FROM {order_items_table} oi, {orders_table} o
+            WHERE oi.product_id = NEW.product_id AND o.order_id = oi.order_id
+            GROUP BY 1
+            ON CONFLICT(sale_date, category) DO UPDATE SET
+                line_count = line_count + excluded.line_count,
+                units = units + excluded.units,
+                revenue = revenue + excluded.revenue;''']
+    if sign:
+        statements.append(f'''
+            DELETE FROM daily_sales_by_category WHERE category = {category} AND line_count = 0;''')
+    return ''.join(statements)
+
+def drop_category_trigger(cursor, order_items_table='order_items'):
+    """
+    Drop the trigger on products that create_daily_sales_triggers made for order_items_table.
+    Unlike the others it is not dropped with the table, so whoever drops the table calls this.
+    """
+    cursor.execute(f'DROP TRIGGER IF EXISTS {order_items_table}_daily_sales_category')
+
+def create_daily_sales_triggers(cursor, orders_table='orders', order_items_table='order_items'):
+    """
+    Create the triggers that keep the DAILY_SALES_ROLLUPS in step with a pair of orders and
+    order_items tables: inserted, deleted and changed order lines, orders moved to another
+    date or customer, and products moved to another category. The last one is on products
+    and finds the product's lines without an index, so a category change reads order_items.
+    """
+    def changes(row, sign=''):
+        return daily_sales_changes(orders_table, order_items_table, row, sign)
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {order_items_table}_daily_sales_insert AFTER INSERT ON {order_items_table}
+        BEGIN {changes('NEW')} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {order_items_table}_daily_sales_delete AFTER DELETE ON {order_items_table}
+        BEGIN {changes('OLD', '-')} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {order_items_table}_daily_sales_update
+        AFTER UPDATE OF order_id, product_id, quantity, price ON {order_items_table}
+        WHEN OLD.order_id IS NOT NEW.order_id OR OLD.product_id IS NOT NEW.product_id
+            OR OLD.quantity IS NOT NEW.quantity OR OLD.price IS NOT NEW.price
+        BEGIN {changes('OLD', '-')} {changes('NEW')} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {orders_table}_daily_sales_update
+        AFTER UPDATE OF order_date, customer_id ON {orders_table}
+        WHEN OLD.order_date IS NOT NEW.order_date OR OLD.customer_id IS NOT NEW.customer_id
+        BEGIN {changes('ORDER OLD', '-')} {changes('ORDER NEW')} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {order_items_table}_daily_sales_category
+        AFTER UPDATE OF category ON products
+        WHEN OLD.category IS NOT NEW.category
+        BEGIN
+            {category_changes(orders_table, order_items_table, 'OLD.category', '-')}
+            {category_changes(orders_table, order_items_table, 'NEW.category')}
+        END
+    ''')
+
+def build_daily_sales(conn):
+    """
+    Create the DAILY_SALES_ROLLUPS (order lines, units and revenue per order date and
+    category or customer) and the triggers that maintain them. As with
+    product_review_stats, a rollup is filled with one GROUP BY when it is first created;
+    after that the triggers keep it current and it is never rebuilt. Dates and revenue
+    are stored like orders.order_date and order_items.price, so compact in the compact schema.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_sales_by_category'")
+    if cursor.fetchone():
+        # Adds triggers missing from databases built before them (partition_orders.py
+        # keeps those of a partitioned database)
+        if not is_view(conn, 'orders'):
+            create_daily_sales_triggers(cursor)
+            conn.commit()
+        return
+    
+    start_time = time.perf_counter()
+    declared = {row[1]: row[2] for row in conn.execute('PRAGMA table_info(orders)')}
+    date_type = declared['order_date']
+    declared = {row[1]: row[2] for row in conn.execute('PRAGMA table_info(order_items)')}
+    money_type = declared['price']
+    for table, (key, key_type, key_sql) in DAILY_SALES_ROLLUPS.items():
+        cursor.execute(f'''
+            CREATE TABLE {table} (
+                sale_date {date_type} NOT NULL,
+                {key} {key_type} NOT NULL,
+                line_count INTEGER NOT NULL,
+                units INTEGER NOT NULL,
+                revenue {money_type} NOT NULL,
+                PRIMARY KEY (sale_date, {key})
+            )
+        ''')
+        cursor.execute(f'CREATE INDEX idx_{table}_{key} ON {table} ({key}, sale_date)')
+        cursor.execute(f'''
+            INSERT INTO {table} (sale_date, {key}, line_count, units, revenue)
+            SELECT o.order_date, {key_sql.format(order='o')}, COUNT(*), SUM(oi.quantity), SUM(oi.price)
+            FROM order_items oi
+            JOIN orders o ON o.order_id = oi.order_id
+            JOIN products p ON p.product_id = oi.product_id
+            GROUP BY 1, 2
+        ''')
+    create_daily_sales_triggers(cursor)
+    conn.commit()
+    print(f"Built {' and '.join(DAILY_SALES_ROLLUPS)} in {time.perf_counter() - start_time:.2f}s")
+
+def build_report_indexes(conn, analyze=True):
+    """Create any missing REPORT_INDEXES, then refresh the planner statistics with ANALYZE."""
+    cursor = conn.cursor()
+    for name, table_name, columns in REPORT_INDEXES:
+        start_time = time.perf_counter()
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table_name} ({", ".join(columns)})')
+        print(f"Index {name} on {table_name}({', '.join(columns)}) ready "
+              f"in {time.perf_counter() - start_time:.2f}s")
+    if analyze:
+        start_time = time.perf_counter()
+        cursor.execute('ANALYZE')
+        print(f"ANALYZE finished in {time.perf_counter() - start_time:.2f}s")
+    conn.commit()
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='Create ecommerce.db and load the CSV files into it.')
+    parser.add_argument('--db', default='ecommerce.db', help='SQLite database file (default: ecommerce.db)')
+    parser.add_argument('--mode', choices=['row', 'bulk', 'staged', 'incremental', 'parallel', 'resumable'],
+                        default='row',
+                        help='row: one INSERT per row, bad rows are logged and skipped; '
+                             'bulk: chunked executemany per table in one transaction; '
+                             'staged: load into staging tables, quarantine bad rows in bulk; '
+                             'incremental: keep the database and upsert only new or changed rows; '
+                             'parallel: parse CSV files in a process pool feeding a single writer; '
+                             'resumable: commit every chunk with a checkpoint, a rerun continues an '
+                             'interrupted load. Except in incremental and parallel mode, the CSV files '
+                             'may be gzip, bz2 or xz compressed (customers.csv.gz, ...)')
+    parser.add_argument('--compact', action='store_true',
+                        help='store dates as day numbers and amounts as cents (read back via <table>_view)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'rows per executemany call in bulk/staged mode, and per commit in '
+                             f'resumable mode (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='parse processes in parallel mode (default: number of CPUs)')
+    parser.add_argument('--queue-size', type=int, default=None,
+                        help='parsed chunks allowed in flight in parallel mode (default: 2 x workers)')
+    parser.add_argument('--metrics', default=None,
+                        help='write timings of the stages (CSV parsing, table loads, index builds) and '
+                             'SQLite statements to this file (off by default)')
+    parser.add_argument('--metrics-format', choices=METRICS_FORMATS, default='json',
+                        help='--metrics file format (default: json)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.metrics:
+        instruments.enable('ingest_to_database')
+    
     # Database file name
-    db_file = 'ecommerce.db'
+    db_file = args.db
     
-    # Remove existing database if it exists
-    if os.path.exists(db_file):
+    # Remove existing database if it exists (incremental mode updates it in place,
+    # resumable mode continues the load it holds)
+    if args.mode not in ('incremental', 'resumable') and os.path.exists(db_file):
         os.remove(db_file)
         print(f"Removed existing {db_file}")
     
     # Create connection
     conn = sqlite3.connect(db_file)
+    instruments.watch(conn)
     
     # Enable foreign key constraints
     conn.execute('PRAGMA foreign_keys = ON')
     
     try:
+        # Upserts need a primary key, which the views of a partitioned database lack
+        if args.mode == 'incremental' and is_view(conn, 'orders'):
+            raise ValueError("incremental load is not supported on a partitioned database; "
+                             "load into the partition tables")
+        
         # Create schema
-        create_database_schema(conn)
+        with instruments.stage('create schema'):
+            create_database_schema(conn, args.compact)
         
-        # Load data from CSV files in correct order (respecting foreign key dependencies)
+        # Load data from CSV files in correct order (respecting foreign key dependencies):
+        # customers and products have no dependencies, orders depends on customers,
+        # order_items on orders and products, reviews on products and customers
         print("\nLoading data from CSV files...")
         
-        # 1. Load customers first (no dependencies)
-        load_csv_to_table(conn, 'customers.csv', 'customers', 
-                         ['customer_id', 'name', 'email', 'signup_date'])
-        
-        # 2. Load products (no dependencies)
-        load_csv_to_table(conn, 'products.csv', 'products', 
-                         ['product_id', 'name', 'category', 'price'])
-        
-        # 3. Load orders (depends on customers)
-        load_csv_to_table(conn, 'orders.csv', 'orders', 
-                         ['order_id', 'customer_id', 'order_date', 'total_amount'])
+        if args.mode == 'bulk':
+            with bulk_load_pragmas(conn):
+                for csv_file, table_name, columns in TABLE_LOAD_ORDER:
+                    bulk_load_csv_to_table(conn, csv_file, table_name, columns, args.chunk_size)
+        elif args.mode == 'staged':
+            create_quarantine_table(conn)
+            with bulk_load_pragmas(conn):
+                for csv_file, table_name, columns in TABLE_LOAD_ORDER:
+                    staged_load_csv_to_table(conn, csv_file, table_name, columns, args.chunk_size)
+        elif args.mode == 'incremental':
+            create_manifest_table(conn)
+            rows_read = {}
+            for csv_file, table_name, columns in TABLE_LOAD_ORDER:
+                rows_read[table_name] = incremental_load_csv_to_table(conn, csv_file, table_name, columns,
+                                                                      args.chunk_size)
+        elif args.mode == 'resumable':
+            create_checkpoint_table(conn)
+            rows_read = {}
+            with bulk_load_pragmas(conn, RESUMABLE_LOAD_PRAGMAS):
+                for csv_file, table_name, columns in TABLE_LOAD_ORDER:
+                    rows_read[table_name] = resumable_load_csv_to_table(conn, csv_file, table_name, columns,
+                                                                        args.chunk_size)
+        elif args.mode == 'parallel':
+            with bulk_load_pragmas(conn):
+                parallel_load_tables(conn, TABLE_LOAD_ORDER, args.workers, args.queue_size)
+        else:
+            for csv_file, table_name, columns in TABLE_LOAD_ORDER:
+                load_csv_to_table(conn, csv_file, table_name, columns)
         
-        # 4. Load order_items (depends on orders and products)
-        load_csv_to_table(conn, 'order_items.csv', 'order_items', 
-                         ['order_item_id', 'order_id', 'product_id', 'quantity', 'price'])
-        
-        # 5. Load reviews (depends on products and customers)
-        load_csv_to_table(conn, 'reviews.csv', 'reviews', 
-                         ['review_id', 'product_id', 'customer_id', 'rating', 'review_text', 'review_date'])
+        # Derived tables and secondary indexes go in after the data;
+        # an unchanged incremental or finished resumable run has nothing to re-analyze
+        print("\nBuilding report indexes...")
+        with instruments.stage('build review stats'):
+            build_review_stats(conn)
+        with instruments.stage('build daily sales'):
+            build_daily_sales(conn)
+        with instruments.stage('build review search'):
+            build_review_search(conn)
+        rerun = args.mode in ('incremental', 'resumable')
+        with instruments.stage('build report indexes'):
+            build_report_indexes(conn, analyze=not rerun or any(rows_read.values()))
         
         # Verify data loaded
         cursor = conn.cursor()
         print("\n" + "="*50)
         print("Data Summary:")
         print("="*50)
-        for table in ['customers', 'products', 'orders', 'order_items', 'reviews']:
+        for _, table, _ in TABLE_LOAD_ORDER:
+            if args.mode == 'incremental':
+                # Counting every row would turn a no-op run into a full scan
+                print(f"{table}: {rows_read[table]} rows read this run")
+                continue
             cursor.execute(f'SELECT COUNT(*) FROM {table}')
             count = cursor.fetchone()[0]
             print(f"{table}: {count} rows")
         
+        if args.mode == 'staged':
+            print_reject_summary(conn)
+        
         print("\n" + "="*50)
         print(f"Database '{db_file}' created and populated successfully!")
         print("="*50)
@@ -163,7 +1341,10 @@ def main():
         print(f"Error: {e}")
         conn.rollback()
     finally:
+        instruments.done(conn)
         conn.close()
+        if args.metrics:
+            instruments.write(args.metrics, args.metrics_format)
 
 if __name__ == '__main__':
     main()
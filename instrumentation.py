@@ -0,0 +1,263 @@
+import os
+import re
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# SQLite virtual machine instructions between two calls of the progress handler
+DEFAULT_PROGRESS_OPS = 1000
+
+METRICS_FORMATS = ['json', 'prometheus']
+
+# The trace callback gets statements with their parameters filled in; literals are
+# replaced by ? so that every run of a statement is counted under the same text
+SQL_LITERAL = re.compile(r"'[^']*(?:''[^']*)*'|[xX]'[0-9a-fA-F]*'|(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b")
+
+def normalize_sql(sql):
+    """sql on one line with its literal values replaced by ?."""
+    # Once the string literals are gone, splitting on whitespace cannot break one apart
+    return ' '.join(SQL_LITERAL.sub('?', sql).split())
+
+class Instrumentation:
+    """
+    Opt-in timers for one run of a script: wall time and rows per stage, and per SQLite
+    statement its runs, time and virtual machine steps, taken from the trace callback and
+    progress handler of every watched connection, plus the EXPLAIN QUERY PLAN of each
+    query captured. Until enable() is called every method returns at once (stage() gives
+    a null context, counted() its iterable unchanged), so the calls can stay in place at
+    no measurable cost.
+    
+    Stages nest: a stage's time includes that of the stages run inside it. A statement's
+    time runs from its start until its connection starts the next statement or is done
+    (see done()), or a stage starts or ends, so for a query it includes the caller's work
+    between fetches. Trigger
+    programs are traced as further runs of the statement that fired them.
+    """
+    
+    def __init__(self):
+        self.enabled = False
+        self.script = None
+        self.progress_ops = DEFAULT_PROGRESS_OPS
+        self.started_at = None
+        self.start_time = None
+        self.stages = {}
+        self.statements = {}
+        self.plans = {}
+        self.connections = {}
+        self.lock = threading.Lock()
+    
+    def enable(self, script, progress_ops=DEFAULT_PROGRESS_OPS):
+        """Start recording for script (the name reported with the metrics)."""
+        self.enabled = True
+        self.script = script
+        self.progress_ops = progress_ops
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.start_time = time.perf_counter()
+    
+    def record(self, name, seconds, rows=None):
+        """Add one call of a stage that took seconds and processed rows."""
+        if not self.enabled:
+            return
+        with self.lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': None})
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+            if rows is not None:
+                stage['rows'] = (stage['rows'] or 0) + rows
+    
+    def stage(self, name):
+        """
+        Context manager timing the code it wraps as one call of a stage. It gives a dict
+        whose 'rows' the code may set to the number of rows it processed.
+        """
+        if not self.enabled:
+            return nullcontext({})
+        return self.timed_stage(name)
+    
+    @contextmanager
+    def timed_stage(self, name):
+        """stage() when enabled."""
+        counts = {'rows': None}
+        start_time = time.perf_counter()
+        self.end_statements(start_time)
+        try:
+            yield counts
+        finally:
+            end_time = time.perf_counter()
+            self.end_statements(end_time)
+            self.record(name, end_time - start_time, counts['rows'])
+    
+    def counted(self, name, rows):
+        """rows, counted under stage name and timed only while the next row is being produced."""
+        if not self.enabled:
+            return rows
+        return self.counted_rows(name, rows)
+    
+    def counted_rows(self, name, rows):
+        """counted() when enabled; the stage is recorded once rows run out or the generator is closed."""
+        iterator = iter(rows)
+        seconds = 0.0
+        count = 0
+        try:
+            while True:
+                start_time = time.perf_counter()
+                try:
+                    row = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    seconds += time.perf_counter() - start_time
+                count += 1
+                yield row
+        finally:
+            self.record(name, seconds, count)
+    
+    def watch(self, conn):
+        """Install the trace callback and progress handler that time conn's statements."""
+        if not self.enabled:
+            return
+        # The statement conn is running: [normalized SQL, start time], shared by both callbacks
+        current = [None, None]
+        
+        def trace(sql):
+            now = time.perf_counter()
+            if sql.startswith('EXPLAIN QUERY PLAN'):
+                self.end_statement(current, now)
+                return
+            previous, previous_start = current
+            current[:] = [normalize_sql(sql), now]
+            with self.lock:
+                if previous is not None:
+                    self.statement_totals(previous)['seconds'] += now - previous_start
+                self.statement_totals(current[0])['runs'] += 1
+        
+        def progress():
+            if current[0] is not None:
+                self.add_statement(current[0], steps=self.progress_ops)
+            return 0
+        
+        conn.set_trace_callback(trace)
+        conn.set_progress_handler(progress, self.progress_ops)
+        with self.lock:
+            self.connections[id(conn)] = current
+    
+    def done(self, conn):
+        """End the time of the statement conn is running, as conn goes idle (e.g. back to its pool)."""
+        if not self.enabled:
+            return
+        with self.lock:
+            current = self.connections.get(id(conn))
+        if current is not None:
+            self.end_statement(current, time.perf_counter())
+    
+    def statement_totals(self, sql):
+        """The totals of a (normalized) statement; the caller holds the lock."""
+        statement = self.statements.get(sql)
+        if statement is None:
+            statement = self.statements[sql] = {'runs': 0, 'seconds': 0.0, 'vm_steps': 0}
+        return statement
+    
+    def add_statement(self, sql, runs=0, seconds=0.0, steps=0):
+        """Add to the totals of a (normalized) statement."""
+        with self.lock:
+            statement = self.statement_totals(sql)
+            statement['runs'] += runs
+            statement['seconds'] += seconds
+            statement['vm_steps'] += steps
+    
+    def end_statement(self, current, now):
+        """Add the time of a connection's current statement up to now, and clear it."""
+        if current[0] is not None:
+            self.add_statement(current[0], seconds=now - current[1])
+            current[:] = [None, None]
+    
+    def end_statements(self, now):
+        """End the time of the statements all watched connections are running."""
+        with self.lock:
+            connections = list(self.connections.values())
+        for current in connections:
+            self.end_statement(current, now)
+    
+    def capture_plan(self, cursor, sql, params=()):
+        """Keep the EXPLAIN QUERY PLAN of sql (once per statement), run on cursor's connection."""
+        if not self.enabled:
+            return
+        key = normalize_sql(sql)
+        if key in self.plans:
+            return
+        rows = cursor.connection.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        self.plans[key] = [detail for _, _, _, detail in rows]
+    
+    def metrics(self):
+        """Everything recorded so far, as a JSON-ready dict; statements by time spent, longest first."""
+        now = time.perf_counter()
+        self.end_statements(now)
+        statements = [{'sql': sql, **values} for sql, values in self.statements.items()]
+        statements.sort(key=lambda statement: statement['seconds'], reverse=True)
+        return {
+            'script': self.script,
+            'started_at': self.started_at,
+            'elapsed_seconds': now - self.start_time,
+            'stages': self.stages,
+            'statements': statements,
+            'query_plans': [{'sql': sql, 'plan': plan} for sql, plan in self.plans.items()],
+        }
+    
+    def write(self, path, metrics_format='json'):
+        """
+        Write the metrics to path as JSON or in the Prometheus text format (query plans are
+        JSON only). The file is replaced in one step, as a Prometheus textfile collector needs.
+        """
+        if not self.enabled:
+            return
+        metrics = self.metrics()
+        if metrics_format == 'prometheus':
+            text = prometheus_text(metrics)
+        else:
+            text = json.dumps(metrics, indent=2) + '\n'
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+        print(f"Metrics written to {path}")
+
+def prometheus_label(value):
+    """A Prometheus label value with its backslashes, quotes and newlines escaped."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_text(metrics):
+    """The stage and statement metrics in the Prometheus text exposition format."""
+    script = prometheus_label(metrics['script'])
+    families = [
+        ('ecommerce_run_seconds', 'gauge', 'Wall time of the run so far.',
+         [('', metrics['elapsed_seconds'])]),
+        ('ecommerce_stage_calls_total', 'counter', 'Times each stage ran.',
+         [(f',stage="{prometheus_label(name)}"', stage['calls']) for name, stage in metrics['stages'].items()]),
+        ('ecommerce_stage_seconds_total', 'counter', 'Wall time spent in each stage.',
+         [(f',stage="{prometheus_label(name)}"', stage['seconds']) for name, stage in metrics['stages'].items()]),
+        ('ecommerce_stage_rows_total', 'counter', 'Rows processed by each stage.',
+         [(f',stage="{prometheus_label(name)}"', stage['rows']) for name, stage in metrics['stages'].items()
+          if stage['rows'] is not None]),
+    ]
+    for metric, key, help_text in [
+        ('ecommerce_sqlite_statement_runs_total', 'runs', 'Times each SQLite statement started.'),
+        ('ecommerce_sqlite_statement_seconds_total', 'seconds',
+         'Time from the start of each SQLite statement until its connection started the next one.'),
+        ('ecommerce_sqlite_statement_vm_steps_total', 'vm_steps',
+         'SQLite virtual machine steps of each statement, counted by the progress handler.'),
+    ]:
+        families.append((metric, 'counter', help_text,
+                         [(f',statement="{prometheus_label(statement["sql"])}"', statement[key])
+                          for statement in metrics['statements']]))
+    
+    lines = []
+    for metric, metric_type, help_text, samples in families:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {metric_type}')
+        for labels, value in samples:
+            lines.append(f'{metric}{{script="{script}"{labels}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+# The instrumentation of this process, switched on by the scripts' --metrics option
+instruments = Instrumentation()
@@ -0,0 +1,77 @@
+import time
+import argparse
+import http.client
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from report_server import DEFAULT_HOST, DEFAULT_PORT
+
+DEFAULT_PATH = '/report?days=7&limit=1000'
+DEFAULT_CONCURRENCY = '1,2,4,8,16,32'
+DEFAULT_REQUESTS = 200
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def run_client(host, port, path, count):
+    """Send count requests over one keep-alive connection: [(status, seconds)]."""
+    results = []
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            # Dropped or truncated response: reconnect for the next request
+            status = 'error'
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=60)
+        results.append((status, time.perf_counter() - start))
+    conn.close()
+    return results
+
+def run_level(host, port, path, concurrency, requests):
+    """Run requests spread over concurrency clients; returns (results, elapsed seconds)."""
+    counts = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_client, host, port, path, count) for count in counts if count]
+        results = [result for future in futures for result in future.result()]
+    return results, time.perf_counter() - start
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='Load test the report server at increasing concurrency.')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'server address (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'server port (default: {DEFAULT_PORT})')
+    parser.add_argument('--path', default=DEFAULT_PATH, help=f'request path (default: {DEFAULT_PATH})')
+    parser.add_argument('--concurrency', default=DEFAULT_CONCURRENCY,
+                        help=f'comma-separated concurrent client counts (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS,
+                        help=f'requests per concurrency level (default: {DEFAULT_REQUESTS})')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    levels = [int(level) for level in args.concurrency.split(',')]
+    
+    print(f"Load testing http://{args.host}:{args.port}{args.path} ({args.requests} requests per level)")
+    print(f"{'Clients':>8} {'Req/sec':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}  Responses")
+    for concurrency in levels:
+        results, elapsed = run_level(args.host, args.port, args.path, concurrency, args.requests)
+        # Latency percentiles of successful requests only; rejected ones return immediately
+        latencies = sorted(seconds * 1000 for status, seconds in results if status == 200)
+        statuses = Counter(status for status, _ in results)
+        responses = ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str))
+        print(f"{concurrency:>8} {len(latencies) / elapsed:>10.1f} {percentile(latencies, 0.50):>10.1f} "
+              f"{percentile(latencies, 0.99):>10.1f}  {responses}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import argparse
+from datetime import date
+
+from ingest_to_database import (REPORT_INDEXES, DAY_TYPE, day_number, day_text, create_daily_sales_triggers,
+                                drop_category_trigger)
+
+# Months per partition for each --period
+PARTITION_MONTHS = {
+    'month': 1,
+    'quarter': 3,
+    'year': 12,
+}
+
+# Tables split into periods by order date; order items go with their order
+PARTITIONED_TABLES = ('orders', 'order_items')
+
+def period_start(day, months):
+    """First day of the period of the given length (in months) that contains day."""
+    return date(day.year, (day.month - 1) // months * months + 1, 1)
+
+def add_months(day, months):
+    """First day of the month months after day's month."""
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def partition_label(start, months):
+    """Name suffix of the partition starting at start: YYYY for yearly ones, else YYYY_MM."""
+    return f"{start.year}" if months == 12 else f"{start.year}_{start.month:02d}"
+
+def table_sql(conn, table_name):
+    """The CREATE TABLE statement of a table in the main database."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+    if row is None:
+        raise ValueError(f"no table named {table_name}")
+    return row[0]
+
+def renamed_table_sql(sql, table_name, orders_table):
+    """A CREATE TABLE statement for table_name whose order_id foreign key points at orders_table."""
+    sql = re.sub(r'^CREATE TABLE [\w.]+', f'CREATE TABLE {table_name}', sql)
+    return re.sub(r'REFERENCES orders\w*\(order_id\)', f'REFERENCES {orders_table}(order_id)', sql)
+
+def compact_dates(conn, orders_table):
+    """True if orders_table stores order_date as a day number (the compact schema)."""
+    declared = {row[1]: row[2].upper() for row in conn.execute(f'PRAGMA table_info({orders_table})')}
+    return declared.get('order_date') == DAY_TYPE
+
+def date_literal(day, compact):
+    """SQL literal of a date as order_date stores it."""
+    return str(day_number(day.isoformat())) if compact else f"'{day.isoformat()}'"
+
+def has_daily_sales(conn):
+    """True if the database keeps the daily sales rollups (see build_daily_sales in ingest_to_database.py)."""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                        "AND name = 'daily_sales_by_category'").fetchone() is not None
+
+def is_partitioned(conn):
+    """True if orders has been split into partitions (orders is then a view)."""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'orders'").fetchone()
+    return row is not None and row[0] == 'view'
+
+def create_partition_registry(conn):
+    """Create the table listing the partitions, oldest first by start_date."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS order_partitions (
+            label TEXT PRIMARY KEY,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            orders_table TEXT NOT NULL,
+            order_items_table TEXT NOT NULL,
+            archive_file TEXT
+        )
+    ''')
+
+def create_partition(cursor, start, months, orders_sql, items_sql):
+    """Create the (empty) orders and order_items tables of one period and register them."""
+    label = partition_label(start, months)
+    end = add_months(start, months)
+    orders_table = f'orders_{label}'
+    items_table = f'order_items_{label}'
+    cursor.execute(renamed_table_sql(orders_sql, orders_table, orders_table))
+    cursor.execute(renamed_table_sql(items_sql, items_table, orders_table))
+    cursor.execute('INSERT INTO order_partitions VALUES (?, ?, ?, ?, ?, NULL)',
+                   (label, start.isoformat(), end.isoformat(), orders_table, items_table))
+    return label, end, orders_table, items_table
+
+def create_partition_indexes(cursor, label, schema='main'):
+    """Create the REPORT_INDEXES of orders and order_items on one partition's tables."""
+    for name, table_name, columns in REPORT_INDEXES:
+        if table_name in PARTITIONED_TABLES:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {schema}.{name}_{label} '
+                           f'ON {table_name}_{label} ({", ".join(columns)})')
+
+def rebuild_views(cursor):
+    """
+    (Re)create the orders and order_items views as the UNION ALL of the partitions kept in
+    this database, with INSTEAD OF INSERT triggers that route new rows to their partition.
+    """
+    partitions = cursor.execute('''
+        SELECT start_date, end_date, orders_table, order_items_table
+        FROM order_partitions WHERE archive_file IS NULL ORDER BY start_date
+    ''').fetchall()
+    for view in PARTITIONED_TABLES:
+        cursor.execute(f'DROP VIEW IF EXISTS {view}')
+    
+    compact = compact_dates(cursor.connection, partitions[0][2])
+    for position, view in enumerate(PARTITIONED_TABLES):
+        tables = [partition[2 + position] for partition in partitions]
+        cursor.execute(f'CREATE VIEW {view} AS ' + ' UNION ALL '.join(f'SELECT * FROM {t}' for t in tables))
+    
+    order_columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({partitions[0][2]})')]
+    item_columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({partitions[0][3]})')]
+    order_routes = []
+    item_routes = []
+    ranges = []
+    for start_date, end_date, orders_table, items_table in partitions:
+        in_range = (f"NEW.order_date >= {date_literal(date.fromisoformat(start_date), compact)} "
+                    f"AND NEW.order_date < {date_literal(date.fromisoformat(end_date), compact)}")
+        ranges.append(f"({in_range})")
+        order_routes.append(f"INSERT INTO {orders_table} ({', '.join(order_columns)}) "
+                            f"SELECT {', '.join('NEW.' + col for col in order_columns)} WHERE {in_range};")
+        item_routes.append(f"INSERT INTO {items_table} ({', '.join(item_columns)}) "
+                           f"SELECT {', '.join('NEW.' + col for col in item_columns)} "
+                           f"WHERE EXISTS (SELECT 1 FROM {orders_table} WHERE order_id = NEW.order_id);")
+    cursor.execute(f'''
+        CREATE TRIGGER orders_route INSTEAD OF INSERT ON orders BEGIN
+            SELECT RAISE(ABORT, 'no partition holds this order_date') WHERE NOT ({' OR '.join(ranges)});
+            {' '.join(order_routes)}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER order_items_route INSTEAD OF INSERT ON order_items BEGIN
+            SELECT RAISE(ABORT, 'order_id is in no partition')
+            WHERE NOT EXISTS (SELECT 1 FROM orders WHERE order_id = NEW.order_id);
+            {' '.join(item_routes)}
+        END
+    ''')
+
+def stored_to_date(value):
+    """A stored order_date (text or day number) as a date."""
+    return date.fromisoformat(day_text(value) if isinstance(value, int) else value)
+
+def split_database(conn, months=PARTITION_MONTHS['month']):
+    """
+    Move orders and order_items into one pair of tables per period of months months,
+    replace them with UNION ALL views of the same names and register the partitions in
+    order_partitions. Runs in one transaction.
+    """
+    if is_partitioned(conn):
+        raise ValueError("orders is already partitioned")
+    orders_sql = table_sql(conn, 'orders')
+    items_sql = table_sql(conn, 'order_items')
+    compact = compact_dates(conn, 'orders')
+    rollups = has_daily_sales(conn)
+    
+    cursor = conn.cursor()
+    first, last = cursor.execute('SELECT MIN(order_date), MAX(order_date) FROM orders').fetchone()
+    first = stored_to_date(first) if first is not None else date.today()
+    last = stored_to_date(last) if last is not None else first
+    total_items = cursor.execute('SELECT COUNT(*) FROM order_items').fetchone()[0]
+    
+    start_time = time.perf_counter()
+    cursor.execute('BEGIN')
+    try:
+        create_partition_registry(conn)
+        moved_items = 0
+        start = period_start(first, months)
+        while start <= last:
+            label, end, orders_table, items_table = create_partition(cursor, start, months, orders_sql, items_sql)
+            cursor.execute(f'''
+                INSERT INTO {orders_table} SELECT * FROM orders
+                WHERE order_date >= {date_literal(start, compact)} AND order_date < {date_literal(end, compact)}
+                ORDER BY order_id
+            ''')
+            order_count = cursor.rowcount
+            cursor.execute(f'''
+                INSERT INTO {items_table} SELECT * FROM order_items
+                WHERE order_id IN (SELECT order_id FROM {orders_table})
+                ORDER BY order_item_id
+            ''')
+            item_count = cursor.rowcount
+            moved_items += item_count
+            create_partition_indexes(cursor, label)
+            if rollups:
+                # Only once the rows are in: they are already counted in the rollups
+                create_daily_sales_triggers(cursor, orders_table, items_table)
+            print(f"Partition {label}: {order_count} orders, {item_count} order items")
+            start = end
+        if moved_items != total_items:
+            raise ValueError(f"{total_items - moved_items} order items have no order; nothing was changed")
+        
+        cursor.execute('DROP TABLE order_items')
+        cursor.execute('DROP TABLE orders')
+        drop_category_trigger(cursor)
+        rebuild_views(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    # The copies were written before the old tables were dropped; give that space back once
+    conn.execute('ANALYZE')
+    conn.execute('VACUUM')
+    print(f"Partitioned orders and order_items in {time.perf_counter() - start_time:.2f}s")
+
+def newest_partition(cursor):
+    """(label, start_date, end_date, orders_table, order_items_table) of the newest partition."""
+    return cursor.execute('''
+        SELECT label, start_date, end_date, orders_table, order_items_table
+        FROM order_partitions ORDER BY start_date DESC LIMIT 1
+    ''').fetchone()
+
+def create_partitions_through(conn, through):
+    """Create empty partitions after the newest one until through (a date) is covered."""
+    cursor = conn.cursor()
+    label, start_date, end_date, orders_table, items_table = newest_partition(cursor)
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    months = (end.year - start.year) * 12 + end.month - start.month
+    orders_sql = table_sql(conn, orders_table)
+    items_sql = table_sql(conn, items_table)
+    
+    cursor.execute('BEGIN')
+    try:
+        created = []
+        while end <= through:
+            label, end, orders_table, items_table = create_partition(cursor, end, months, orders_sql, items_sql)
+            create_partition_indexes(cursor, label)
+            if has_daily_sales(conn):
+                create_daily_sales_triggers(cursor, orders_table, items_table)
+            created.append(label)
+        if created:
+            rebuild_views(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"Created partitions: {', '.join(created)}" if created else "Partitions already cover that date.")
+
+def archive_partitions(conn, before, archive_dir):
+    """
+    Move every partition that ends on or before the date before into its own database
+    file in archive_dir, then drop it here. Only the archived partitions are copied and
+    the others are not touched; their freed pages are reused by new partitions rather
+    than returned with a VACUUM. The newest partition always stays.
+    """
+    cursor = conn.cursor()
+    newest = newest_partition(cursor)[0]
+    partitions = cursor.execute('''
+        SELECT label, orders_table, order_items_table FROM order_partitions
+        WHERE archive_file IS NULL AND end_date <= ? AND label != ?
+        ORDER BY start_date
+    ''', (before.isoformat(), newest)).fetchall()
+    if not partitions:
+        print("No partitions to archive.")
+        return
+    os.makedirs(archive_dir, exist_ok=True)
+    
+    for label, orders_table, items_table in partitions:
+        start_time = time.perf_counter()
+        archive_file = os.path.abspath(os.path.join(archive_dir, f'orders_{label}.db'))
+        if os.path.exists(archive_file):
+            raise ValueError(f"{archive_file} already exists")
+        
+        # Copy into a standalone file (no foreign keys: their parent tables stay here)
+        cursor.execute('ATTACH DATABASE ? AS archive', (archive_file,))
+        try:
+            cursor.execute('BEGIN')
+            for table_name in (orders_table, items_table):
+                sql = re.sub(r',\s*FOREIGN KEY \([^)]*\) REFERENCES \w+\([^)]*\)', '', table_sql(conn, table_name))
+                cursor.execute(re.sub(r'^CREATE TABLE ', 'CREATE TABLE archive.', sql))
+                cursor.execute(f'INSERT INTO archive.{table_name} SELECT * FROM main.{table_name}')
+            create_partition_indexes(cursor, label, schema='archive')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute('DETACH DATABASE archive')
+        
+        cursor.execute('BEGIN')
+        try:
+            cursor.execute(f'DROP TABLE {items_table}')
+            cursor.execute(f'DROP TABLE {orders_table}')
+            drop_category_trigger(cursor, items_table)
+            cursor.execute('UPDATE order_partitions SET archive_file = ? WHERE label = ?', (archive_file, label))
+            rebuild_views(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Archived partition {label} to {archive_file} in {time.perf_counter() - start_time:.2f}s")
+
+def print_partitions(conn):
+    """Print every partition with its date range, row counts and location."""
+    cursor = conn.cursor()
+    print(f"{'Partition':<10} {'From':<10} {'Until':<10} {'Orders':>10} {'Items':>10}  Location")
+    for label, start_date, end_date, orders_table, items_table, archive_file in cursor.execute('''
+        SELECT label, start_date, end_date, orders_table, order_items_table, archive_file
+        FROM order_partitions ORDER BY start_date
+    ''').fetchall():
+        if archive_file:
+            print(f"{label:<10} {start_date:<10} {end_date:<10} {'':>10} {'':>10}  {archive_file}")
+            continue
+        orders = cursor.execute(f'SELECT COUNT(*) FROM {orders_table}').fetchone()[0]
+        items = cursor.execute(f'SELECT COUNT(*) FROM {items_table}').fetchone()[0]
+        print(f"{label:<10} {start_date:<10} {end_date:<10} {orders:>10} {items:>10}  main")
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='Partition orders and order_items by order date.')
+    parser.add_argument('--db', default='ecommerce.db', help='SQLite database file (default: ecommerce.db)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    split = commands.add_parser('split', help='split the loaded orders and order_items into partitions')
+    split.add_argument('--period', choices=PARTITION_MONTHS, default='month',
+                       help='length of a partition (default: month)')
+    create = commands.add_parser('create', help='create empty partitions for future orders')
+    create.add_argument('--through', type=date.fromisoformat, required=True,
+                        help='create partitions until this date (YYYY-MM-DD) is covered')
+    archive = commands.add_parser('archive', help='move old partitions into their own database files')
+    archive.add_argument('--before', type=date.fromisoformat, required=True,
+                         help='archive the partitions that end on or before this date (YYYY-MM-DD)')
+    archive.add_argument('--archive-dir', default='archive', help='directory for the archive files (default: archive)')
+    commands.add_parser('status', help='list the partitions')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == 'split':
+            split_database(conn, PARTITION_MONTHS[args.period])
+        elif not is_partitioned(conn):
+            raise ValueError(f"orders in {args.db} is not partitioned; run the split command first")
+        elif args.command == 'create':
+            create_partitions_through(conn, args.through)
+        elif args.command == 'archive':
+            archive_partitions(conn, args.before, args.archive_dir)
+        print_partitions(conn)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
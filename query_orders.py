@@ -1,177 +1,1306 @@
 import sqlite3
-from datetime import datetime, timedelta
+import sys
+import os
+import csv
+import json
+import base64
+import hashlib
+import argparse
+import queue
+import threading
+import time
+from pathlib import Path
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import chain, islice
+from datetime import date, datetime, timedelta
 
-def query_customer_orders_with_reviews():
+from ingest_to_database import DAY_TYPE, day_number, day_text
+from instrumentation import METRICS_FORMATS, instruments
+
+MAX_ORDER_DATE_QUERY = "SELECT MAX(order_date) FROM {orders}"
+
+# A database split by partition_orders.py keeps orders and order_items in one pair of
+# tables per period, listed in order_partitions. Reports read only the partitions that
+# overlap their window (and are not archived), newest first, instead of the UNION ALL
+# views that stand in for the old tables.
+PARTITIONED_QUERY = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'order_partitions'"
+PARTITIONS_QUERY = """
+SELECT orders_table, order_items_table FROM order_partitions
+WHERE archive_file IS NULL AND start_date <= ? AND end_date > ?
+ORDER BY start_date DESC
+"""
+ALL_DATES = ('0001-01-01', '9999-12-31')
+
+# Declared type of orders.order_date, which tells the compact schema from the standard one
+ORDER_DATE_TYPE_QUERY = "SELECT upper(type) FROM pragma_table_info('orders') WHERE name = 'order_date'"
+
+# How the report selects the order date and unit price from the standard schema and from
+# the compact one (day numbers and cents, see create_database_schema in ingest_to_database.py)
+STANDARD_COLUMN_SQL = {
+    'order_date': "o.order_date",
+    'unit_price': "ROUND(p.price, 2)",
+    'review_date': "r.review_date",
+}
+COMPACT_COLUMN_SQL = {
+    'order_date': "date(o.order_date * 86400, 'unixepoch')",
+    'unit_price': "ROUND(p.price / 100.0, 2)",
+    'review_date': "date(r.review_date * 86400, 'unixepoch')",
+}
+
+# Complex SQL query joining all 5 tables.
+# Review stats come from product_review_stats (one row per reviewed product, maintained at
+# ingest), so each order line joins one row instead of every review of its product, and
+# the ORDER BY can follow the orders(order_date, ...) index. The trailing order_id and
+# order_item_id only make the order of otherwise tied rows deterministic.
+# {order_date} and {unit_price} come from STANDARD_COLUMN_SQL or COMPACT_COLUMN_SQL, and
+# {orders}, {order_items}, {filters} and {limit} are filled in by report_query. On a
+# partitioned database it runs once per partition: partitions hold disjoint date ranges,
+# so reading them newest first keeps the ORDER BY across the whole report.
+REPORT_QUERY_TEMPLATE = """
+SELECT 
+    c.name AS customer_name,
+    {order_date} AS order_date,
+    p.name AS product_name,
+    oi.quantity,
+    {unit_price} AS unit_price,
+    ROUND(COALESCE(s.avg_rating, 0), 2) AS avg_rating,
+    COALESCE(s.review_count, 0) AS review_count
+FROM 
+    {orders} o
+INNER JOIN 
+    customers c ON o.customer_id = c.customer_id
+INNER JOIN 
+    {order_items} oi ON o.order_id = oi.order_id
+INNER JOIN 
+    products p ON oi.product_id = p.product_id
+LEFT JOIN 
+    product_review_stats s ON p.product_id = s.product_id
+WHERE 
+    o.order_date >= ? AND o.order_date <= ?{filters}
+ORDER BY 
+    o.order_date DESC, c.name, p.name, o.order_id, oi.order_item_id{limit}
+"""
+
+# Summary statistics, all computed in one pass over the window's orders and their items.
+# order_items is LEFT JOINed so an order without items still counts as an order.
+SUMMARY_LABELS = [
+    "Total orders in last {days} days",
+    "Total unique customers",
+    "Total unique products ordered",
+    "Products with reviews",
+]
+
+SUMMARY_QUERY_TEMPLATE = """
+SELECT
+    COUNT(DISTINCT o.order_id),
+    COUNT(DISTINCT o.customer_id),
+    COUNT(DISTINCT oi.product_id),
+    COUNT(DISTINCT s.product_id)
+FROM {orders} o
+LEFT JOIN {order_items} oi ON o.order_id = oi.order_id
+LEFT JOIN product_review_stats s ON oi.product_id = s.product_id
+WHERE o.order_date >= ? AND o.order_date <= ?{filters}
+"""
+
+# The same over several partitions: distinct values are counted over all of them at once,
+# since the same customer or product shows up in more than one
+PARTITIONED_SUMMARY_TEMPLATE = """
+SELECT
+    COUNT(DISTINCT order_id),
+    COUNT(DISTINCT customer_id),
+    COUNT(DISTINCT product_id),
+    COUNT(DISTINCT reviewed_product_id)
+FROM ({branches})
+"""
+
+SUMMARY_BRANCH_TEMPLATE = """
+    SELECT o.order_id, o.customer_id, oi.product_id, s.product_id AS reviewed_product_id
+    FROM {orders} o
+    LEFT JOIN {order_items} oi ON o.order_id = oi.order_id
+    LEFT JOIN product_review_stats s ON oi.product_id = s.product_id
+    WHERE o.order_date >= ? AND o.order_date <= ?{filters}"""
+
+# Optional report filters. The values are bound as one JSON array and expanded with
+# json_each, so the SQL text does not depend on how many values there are. The category
+# is looked up per order line by primary key: filtering on a list of product ids instead
+# makes SQLite probe order_items once per product in the category for every order.
+CUSTOMER_FILTER = """
+    AND o.customer_id IN (SELECT value FROM json_each(?))"""
+CATEGORY_FILTER = """
+    AND (SELECT category FROM products WHERE product_id = oi.product_id) IN (SELECT value FROM json_each(?))"""
+
+# Keyset pagination of the report. Pages follow the index order of
+# orders(order_date, customer_id) and order_items(order_id, product_id, quantity)
+# rather than the names the full report sorts by: names live in other tables, so
+# ordering by them always sorts the whole window in a temp B-tree. A page seeks past
+# the last key of the previous one (order_date, customer_id, order_id, product_id,
+# quantity, order_item_id), so a deep page costs the same as the first.
+PAGE_QUERY_TEMPLATE = """
+SELECT 
+    c.name AS customer_name,
+    {order_date} AS order_date,
+    p.name AS product_name,
+    oi.quantity,
+    {unit_price} AS unit_price,
+    ROUND(COALESCE(s.avg_rating, 0), 2) AS avg_rating,
+    COALESCE(s.review_count, 0) AS review_count,
+    o.customer_id,
+    o.order_id,
+    oi.product_id,
+    oi.order_item_id
+FROM 
+    {orders} o
+INNER JOIN 
+    customers c ON o.customer_id = c.customer_id
+INNER JOIN 
+    {order_items} oi ON o.order_id = oi.order_id
+INNER JOIN 
+    products p ON oi.product_id = p.product_id
+LEFT JOIN 
+    product_review_stats s ON p.product_id = s.product_id
+WHERE 
+    o.order_date >= ? AND o.order_date <= ?{after}{filters}
+ORDER BY 
+    o.order_date DESC, o.customer_id DESC, o.order_id DESC,
+    oi.product_id DESC, oi.quantity DESC, oi.order_item_id DESC
+LIMIT ?
+"""
+
+# The first condition is the index seek over orders, the second drops the lines of the
+# last order already returned on the previous page
+PAGE_AFTER = """
+    AND (o.order_date, o.customer_id, o.order_id) <= (?, ?, ?)
+    AND (o.order_date, o.customer_id, o.order_id, oi.product_id, oi.quantity, oi.order_item_id)
+        < (?, ?, ?, ?, ?, ?)"""
+
+# Top-N and trend questions, answered from the daily sales rollups (see build_daily_sales
+# in ingest_to_database.py) instead of joining order_items to orders and products. They
+# read the window's range of a rollup's (sale_date, key) primary key, or of its
+# (key, sale_date) index when a trend is filtered. SALES_ROLLUPS maps what the sales are
+# grouped by to the rollup table and its key column.
+SALES_ROLLUPS = {
+    'category': ('daily_sales_by_category', 'category'),
+    'customer': ('daily_sales_by_customer', 'customer_id'),
+}
+SALES_RANKINGS = ['revenue', 'units']
+
+TOP_SALES_QUERY_TEMPLATE = """
+SELECT {key}, SUM(line_count), SUM(units), SUM(revenue)
+FROM {table}
+WHERE sale_date >= ? AND sale_date <= ?
+GROUP BY {key}
+ORDER BY SUM({rank_by}) DESC, {key}
+LIMIT ?
+"""
+
+SALES_TREND_QUERY_TEMPLATE = """
+SELECT sale_date, SUM(line_count), SUM(units), SUM(revenue)
+FROM {table}
+WHERE sale_date >= ? AND sale_date <= ?{filters}
+GROUP BY sale_date
+ORDER BY sale_date
+"""
+SALES_TREND_FILTER = """
+    AND {key} IN (SELECT value FROM json_each(?))"""
+
+SALES_REPORTS = ['top-categories', 'top-customers', 'trend']
+SALES_HEADERS = ["Order Lines", "Units", "Revenue ($)"]
+DEFAULT_TOP = 10
+
+# Review search over reviews_fts, the FTS5 index of review texts (see build_review_search
+# in ingest_to_database.py), best bm25 match first (bm25 scores are negative, lower is
+# better; equal scores go by review id). The matches are ranked in the index and only the
+# top ones are joined to their review and product; {rating_join} is only needed to filter.
+REVIEW_SEARCH_QUERY_TEMPLATE = """
+SELECT
+    r.review_id,
+    p.name AS product_name,
+    p.category,
+    r.rating,
+    {review_date} AS review_date,
+    r.review_text,
+    ROUND(matches.score, 4) AS score
+FROM (
+    SELECT reviews_fts.rowid AS review_id, bm25(reviews_fts) AS score
+    FROM reviews_fts{rating_join}
+    WHERE reviews_fts MATCH ?{filters}
+    ORDER BY score, reviews_fts.rowid
+    LIMIT ?
+) matches
+INNER JOIN reviews r ON r.review_id = matches.review_id
+INNER JOIN products p ON p.product_id = r.product_id
+ORDER BY matches.score, r.review_id
+"""
+
+REVIEW_RATING_JOIN = """
+    INNER JOIN reviews r ON r.review_id = reviews_fts.rowid"""
+
+# The same search as LIKE '%term%' scans over every review text, which is all the reviews
+# table supports by itself. Unranked, by review id; kept to compare against.
+LIKE_REVIEW_SEARCH_QUERY_TEMPLATE = """
+SELECT r.review_id, p.name AS product_name, p.category, r.rating, {review_date} AS review_date, r.review_text
+FROM reviews r
+INNER JOIN products p ON p.product_id = r.product_id
+WHERE ({likes}){filters}
+ORDER BY r.review_id
+"""
+
+REVIEW_RATING_FILTER = """
+    AND r.rating <= ?"""
+
+REVIEW_SEARCH_COLUMNS = ['review_id', 'product_name', 'category', 'rating', 'review_date', 'review_text', 'score']
+DEFAULT_SEARCH_LIMIT = 20
+
+DEFAULT_PAGE_SIZE = 50
+
+REPORT_COLUMNS = ['customer_name', 'order_date', 'product_name', 'quantity',
+                  'unit_price', 'avg_rating', 'review_count']
+
+REPORT_HEADERS = [
+    "Customer Name",
+    "Order Date",
+    "Product Name",
+    "Quantity",
+    "Unit Price ($)",
+    "Avg Rating",
+    "Review Count"
+]
+
+# Minimum widths for each column of the fixed-width table
+REPORT_MIN_WIDTHS = [15, 12, 25, 10, 15, 12, 13]
+
+# Rows pulled from SQLite per fetchmany call
+DEFAULT_FETCH_SIZE = 1000
+
+# Leading rows used to size the fixed-width table's columns (0: minimum widths only)
+DEFAULT_SAMPLE_ROWS = 1000
+
+REPORT_FORMATS = ['table', 'csv', 'jsonl']
+
+# Results longer than this are streamed but not cached
+DEFAULT_CACHE_MAX_ROWS = 100000
+
+# Results kept in memory by a ResultCache, least recently used dropped first
+DEFAULT_CACHE_ENTRIES = 64
+
+# Connections kept open by a ConnectionPool
+DEFAULT_POOL_SIZE = 4
+
+# Prepared statements each pooled connection keeps for reuse
+DEFAULT_CACHED_STATEMENTS = 128
+
+# Query plan steps that --check-plans accepts although they mention a temp B-tree:
+# a partial sort only orders the rows that tie on the index-provided leading sort key,
+# and count(DISTINCT) only holds the distinct values counted, not the rows.
+BOUNDED_PLAN_STEPS = (
+    'USE TEMP B-TREE FOR LAST',
+    'USE TEMP B-TREE FOR RIGHT PART OF ORDER BY',
+    'USE TEMP B-TREE FOR count(DISTINCT)',
+)
+
+def parse_date(value):
+    """A date given as a datetime, date or 'YYYY-MM-DD' string, as a datetime."""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.strptime(value, '%Y-%m-%d')
+
+def report_window(max_order_date, days=90, reference_date=None):
+    """
+    (start, end) dates of a window of days ending at reference_date. Without a reference
+    date the window ends at max_order_date, or today when there are no orders.
+    """
+    if reference_date is not None:
+        end = parse_date(reference_date)
+    elif max_order_date:
+        # Since our data might be historical, we'll use the most recent order date as reference
+        end = parse_date(max_order_date)
+    else:
+        # Fallback to the window ending today
+        end = datetime.now()
+    return (end - timedelta(days=days)).strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+def report_filters(customer_ids=None, categories=None):
+    """Extra WHERE conditions and their parameters for the given filters (None: no filter)."""
+    filters = ""
+    params = []
+    if customer_ids is not None:
+        filters += CUSTOMER_FILTER
+        params.append(json.dumps([int(customer_id) for customer_id in customer_ids]))
+    if categories is not None:
+        filters += CATEGORY_FILTER
+        params.append(json.dumps(list(categories)))
+    return filters, params
+
+def report_query(customer_ids=None, categories=None, limit=None, compact=False,
+                 tables=('orders', 'order_items')):
+    """
+    SQL and parameters (after the window start and end) of the report over one
+    (orders, order_items) pair of tables. Every combination of filters is one fixed
+    statement, which each connection prepares once and reuses.
+    """
+    filters, params = report_filters(customer_ids, categories)
+    if limit is not None:
+        params.append(int(limit))
+    columns = COMPACT_COLUMN_SQL if compact else STANDARD_COLUMN_SQL
+    sql = REPORT_QUERY_TEMPLATE.format(orders=tables[0], order_items=tables[1], filters=filters,
+                                       limit="\nLIMIT ?" if limit is not None else "", **columns)
+    return sql, params
+
+def summary_query(customer_ids=None, categories=None, tables=(('orders', 'order_items'),)):
+    """
+    SQL and parameters (after the window start and end) of the summary statistics over
+    the given (orders, order_items) pairs of tables. With several pairs the window and
+    parameters are bound once per pair.
+    """
+    filters, params = report_filters(customer_ids, categories)
+    if len(tables) == 1:
+        [(orders, order_items)] = tables
+        return SUMMARY_QUERY_TEMPLATE.format(orders=orders, order_items=order_items, filters=filters), params
+    branches = "\n    UNION ALL".join(SUMMARY_BRANCH_TEMPLATE.format(orders=orders, order_items=order_items,
+                                                                   filters=filters)
+                                      for orders, order_items in tables)
+    return PARTITIONED_SUMMARY_TEMPLATE.format(branches=branches), params
+
+def stored_dates(dates, compact):
+    """'YYYY-MM-DD' dates as orders.order_date stores them, for comparisons in SQL."""
+    return [day_number(value) for value in dates] if compact else list(dates)
+
+def iter_report_rows(cursor, fetch_size=DEFAULT_FETCH_SIZE):
+    """Yield the rows of an executed query, fetch_size rows at a time."""
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield from rows
+
+def database_version(db_file):
+    """
+    Version of a database file for keying cached results: the file change counter in the
+    SQLite header, which every commit in rollback journal mode bumps, plus the size and
+    mtime of the -wal file, since WAL commits only reach the header at a checkpoint.
+    PRAGMA data_version is no use here as its value only means something within one
+    connection. Returns None when there is no database file to version (never cached).
+    """
+    try:
+        with open(db_file, 'rb') as f:
+            header = f.read(100)
+    except OSError:
+        return None
+    if len(header) < 100:
+        return None
+    try:
+        wal = os.stat(db_file + '-wal')
+        wal_state = (wal.st_size, wal.st_mtime_ns)
+    except FileNotFoundError:
+        wal_state = None
+    return int.from_bytes(header[24:28], 'big'), wal_state
+
+class ResultCache:
+    """
+    Query results keyed on (database file, database_version, query, parameters). Results
+    are kept in memory and, given cache_dir, also written there as JSON so later runs can
+    reuse them; a cache hit does not run anything against SQLite. The file names start
+    with hashes of the database file and its version, and the first result written for a
+    new version deletes that database's files of older versions. The directory can be
+    deleted at any time.
+    """
+    
+    def __init__(self, cache_dir=None, max_rows=DEFAULT_CACHE_MAX_ROWS, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_rows = max_rows
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        # (database hash, version hash) pairs whose older files were already deleted
+        self.pruned = set()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+    
+    def key(self, db_file, sql, params):
+        """
+        Cache key of a query, or None if the database cannot be versioned:
+        '<database hash>-<version hash>-<query hash>'.
+        """
+        version = database_version(db_file)
+        if version is None:
+            return None
+        parts = [os.path.abspath(db_file), version, (sql, tuple(params))]
+        return '-'.join(hashlib.sha256(repr(part).encode('utf-8')).hexdigest()[:32] for part in parts)
+    
+    def get(self, key):
+        """Cached (columns, rows) for key, or None."""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+        if not self.cache_dir:
+            return None
+        try:
+            with open(os.path.join(self.cache_dir, key + '.json'), encoding='utf-8') as f:
+                columns, rows = json.load(f)
+        except FileNotFoundError:
+            return None
+        result = (columns, [tuple(row) for row in rows])
+        self.remember(key, result)
+        return result
+    
+    def remember(self, key, result):
+        """Keep a result in memory, dropping the least recently used beyond max_entries."""
+        with self.lock:
+            self.memory[key] = result
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+    
+    def put(self, key, result):
+        """Store (columns, rows) for key in memory and, with a cache_dir, on disk."""
+        self.remember(key, result)
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, key + '.json')
+            # Write then rename so a concurrent reader never sees a partial file
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, separators=(',', ':'))
+            os.replace(temp_path, path)
+            self.prune(key)
+    
+    def prune(self, key):
+        """Delete the files of key's database with another version, once per version."""
+        db_hash, version_hash, _ = key.split('-')
+        with self.lock:
+            if (db_hash, version_hash) in self.pruned:
+                return
+            self.pruned.add((db_hash, version_hash))
+        for name in os.listdir(self.cache_dir):
+            if (name.startswith(db_hash + '-') and name.endswith('.json')
+                    and not name.startswith(f'{db_hash}-{version_hash}-')):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass  # deleted by another process meanwhile
+    
+    def collect(self, key, columns, rows):
+        """Yield rows, caching them once all were read if there are at most max_rows."""
+        kept = []
+        for row in rows:
+            if kept is not None:
+                kept.append(row)
+                if len(kept) > self.max_rows:
+                    kept = None
+            yield row
+        if kept is not None:
+            self.put(key, (columns, kept))
+
+def run_query(cursor, db_file, sql, params=(), fetch_size=DEFAULT_FETCH_SIZE, cache=None):
+    """
+    Run sql and return (column names, row iterator). With a cache, a cached result is
+    served without executing anything, and a fresh one is cached as it is read. With
+    instrumentation on, the query plan is captured and reading the rows is timed.
+    """
+    key = cache.key(db_file, sql, params) if cache else None
+    if key:
+        result = cache.get(key)
+        if result is not None:
+            columns, rows = result
+            return columns, instruments.counted('read cached rows', iter(rows))
+    instruments.capture_plan(cursor, sql, params)
+    cursor.execute(sql, params)
+    columns = [description[0] for description in cursor.description]
+    rows = iter_report_rows(cursor, fetch_size)
+    if key:
+        rows = cache.collect(key, columns, rows)
+    return columns, instruments.counted('fetch rows', rows)
+
+def enable_wal(db_file):
+    """
+    Switch a database file to WAL journal mode, which persists in the file, so that
+    readers and a writer no longer block each other. Returns the journal mode now in use.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+    finally:
+        conn.close()
+
+class ConnectionPool:
+    """
+    Thread-safe pool of read-only connections (mode=ro URI) to one database file.
+    Connections are opened on first use, up to size, and then handed out again, each
+    keeping its cache of prepared statements, so repeated reports skip both connection
+    setup and statement preparation. With wal=True the file is switched to WAL first.
+    """
+    
+    def __init__(self, db_file, size=DEFAULT_POOL_SIZE, wal=False,
+                 cached_statements=DEFAULT_CACHED_STATEMENTS):
+        self.db_file = db_file
+        self.size = size
+        self.cached_statements = cached_statements
+        self.uri = Path(db_file).resolve().as_uri() + '?mode=ro'
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        if wal:
+            enable_wal(db_file)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def acquire(self, timeout=None):
+        """Take a connection, waiting up to timeout seconds (None: forever) for a free one."""
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("connection pool is closed")
+            create = self.opened < self.size
+            if create:
+                self.opened += 1
+        if create:
+            try:
+                conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False,
+                                       cached_statements=self.cached_statements)
+                instruments.watch(conn)
+                return conn
+            except sqlite3.Error:
+                with self.lock:
+                    self.opened -= 1
+                raise
+        try:
+            return self.idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"no free connection to {self.db_file} after {timeout}s") from None
+    
+    def release(self, conn):
+        """Hand a connection back to the pool."""
+        instruments.done(conn)
+        with self.lock:
+            if not self.closed:
+                self.idle.put(conn)
+                return
+        conn.close()
+    
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager lending a pooled connection."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def close(self):
+        """Close the idle connections; connections still lent out are closed on release."""
+        with self.lock:
+            self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+def compact_storage(cursor, db_file, cache=None):
+    """True if the database uses the compact schema (order dates stored as day numbers)."""
+    _, rows = run_query(cursor, db_file, ORDER_DATE_TYPE_QUERY, (), cache=cache)
+    return [row[0] for row in rows] == [DAY_TYPE]
+
+def order_tables(cursor, db_file, window=ALL_DATES, cache=None):
+    """
+    The (orders, order_items) pairs of tables holding a (start, end) window, newest first:
+    the partitions overlapping it on a partitioned database, else the tables themselves.
+    """
+    _, rows = run_query(cursor, db_file, PARTITIONED_QUERY, (), cache=cache)
+    [(partitioned,)] = rows
+    if not partitioned:
+        return [('orders', 'order_items')]
+    _, rows = run_query(cursor, db_file, PARTITIONS_QUERY, (window[1], window[0]), cache=cache)
+    return list(rows)
+
+def chained_rows(cursor, db_file, queries, fetch_size=DEFAULT_FETCH_SIZE, cache=None):
+    """Yield the rows of several (sql, params) queries in turn, each run once the previous one is exhausted."""
+    for sql, params in queries:
+        _, rows = run_query(cursor, db_file, sql, params, fetch_size, cache)
+        yield from rows
+
+def fetch_report_window(cursor, db_file, days=90, reference_date=None, cache=None):
+    """(start, end) of the report window; the most recent order is only looked up without a reference date."""
+    max_order_date = None
+    if reference_date is None:
+        for orders, _ in order_tables(cursor, db_file, cache=cache):
+            _, rows = run_query(cursor, db_file, MAX_ORDER_DATE_QUERY.format(orders=orders), (), cache=cache)
+            [(max_order_date,)] = rows
+            if max_order_date is not None:
+                break
+        if isinstance(max_order_date, int):
+            max_order_date = day_text(max_order_date)
+    return report_window(max_order_date, days, reference_date)
+
+def report_rows(cursor, db_file, window, customer_ids=None, categories=None, limit=None,
+                fetch_size=DEFAULT_FETCH_SIZE, cache=None):
+    """(column names, row iterator) of the report for a (start, end) window."""
+    compact = compact_storage(cursor, db_file, cache)
+    dates = stored_dates(window, compact)
+    queries = []
+    for tables in order_tables(cursor, db_file, window, cache):
+        sql, params = report_query(customer_ids, categories, limit, compact, tables)
+        queries.append((sql, [*dates, *params]))
+    if len(queries) == 1:
+        [(sql, params)] = queries
+        return run_query(cursor, db_file, sql, params, fetch_size, cache)
+    return list(REPORT_COLUMNS), islice(chained_rows(cursor, db_file, queries, fetch_size, cache), limit)
+
+def summary_values(cursor, db_file, window, customer_ids=None, categories=None, cache=None):
+    """The summary statistics of a (start, end) window, in SUMMARY_LABELS order."""
+    compact = compact_storage(cursor, db_file, cache)
+    tables = order_tables(cursor, db_file, window, cache)
+    if not tables:
+        return (0, 0, 0, 0)
+    sql, params = summary_query(customer_ids, categories, tables)
+    _, rows = run_query(cursor, db_file, sql, [*stored_dates(window, compact), *params] * len(tables), cache=cache)
+    [summary] = rows
+    return summary
+
+def customer_order_report(pool, days=90, reference_date=None, customer_ids=None, categories=None,
+                          limit=None, fetch_size=DEFAULT_FETCH_SIZE, cache=None):
+    """
+    Yield the report rows for the days up to reference_date (default: the most recent
+    order), optionally only for some customer ids and product categories and at most
+    limit rows. One pooled connection is held until the rows run out or the generator
+    is closed.
+    """
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            window = fetch_report_window(cursor, pool.db_file, days, reference_date, cache)
+            _, rows = report_rows(cursor, pool.db_file, window, customer_ids, categories, limit,
+                                  fetch_size, cache)
+            yield from rows
+        finally:
+            cursor.close()
+
+def report_summary(pool, days=90, reference_date=None, customer_ids=None, categories=None, cache=None):
+    """Summary statistics of the report with the same options, as a {label: value} dict."""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            window = fetch_report_window(cursor, pool.db_file, days, reference_date, cache)
+            summary = summary_values(cursor, pool.db_file, window, customer_ids, categories, cache)
+        finally:
+            cursor.close()
+    return {label.format(days=days): value for label, value in zip(SUMMARY_LABELS, summary)}
+
+def encode_page_token(window, key):
+    """Opaque continuation token carrying the report window and the seek key of the next page."""
+    text = json.dumps({'window': list(window), 'after': list(key)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+def decode_page_token(token):
+    """(window, seek key) of a continuation token; ValueError if it is not one."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        start, end = state['window']
+        for day in (start, end):
+            date.fromisoformat(day)
+        after = state['after']
+        if not isinstance(after, list) or len(after) != 6:
+            raise ValueError("invalid page token")
+        if not all(value is None or isinstance(value, (str, int, float)) for value in after):
+            raise ValueError("invalid page token")
+    except (ValueError, TypeError, KeyError, UnicodeEncodeError):
+        raise ValueError("invalid page token") from None
+    return (start, end), after
+
+def page_rows(cursor, db_file, window, after=None, customer_ids=None, categories=None,
+              page_size=DEFAULT_PAGE_SIZE, cache=None):
+    """
+    One page of report rows within a (start, end) window, following seek key after
+    (None: the first page). Returns (rows, seek key of the next page or None).
+    """
+    compact = compact_storage(cursor, db_file, cache)
+    filters, filter_params = report_filters(customer_ids, categories)
+    params = stored_dates(window, compact)
+    if after:
+        key = stored_dates(after[:1], compact) + after[1:]
+        params += key[:3] + key
+    params += filter_params
+    
+    # Partitions newest first, skipping those after the previous page's last date,
+    # until the page (plus the one extra row) is full
+    rows = []
+    for orders, order_items in order_tables(cursor, db_file, (window[0], after[0] if after else window[1]), cache):
+        sql = PAGE_QUERY_TEMPLATE.format(orders=orders, order_items=order_items,
+                                         after=PAGE_AFTER if after else "", filters=filters,
+                                         **(COMPACT_COLUMN_SQL if compact else STANDARD_COLUMN_SQL))
+        _, partition_rows = run_query(cursor, db_file, sql, [*params, page_size + 1 - len(rows)], cache=cache)
+        rows += partition_rows
+        if len(rows) > page_size:
+            break
+    
+    # One extra row tells whether there is a next page
+    next_key = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_key = [last[1], last[7], last[8], last[9], last[3], last[10]]
+    return [row[:7] for row in rows], next_key
+
+def customer_order_report_page(pool, page_size=DEFAULT_PAGE_SIZE, page_token=None, days=90,
+                               reference_date=None, customer_ids=None, categories=None, cache=None):
+    """
+    One page of the report: (window, rows, token of the next page or None), the window
+    being the (start, end) dates the pages cover. Continue by passing
+    the token back with the same filters. The window is fixed by the first page and
+    carried in the token, so later pages are not shifted by orders that arrive meanwhile.
+    Pages run newest order date first, then by customer id and order (see PAGE_QUERY_TEMPLATE).
+    """
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if page_token is None:
+                window = fetch_report_window(cursor, pool.db_file, days, reference_date, cache)
+                after = None
+            else:
+                window, after = decode_page_token(page_token)
+            rows, next_key = page_rows(cursor, pool.db_file, window, after, customer_ids, categories,
+                                       page_size, cache)
+        finally:
+            cursor.close()
+    return window, rows, encode_page_token(window, next_key) if next_key else None
+
+def sales_revenue(revenue, compact):
+    """A rollup revenue sum in dollars, rounded to cents (the compact schema stores cents)."""
+    return round(revenue / 100 if compact else revenue, 2)
+
+def top_sales(pool, by='category', top=DEFAULT_TOP, rank_by='revenue', days=90, reference_date=None,
+              cache=None):
+    """
+    The top categories or customers (by='category' or 'customer') of the window, ranked
+    by revenue or units: (window, [(category or customer id, order lines, units, revenue)]).
+    The window is as for customer_order_report.
+    """
+    if rank_by not in SALES_RANKINGS:
+        raise ValueError(f"cannot rank sales by {rank_by!r}")
+    table, key = SALES_ROLLUPS[by]
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            window = fetch_report_window(cursor, pool.db_file, days, reference_date, cache)
+            compact = compact_storage(cursor, pool.db_file, cache)
+            sql = TOP_SALES_QUERY_TEMPLATE.format(table=table, key=key, rank_by=rank_by)
+            _, rows = run_query(cursor, pool.db_file, sql, [*stored_dates(window, compact), int(top)], cache=cache)
+            rows = [(value, lines, units, sales_revenue(revenue, compact)) for value, lines, units, revenue in rows]
+        finally:
+            cursor.close()
+    return window, rows
+
+def sales_trend(pool, days=90, reference_date=None, customer_ids=None, categories=None, cache=None):
+    """
+    Sales per day of the window, optionally of some customers or some categories (not
+    both): (window, [(date, order lines, units, revenue)]), days without sales left out.
+    """
+    if customer_ids is not None and categories is not None:
+        raise ValueError("a sales trend is filtered by customers or by categories, not both")
+    by, values = ('customer', [int(customer_id) for customer_id in customer_ids]) if customer_ids is not None \
+        else ('category', categories)
+    table, key = SALES_ROLLUPS[by]
+    filters = SALES_TREND_FILTER.format(key=key) if values is not None else ""
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            window = fetch_report_window(cursor, pool.db_file, days, reference_date, cache)
+            compact = compact_storage(cursor, pool.db_file, cache)
+            params = stored_dates(window, compact)
+            if values is not None:
+                params.append(json.dumps(list(values)))
+            sql = SALES_TREND_QUERY_TEMPLATE.format(table=table, filters=filters)
+            _, rows = run_query(cursor, pool.db_file, sql, params, cache=cache)
+            rows = [(day_text(day) if compact else day, lines, units, sales_revenue(revenue, compact))
+                    for day, lines, units, revenue in rows]
+        finally:
+            cursor.close()
+    return window, rows
+
+def review_match_expression(terms):
+    """FTS5 query matching any of terms, each term a phrase whose words must appear in order."""
+    if not terms:
+        raise ValueError("no search terms given")
+    return ' OR '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+def search_reviews(pool, terms, max_rating=None, limit=DEFAULT_SEARCH_LIMIT, cache=None):
+    """
+    Reviews whose text contains any of terms (words or phrases, case-insensitive), with
+    their product and rating, best bm25 match first and at most limit of them (None: all),
+    optionally only those rated max_rating or lower:
+    [(review_id, product_name, category, rating, review_date, review_text, score)].
+    """
+    rating_join, filters = (REVIEW_RATING_JOIN, REVIEW_RATING_FILTER) if max_rating is not None else ("", "")
+    params = [review_match_expression(terms), *([int(max_rating)] if max_rating is not None else []),
+              -1 if limit is None else int(limit)]
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            compact = compact_storage(cursor, pool.db_file, cache)
+            sql = REVIEW_SEARCH_QUERY_TEMPLATE.format(rating_join=rating_join, filters=filters,
+                                                      **(COMPACT_COLUMN_SQL if compact else STANDARD_COLUMN_SQL))
+            _, rows = run_query(cursor, pool.db_file, sql, params, cache=cache)
+            rows = list(rows)
+        finally:
+            cursor.close()
+    return rows
+
+def like_search_reviews(pool, terms, max_rating=None, cache=None):
+    """search_reviews done with LIKE '%term%' scans instead of the index: all matches, by review id, unscored."""
+    if not terms:
+        raise ValueError("no search terms given")
+    likes = " OR ".join("r.review_text LIKE ? ESCAPE '\\'" for _ in terms)
+    filters = REVIEW_RATING_FILTER if max_rating is not None else ""
+    params = ['%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%' for term in terms]
+    if max_rating is not None:
+        params.append(int(max_rating))
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            compact = compact_storage(cursor, pool.db_file, cache)
+            sql = LIKE_REVIEW_SEARCH_QUERY_TEMPLATE.format(likes=likes, filters=filters,
+                                                           **(COMPACT_COLUMN_SQL if compact else STANDARD_COLUMN_SQL))
+            _, rows = run_query(cursor, pool.db_file, sql, params, cache=cache)
+            rows = list(rows)
+        finally:
+            cursor.close()
+    return rows
+
+def compare_review_search(pool, terms, max_rating=None, limit=DEFAULT_SEARCH_LIMIT, out=None):
+    """
+    Time the indexed search (its top limit matches, and all matches) against the LIKE
+    scans and check both find the same reviews. Each search is run once untimed first, so
+    all of them find the pages cached. Prints the timings; returns True on a match.
+    """
+    out = out or sys.stdout
+    timings = {}
+    results = {}
+    for label, search in [(f"FTS5, top {limit}", lambda: search_reviews(pool, terms, max_rating, limit)),
+                          ("FTS5, all matches", lambda: search_reviews(pool, terms, max_rating, None)),
+                          ("LIKE scan", lambda: like_search_reviews(pool, terms, max_rating))]:
+        search()
+        start_time = time.perf_counter()
+        results[label] = search()
+        timings[label] = time.perf_counter() - start_time
+    
+    # Substring and word matching agree unless a term only appears inside longer words
+    fts_ids = {row[0] for row in results["FTS5, all matches"]}
+    like_ids = {row[0] for row in results["LIKE scan"]}
+    print(f"Search {review_match_expression(terms)}: {len(fts_ids)} matching reviews "
+          f"(LIKE: {len(like_ids)})", file=out)
+    for label, seconds in timings.items():
+        print(f"{label:<20} {seconds * 1000:>10.1f} ms", file=out)
+    if fts_ids != like_ids:
+        print(f"The searches differ: {len(fts_ids - like_ids)} reviews only found by FTS5, "
+              f"{len(like_ids - fts_ids)} only by LIKE", file=out)
+    return fts_ids == like_ids
+
+def format_report_row(row):
+    """Format a report row as the text cells of the fixed-width table."""
+    return [
+        row[0],  # customer_name
+        row[1],  # order_date
+        row[2],  # product_name
+        str(row[3]),  # quantity
+        f"${row[4]:.2f}",  # unit_price
+        f"{row[5]:.1f}" if row[5] > 0 else "N/A",  # avg_rating
+        str(row[6])  # review_count
+    ]
+
+def write_table_report(rows, out, cutoff_date, sample_rows=DEFAULT_SAMPLE_ROWS, days=90):
+    """
+    Print report rows as the fixed-width table as they arrive. Column widths come from
+    the first sample_rows rows only (or just REPORT_MIN_WIDTHS when it is 0), so wider
+    values further down overflow their column. Returns the number of rows written.
+    """
+    rows = iter(rows)
+    sample = [format_report_row(row) for row in islice(rows, max(sample_rows, 1))]
+    if not sample:
+        print(f"No orders found in the last {days} days.", file=out)
+        return 0
+    
+    print("=" * 120, file=out)
+    print("CUSTOMER ORDER DETAILS WITH PRODUCT INFORMATION AND REVIEW RATINGS", file=out)
+    print(f"Orders from the last {days} days (since {cutoff_date})", file=out)
+    print("=" * 120, file=out)
+    print(file=out)
+    
+    # Calculate column widths (with minimum widths)
+    col_widths = [max(len(h), REPORT_MIN_WIDTHS[i]) for i, h in enumerate(REPORT_HEADERS)]
+    if sample_rows > 0:
+        for row in sample:
+            for i, cell in enumerate(row):
+                col_widths[i] = max(col_widths[i], len(cell))
+    
+    # Add padding
+    col_widths = [w + 2 for w in col_widths]
+    
+    # Print header with proper alignment
+    header_parts = []
+    for i, h in enumerate(REPORT_HEADERS):
+        header_parts.append(h.center(col_widths[i]))
+    header_row = " | ".join(header_parts)
+    print(header_row, file=out)
+    print("-" * len(header_row), file=out)
+    
+    # Print data rows with proper alignment
+    count = 0
+    for row in chain(sample, map(format_report_row, rows)):
+        data_parts = []
+        for i, cell in enumerate(row):
+            # Left align text columns, right align numeric columns
+            if i in [0, 2]:  # Customer Name, Product Name - left align
+                data_parts.append(cell.ljust(col_widths[i]))
+            elif i in [3, 4, 5, 6]:  # Numeric columns - right align
+                data_parts.append(cell.rjust(col_widths[i]))
+            else:  # Date - center align
+                data_parts.append(cell.center(col_widths[i]))
+        print(" | ".join(data_parts), file=out)
+        count += 1
+    
+    print(file=out)
+    print(f"Total records: {count}", file=out)
+    return count
+
+def write_csv_report(rows, out, columns):
+    """Write report rows as CSV with a header of column names. Returns the number of rows."""
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+def write_jsonl_report(rows, out, columns):
+    """Write report rows as JSON Lines, one object per row. Returns the number of rows."""
+    count = 0
+    for row in rows:
+        out.write(json.dumps(dict(zip(columns, row))) + "\n")
+        count += 1
+    return count
+
+def query_customer_orders_with_reviews(db_file='ecommerce.db', output_format='table', out=None,
+                                       sample_rows=DEFAULT_SAMPLE_ROWS, fetch_size=DEFAULT_FETCH_SIZE,
+                                       cache=None, pool=None, days=90, reference_date=None,
+                                       customer_ids=None, categories=None, limit=None):
     """
     Query customer order details with product information and review ratings.
     Joins customers, orders, order_items, products, and reviews tables.
+    Rows are streamed to out (default stdout) as 'table', 'csv' or 'jsonl' while they are
+    fetched, so memory does not grow with the size of the result. The summary statistics
+    are only printed with the table. With a ResultCache, results of an unchanged database
+    are served from the cache. Given a ConnectionPool, db_file is ignored and one of its
+    connections is used; the window and filters are as for customer_order_report.
     """
+    out = out or sys.stdout
+    
     # Connect to database
-    conn = sqlite3.connect('ecommerce.db')
-    cursor = conn.cursor()
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(db_file, size=1)
     
-    # Calculate date 90 days ago from today
-    # Since our data might be historical, we'll use the most recent order date as reference
-    cursor.execute("SELECT MAX(order_date) FROM orders")
-    max_order_date = cursor.fetchone()[0]
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Calculate the window: days before the reference date or the most recent order
+            window = fetch_report_window(cursor, pool.db_file, days, reference_date, cache)
+            
+            # Execute query
+            columns, rows = report_rows(cursor, pool.db_file, window, customer_ids, categories, limit,
+                                        fetch_size, cache)
+            
+            if output_format == 'csv':
+                write_csv_report(rows, out, columns)
+            elif output_format == 'jsonl':
+                write_jsonl_report(rows, out, columns)
+            else:
+                write_table_report(rows, out, window[0], sample_rows, days)
+                
+                # Additional summary statistics
+                print("\n" + "=" * 120, file=out)
+                print("SUMMARY STATISTICS", file=out)
+                print("=" * 120, file=out)
+                
+                summary = summary_values(cursor, pool.db_file, window, customer_ids, categories, cache)
+                for label, value in zip(SUMMARY_LABELS, summary):
+                    print(f"{label.format(days=days)}: {value}", file=out)
+            cursor.close()
+    finally:
+        if own_pool:
+            pool.close()
+
+def query_customer_orders_page(db_file='ecommerce.db', output_format='table', out=None,
+                               page_size=DEFAULT_PAGE_SIZE, page_token=None, cache=None, pool=None,
+                               days=90, reference_date=None, customer_ids=None, categories=None):
+    """
+    Print one page of the report (see customer_order_report_page) as 'table', 'csv' or
+    'jsonl' and return the token of the next page, or None on the last page. The token
+    is printed after the table, or to stderr with csv and jsonl to keep their output clean.
+    """
+    out = out or sys.stdout
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(db_file, size=1)
+    try:
+        window, rows, next_token = customer_order_report_page(pool, page_size, page_token, days, reference_date,
+                                                              customer_ids, categories, cache)
+    finally:
+        if own_pool:
+            pool.close()
     
-    if max_order_date:
-        # Parse the max order date and calculate 90 days before
-        max_date = datetime.strptime(max_order_date, '%Y-%m-%d')
-        cutoff_date = (max_date - timedelta(days=90)).strftime('%Y-%m-%d')
-    else:
-        # Fallback to 90 days ago from today
-        cutoff_date = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
-    
-    # Complex SQL query joining all 5 tables
-    query = """
-    SELECT 
-        c.name AS customer_name,
-        o.order_date,
-        p.name AS product_name,
-        oi.quantity,
-        ROUND(p.price, 2) AS unit_price,
-        ROUND(COALESCE(AVG(r.rating), 0), 2) AS avg_rating,
-        COUNT(r.review_id) AS review_count
-    FROM 
-        orders o
-    INNER JOIN 
-        customers c ON o.customer_id = c.customer_id
-    INNER JOIN 
-        order_items oi ON o.order_id = oi.order_id
-    INNER JOIN 
-        products p ON oi.product_id = p.product_id
-    LEFT JOIN 
-        reviews r ON p.product_id = r.product_id
-    WHERE 
-        o.order_date >= ?
-    GROUP BY 
-        c.customer_id, o.order_id, o.order_date, p.product_id, p.name, oi.quantity, p.price
-    ORDER BY 
-        o.order_date DESC, c.name, p.name
-    """
-    
-    # Execute query
-    cursor.execute(query, (cutoff_date,))
-    results = cursor.fetchall()
-    
-    # Format results for display
-    if results:
-        headers = [
-            "Customer Name",
-            "Order Date",
-            "Product Name",
-            "Quantity",
-            "Unit Price ($)",
-            "Avg Rating",
-            "Review Count"
-        ]
-        
-        # Format the data
-        formatted_results = []
-        for row in results:
-            formatted_row = [
-                row[0],  # customer_name
-                row[1],  # order_date
-                row[2],  # product_name
-                row[3],  # quantity
-                f"${row[4]:.2f}",  # unit_price
-                f"{row[5]:.1f}" if row[5] > 0 else "N/A",  # avg_rating
-                row[6]  # review_count
-            ]
-            formatted_results.append(formatted_row)
-        
-        # Print formatted table
-        print("=" * 120)
-        print("CUSTOMER ORDER DETAILS WITH PRODUCT INFORMATION AND REVIEW RATINGS")
-        print(f"Orders from the last 90 days (since {cutoff_date})")
-        print("=" * 120)
-        print()
-        
-        # Calculate column widths (with minimum widths)
-        min_widths = [15, 12, 25, 10, 15, 12, 13]  # Minimum widths for each column
-        col_widths = [max(len(h), min_widths[i]) for i, h in enumerate(headers)]
-        for row in formatted_results:
-            for i, cell in enumerate(row):
-                col_widths[i] = max(col_widths[i], len(str(cell)), min_widths[i])
-        
-        # Add padding
-        col_widths = [w + 2 for w in col_widths]
-        
-        # Print header with proper alignment
-        header_parts = []
-        for i, h in enumerate(headers):
-            header_parts.append(h.center(col_widths[i]))
-        header_row = " | ".join(header_parts)
-        print(header_row)
-        print("-" * len(header_row))
-        
-        # Print data rows with proper alignment
-        for row in formatted_results:
-            data_parts = []
-            for i, cell in enumerate(row):
-                # Left align text columns, right align numeric columns
-                if i in [0, 2]:  # Customer Name, Product Name - left align
-                    data_parts.append(str(cell).ljust(col_widths[i]))
-                elif i in [3, 4, 5, 6]:  # Numeric columns - right align
-                    data_parts.append(str(cell).rjust(col_widths[i]))
-                else:  # Date - center align
-                    data_parts.append(str(cell).center(col_widths[i]))
-            data_row = " | ".join(data_parts)
-            print(data_row)
-        
-        print()
-        print(f"Total records: {len(results)}")
+    if output_format == 'csv':
+        write_csv_report(rows, out, REPORT_COLUMNS)
+    elif output_format == 'jsonl':
+        write_jsonl_report(rows, out, REPORT_COLUMNS)
     else:
-        print("No orders found in the last 90 days.")
-    
-    # Additional summary statistics
-    print("\n" + "=" * 120)
-    print("SUMMARY STATISTICS")
-    print("=" * 120)
-    
-    # Total orders in period
-    cursor.execute("""
-        SELECT COUNT(DISTINCT o.order_id) 
-        FROM orders o 
-        WHERE o.order_date >= ?
-    """, (cutoff_date,))
-    total_orders = cursor.fetchone()[0]
-    print(f"Total orders in last 90 days: {total_orders}")
-    
-    # Total customers
-    cursor.execute("""
-        SELECT COUNT(DISTINCT o.customer_id) 
-        FROM orders o 
-        WHERE o.order_date >= ?
-    """, (cutoff_date,))
-    total_customers = cursor.fetchone()[0]
-    print(f"Total unique customers: {total_customers}")
-    
-    # Total products ordered
-    cursor.execute("""
-        SELECT COUNT(DISTINCT oi.product_id) 
-        FROM orders o
-        INNER JOIN order_items oi ON o.order_id = oi.order_id
-        WHERE o.order_date >= ?
-    """, (cutoff_date,))
-    total_products = cursor.fetchone()[0]
-    print(f"Total unique products ordered: {total_products}")
-    
-    # Products with reviews
-    cursor.execute("""
-        SELECT COUNT(DISTINCT p.product_id)
-        FROM orders o
-        INNER JOIN order_items oi ON o.order_id = oi.order_id
-        INNER JOIN products p ON oi.product_id = p.product_id
-        INNER JOIN reviews r ON p.product_id = r.product_id
-        WHERE o.order_date >= ?
-    """, (cutoff_date,))
-    products_with_reviews = cursor.fetchone()[0]
-    print(f"Products with reviews: {products_with_reviews}")
-    
-    conn.close()
+        window_days = (parse_date(window[1]) - parse_date(window[0])).days
+        write_table_report(rows, out, window[0], DEFAULT_SAMPLE_ROWS, window_days)
+    
+    if next_token:
+        print(f"Next page token: {next_token}", file=out if output_format == 'table' else sys.stderr)
+    return next_token
+
+def query_sales(db_file='ecommerce.db', output_format='table', out=None, report='top-categories',
+                top=DEFAULT_TOP, rank_by='revenue', cache=None, pool=None, days=90, reference_date=None,
+                customer_ids=None, categories=None):
+    """
+    Print a sales report from the daily rollups: the top categories or customers of the
+    window (see top_sales), or the sales per day (see sales_trend), as 'table', 'csv' or 'jsonl'.
+    """
+    out = out or sys.stdout
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(db_file, size=1)
+    try:
+        if report == 'trend':
+            window, rows = sales_trend(pool, days, reference_date, customer_ids, categories, cache)
+            title = "DAILY SALES"
+            first_column = 'sale_date'
+        else:
+            by = 'category' if report == 'top-categories' else 'customer'
+            window, rows = top_sales(pool, by, top, rank_by, days, reference_date, cache)
+            title = f"TOP {top} {'CATEGORIES' if by == 'category' else 'CUSTOMERS'} BY {rank_by.upper()}"
+            first_column = SALES_ROLLUPS[by][1]
+    finally:
+        if own_pool:
+            pool.close()
+    
+    columns = [first_column, 'order_lines', 'units', 'revenue']
+    if output_format == 'csv':
+        write_csv_report(rows, out, columns)
+        return
+    if output_format == 'jsonl':
+        write_jsonl_report(rows, out, columns)
+        return
+    headers = [first_column.replace('_', ' ').title(), *SALES_HEADERS]
+    widths = [max([len(headers[0])] + [len(str(row[0])) for row in rows]) + 2, 13, 10, 15]
+    print("=" * 60, file=out)
+    print(title, file=out)
+    print(f"Orders from {window[0]} to {window[1]}", file=out)
+    print("=" * 60, file=out)
+    header_row = " | ".join(header.center(width) for header, width in zip(headers, widths))
+    print(header_row, file=out)
+    print("-" * len(header_row), file=out)
+    for value, lines, units, revenue in rows:
+        print(" | ".join([str(value).ljust(widths[0]), str(lines).rjust(widths[1]), str(units).rjust(widths[2]),
+                          f"${revenue:,.2f}".rjust(widths[3])]), file=out)
+
+def query_review_search(db_file='ecommerce.db', output_format='table', out=None, terms=(), max_rating=None,
+                        limit=DEFAULT_SEARCH_LIMIT, compare_like=False, cache=None, pool=None):
+    """
+    Print the reviews matching any of terms (see search_reviews) as 'table', 'csv' or
+    'jsonl', or with compare_like, time the search against LIKE scans instead.
+    """
+    out = out or sys.stdout
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(db_file, size=1)
+    try:
+        if compare_like:
+            if not compare_review_search(pool, terms, max_rating, limit or DEFAULT_SEARCH_LIMIT, out):
+                sys.exit(1)
+            return
+        rows = search_reviews(pool, terms, max_rating, limit, cache)
+    finally:
+        if own_pool:
+            pool.close()
+    
+    if output_format == 'csv':
+        write_csv_report(rows, out, REVIEW_SEARCH_COLUMNS)
+        return
+    if output_format == 'jsonl':
+        write_jsonl_report(rows, out, REVIEW_SEARCH_COLUMNS)
+        return
+    print("=" * 120, file=out)
+    print(f"REVIEWS MATCHING {review_match_expression(terms)}", file=out)
+    print("=" * 120, file=out)
+    for review_id, product_name, category, rating, review_date, review_text, score in rows:
+        print(f"#{review_id:<8} {rating}/5  {review_date}  {product_name} ({category})  score {score}", file=out)
+        print(f"          {review_text}", file=out)
+    print(f"\nTotal reviews: {len(rows)}", file=out)
+
+def check_query_plans(conn):
+    """
+    Run EXPLAIN QUERY PLAN on every report query and return the problems found:
+    full table scans and temp B-trees other than BOUNDED_PLAN_STEPS. Returns None if
+    the database is partitioned and no partition overlaps the report window.
+    """
+    cursor = conn.cursor()
+    compact = compact_storage(cursor, None)
+    report_dates = fetch_report_window(cursor, None)
+    window = stored_dates(report_dates, compact)
+    
+    # On a partitioned database: the newest partition, and the summary over the window's partitions
+    tables = order_tables(cursor, None, report_dates)
+    if not tables:
+        print(f"No partitions overlap the report window {report_dates[0]} to {report_dates[1]}.")
+        return None
+    orders, order_items = tables[0]
+    page_query = PAGE_QUERY_TEMPLATE.format(orders=orders, order_items=order_items, after=PAGE_AFTER, filters="",
+                                            **(COMPACT_COLUMN_SQL if compact else STANDARD_COLUMN_SQL))
+    queries = [("Latest order date", MAX_ORDER_DATE_QUERY.format(orders=orders), ()),
+               ("Customer order report", report_query(compact=compact, tables=tables[0])[0], window),
+               ("Summary statistics", summary_query(tables=tables)[0], window * len(tables)),
+               ("Report page", page_query,
+                (*window, window[1], 0, 0, window[1], 0, 0, 0, 0, 0, DEFAULT_PAGE_SIZE + 1))]
+    
+    problems = []
+    for label, query, params in queries:
+        cursor.execute(f'EXPLAIN QUERY PLAN {query}', params)
+        print(f"{label}:")
+        for _, _, _, detail in cursor.fetchall():
+            print(f"    {detail}")
+            # Scanning a subquery reads the rows its own (checked) steps produce, not a table
+            full_scan = detail.startswith('SCAN ') and not detail.startswith('SCAN (subquery-')
+            temp_btree = 'TEMP B-TREE' in detail and not detail.startswith(BOUNDED_PLAN_STEPS)
+            if full_scan or temp_btree:
+                problems.append(f"{label}: {detail}")
+    return problems
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='Print the customer order report.')
+    parser.add_argument('--db', default='ecommerce.db', help='SQLite database file (default: ecommerce.db)')
+    parser.add_argument('--days', type=int, default=90, help='length of the report window in days (default: 90)')
+    parser.add_argument('--reference-date', default=None,
+                        help='last day of the window, YYYY-MM-DD (default: the most recent order date)')
+    parser.add_argument('--customer', type=int, action='append', dest='customer_ids',
+                        help='only orders of this customer id (repeatable)')
+    parser.add_argument('--category', action='append', dest='categories',
+                        help='only order lines of products in this category (repeatable)')
+    parser.add_argument('--limit', type=int, default=None, help='print at most this many rows')
+    parser.add_argument('--format', choices=REPORT_FORMATS, default='table',
+                        help='table: fixed-width text with summary statistics; csv or jsonl: rows only')
+    parser.add_argument('--output', default=None, help='write the report to this file (default: stdout)')
+    parser.add_argument('--sample-rows', type=int, default=DEFAULT_SAMPLE_ROWS,
+                        help=f'rows used to size the table columns; 0 uses fixed widths '
+                             f'(default: {DEFAULT_SAMPLE_ROWS})')
+    parser.add_argument('--fetch-size', type=int, default=DEFAULT_FETCH_SIZE,
+                        help=f'rows per fetchmany call (default: {DEFAULT_FETCH_SIZE})')
+    parser.add_argument('--cache-dir', default=None,
+                        help='cache query results in this directory; a rerun against an unchanged '
+                             'database is answered from the cache')
+    parser.add_argument('--page-size', type=int, default=None,
+                        help='print one page of this many rows in index order and the token of the next page')
+    parser.add_argument('--page-token', default=None, help='continue from the page that printed this token')
+    parser.add_argument('--sales', choices=SALES_REPORTS, default=None,
+                        help='instead of the order lines, print the top categories or customers or the '
+                             'sales per day of the window, from the daily sales rollups')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP,
+                        help=f'rows of a top-categories or top-customers report (default: {DEFAULT_TOP})')
+    parser.add_argument('--rank-by', choices=SALES_RANKINGS, default='revenue',
+                        help='rank top categories or customers by revenue or units (default: revenue)')
+    parser.add_argument('--search', action='append', dest='search_terms',
+                        help='instead of the order lines, print the reviews containing this word or phrase, '
+                             'best match first (repeatable: any of them)')
+    parser.add_argument('--max-rating', type=int, default=None, help='only search reviews rated this or lower')
+    parser.add_argument('--compare-like', action='store_true',
+                        help='with --search, time the full-text search against LIKE scans instead; '
+                             'exits with status 1 if they find different reviews')
+    parser.add_argument('--metrics', default=None,
+                        help='write timings of the stages and SQLite statements, and the query plans, '
+                             'to this file (off by default)')
+    parser.add_argument('--metrics-format', choices=METRICS_FORMATS, default='json',
+                        help='--metrics file format; prometheus suits a node exporter textfile '
+                             'collector but has no query plans (default: json)')
+    parser.add_argument('--check-plans', action='store_true',
+                        help='instead of the report, check that no report query needs a full scan '
+                             'or a temp B-tree; exits with status 1 if one does')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.metrics:
+        instruments.enable('query_orders')
+    try:
+        run(args)
+    finally:
+        if args.metrics:
+            instruments.write(args.metrics, args.metrics_format)
+
+def run(args):
+    """Print the report, or check the query plans, as the command line options args ask."""
+    if not args.check_plans:
+        cache = ResultCache(args.cache_dir) if args.cache_dir else None
+        options = dict(cache=cache, days=args.days, reference_date=args.reference_date,
+                       customer_ids=args.customer_ids, categories=args.categories)
+        if args.search_terms:
+            report = query_review_search
+            # The report window and filters do not apply to reviews
+            options = dict(cache=cache, terms=args.search_terms, max_rating=args.max_rating,
+                           limit=args.limit or DEFAULT_SEARCH_LIMIT, compare_like=args.compare_like)
+        elif args.sales:
+            report = query_sales
+            options.update(report=args.sales, top=args.top, rank_by=args.rank_by)
+        elif args.page_size or args.page_token:
+            report = query_customer_orders_page
+            options.update(page_size=args.page_size or DEFAULT_PAGE_SIZE, page_token=args.page_token)
+        else:
+            report = query_customer_orders_with_reviews
+            options.update(sample_rows=args.sample_rows, fetch_size=args.fetch_size, limit=args.limit)
+        try:
+            with instruments.stage(report.__name__):
+                if args.output is None:
+                    report(args.db, args.format, **options)
+                    return
+                with open(args.output, 'w', newline='' if args.format == 'csv' else None,
+                          encoding='utf-8') as out:
+                    report(args.db, args.format, out, **options)
+        except ValueError as e:
+            # A malformed --reference-date or --page-token, or a trend filtered both ways
+            sys.exit(f"Error: {e}")
+        return
+    
+    conn = sqlite3.connect(args.db)
+    instruments.watch(conn)
+    try:
+        problems = check_query_plans(conn)
+    finally:
+        instruments.done(conn)
+        conn.close()
+    if problems is None:
+        print("\nQuery plan check skipped.")
+        return
+    if problems:
+        print("\nQuery plan check FAILED:")
+        for problem in problems:
+            print(f"- {problem}")
+        sys.exit(1)
+    print("\nQuery plan check passed.")
 
 if __name__ == '__main__':
-    query_customer_orders_with_reviews()
+    main()
 
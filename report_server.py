@@ -0,0 +1,370 @@
+import sqlite3
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import urlsplit, parse_qs
+
+from query_orders import (DEFAULT_POOL_SIZE, DEFAULT_PAGE_SIZE, SUMMARY_LABELS, REPORT_COLUMNS,
+                          ConnectionPool, ResultCache, parse_date, decode_page_token,
+                          encode_page_token, fetch_report_window, report_rows, summary_values, page_rows)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+
+# Requests that may wait for a free connection; beyond that new requests get 503
+DEFAULT_QUEUE_SIZE = 16
+
+# Seconds a request may take before its query is interrupted
+DEFAULT_TIMEOUT = 10.0
+
+# Largest page_size accepted by /report/page
+MAX_PAGE_SIZE = 10000
+
+# Rows fetched per thread pool call and sent as one chunk of the response
+STREAM_BATCH_ROWS = 500
+
+MAX_HEADER_LINES = 100
+
+# Largest request body read and discarded to keep a connection alive (no endpoint takes one)
+MAX_DISCARDED_BODY = 65536
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+    504: 'Gateway Timeout',
+}
+
+class RequestError(Exception):
+    """A request answered with an error status and a JSON {"error": message} body."""
+    
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+class StreamAborted(Exception):
+    """A response failed after its headers were sent; the connection has to be dropped."""
+
+async def read_line(reader):
+    """Read one line of a request; a 400 if it is longer than the reader's limit."""
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise RequestError(400, "request line or header too long") from None
+
+async def read_request(reader):
+    """
+    Read a request line and headers: (method, target, version, headers), or None at EOF.
+    A body is read and discarded, so the next request on the connection starts after it.
+    """
+    line = await read_line(reader)
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise RequestError(400, "malformed request line") from None
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await read_line(reader)
+        if line in (b'\r\n', b'\n', b''):
+            await discard_body(reader, headers)
+            return method, target, version, headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    raise RequestError(400, "too many header lines")
+
+async def discard_body(reader, headers):
+    """Read past the body of a request, if it has one; a 400 if it cannot be skipped safely."""
+    if 'transfer-encoding' in headers:
+        raise RequestError(400, "request bodies are not accepted")
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise RequestError(400, "bad Content-Length") from None
+    if not 0 <= length <= MAX_DISCARDED_BODY:
+        raise RequestError(400, "request bodies are not accepted")
+    if length:
+        try:
+            await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            raise RequestError(400, "request body shorter than its Content-Length") from None
+
+def write_head(writer, status, headers):
+    """Write the status line and headers of a response."""
+    lines = [f"HTTP/1.1 {status} {REASONS[status]}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+
+async def send_json(writer, status, body, headers=None):
+    """Send a complete JSON response."""
+    data = json.dumps(body).encode('utf-8')
+    write_head(writer, status, {'Content-Type': 'application/json', 'Content-Length': len(data),
+                                **(headers or {})})
+    writer.write(data)
+    await writer.drain()
+
+def write_chunk(writer, text):
+    """Write one chunk of a chunked response body."""
+    data = text.encode('utf-8')
+    writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+def report_options(query):
+    """Report options from a query string: (days, reference_date, filters, limit)."""
+    params = parse_qs(query)
+    try:
+        days = int(params.get('days', ['90'])[-1])
+        reference_date = params.get('reference_date', [None])[-1]
+        if reference_date is not None:
+            parse_date(reference_date)
+        filters = {
+            'customer_ids': [int(value) for value in params['customer']] if 'customer' in params else None,
+            'categories': params.get('category'),
+        }
+        limit = int(params['limit'][-1]) if 'limit' in params else None
+    except ValueError as e:
+        raise RequestError(400, f"bad parameter: {e}") from None
+    if limit is not None and limit < 0:
+        raise RequestError(400, "limit must not be negative")
+    return days, reference_date, filters, limit
+
+def page_options(query):
+    """Pagination options from a query string: (page_size, decoded token or None)."""
+    params = parse_qs(query)
+    try:
+        page_size = int(params.get('page_size', [str(DEFAULT_PAGE_SIZE)])[-1])
+        token = decode_page_token(params['token'][-1]) if 'token' in params else None
+    except ValueError as e:
+        raise RequestError(400, f"bad parameter: {e}") from None
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise RequestError(400, f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    return page_size, token
+
+class ReportServer:
+    """
+    HTTP front end of the report. Queries run on a thread pool with one read-only
+    connection per thread, so the event loop never blocks on SQLite:
+    - GET /report streams the report rows as a JSON array, one chunk per STREAM_BATCH_ROWS
+      rows, fetching the next batch only once the client has taken the previous one;
+    - GET /report/page returns page_size rows (keyset pagination) and the token of the
+      next page as {"rows": [...], "next_token": ...}; pass it back as token=;
+    - GET /summary returns the summary statistics as a JSON object;
+    - GET /health returns {"status": "ok"}.
+    Both reports take days, reference_date, customer (repeatable), category (repeatable)
+    and limit (report only) query parameters. Up to workers requests run at once and up
+    to queue_size more wait; further requests are turned away with 503 straight away.
+    A request still running after timeout seconds has its query interrupted (504, or a
+    truncated stream once rows were sent).
+    """
+    
+    def __init__(self, db_file, workers=DEFAULT_POOL_SIZE, queue_size=DEFAULT_QUEUE_SIZE,
+                 timeout=DEFAULT_TIMEOUT, cache=None, wal=False):
+        self.pool = ConnectionPool(db_file, size=workers, wal=wal)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report')
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.cache = cache
+        self.admitted = None
+        self.running = None
+    
+    async def run(self, func, *args):
+        """Run a blocking function on the query thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+    
+    async def handle_client(self, reader, writer):
+        """Serve the requests of one client connection (HTTP/1.1 keep-alive)."""
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    method, target, version, headers = request
+                    connection = headers.get('connection', '').lower()
+                    keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                    await self.respond(method, target, writer)
+                except RequestError as e:
+                    # After a 400 the rest of the stream cannot be trusted to start a request
+                    keep_alive = keep_alive and e.status != 400
+                    response_headers = e.headers if keep_alive else {**e.headers, 'Connection': 'close'}
+                    await send_json(writer, e.status, {'error': str(e)}, response_headers)
+                if not keep_alive:
+                    break
+        except (StreamAborted, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    async def respond(self, method, target, writer):
+        """Answer one request; an unexpected error becomes a 500 rather than a dropped connection."""
+        try:
+            await self.route(method, target, writer)
+        except (RequestError, StreamAborted, ConnectionError):
+            raise
+        except Exception as e:
+            raise RequestError(500, f"internal error: {e}") from None
+    
+    async def route(self, method, target, writer):
+        """Route one request."""
+        url = urlsplit(target)
+        if url.path == '/health':
+            await send_json(writer, 200, {'status': 'ok'})
+            return
+        if url.path not in ('/report', '/report/page', '/summary'):
+            raise RequestError(404, f"no such endpoint: {url.path}")
+        if method != 'GET':
+            raise RequestError(405, f"{method} not allowed", {'Allow': 'GET'})
+        options = report_options(url.query)
+        if url.path == '/report/page':
+            page = page_options(url.query)
+        
+        # Backpressure: refuse rather than queue without bound
+        if self.admitted.locked():
+            raise RequestError(503, "too many requests in progress", {'Retry-After': 1})
+        async with self.admitted, self.running:
+            conn = await self.run(self.pool.acquire)
+            timed_out = False
+            
+            def interrupt():
+                nonlocal timed_out
+                timed_out = True
+                conn.interrupt()
+            
+            timer = asyncio.get_running_loop().call_later(self.timeout, interrupt)
+            try:
+                if url.path == '/summary':
+                    await self.send_summary(conn, *options, writer)
+                elif url.path == '/report/page':
+                    await self.send_page(conn, *options, *page, writer)
+                else:
+                    await self.stream_report(conn, *options, writer)
+            except sqlite3.OperationalError as e:
+                if timed_out:
+                    raise RequestError(504, f"query timed out after {self.timeout}s") from None
+                raise RequestError(500, str(e)) from None
+            finally:
+                timer.cancel()
+                self.pool.release(conn)
+    
+    async def send_summary(self, conn, days, reference_date, filters, limit, writer):
+        """Answer /summary."""
+        def summary():
+            cursor = conn.cursor()
+            try:
+                window = fetch_report_window(cursor, self.pool.db_file, days, reference_date, self.cache)
+                return window, summary_values(cursor, self.pool.db_file, window, cache=self.cache, **filters)
+            finally:
+                cursor.close()
+        
+        window, values = await self.run(summary)
+        body = {label.format(days=days): value for label, value in zip(SUMMARY_LABELS, values)}
+        await send_json(writer, 200, {'start_date': window[0], 'end_date': window[1], **body})
+    
+    async def send_page(self, conn, days, reference_date, filters, limit, page_size, after_token, writer):
+        """Answer /report/page."""
+        def page():
+            cursor = conn.cursor()
+            try:
+                if after_token is None:
+                    window = fetch_report_window(cursor, self.pool.db_file, days, reference_date, self.cache)
+                    after = None
+                else:
+                    window, after = after_token
+                return window, page_rows(cursor, self.pool.db_file, window, after, page_size=page_size,
+                                         cache=self.cache, **filters)
+            finally:
+                cursor.close()
+        
+        window, (rows, next_key) = await self.run(page)
+        await send_json(writer, 200, {
+            'start_date': window[0],
+            'end_date': window[1],
+            'rows': [dict(zip(REPORT_COLUMNS, row)) for row in rows],
+            'next_token': encode_page_token(window, next_key) if next_key else None,
+        })
+    
+    async def stream_report(self, conn, days, reference_date, filters, limit, writer):
+        """Answer /report with a chunked JSON array of row objects."""
+        cursor = conn.cursor()
+        
+        def first_batch():
+            window = fetch_report_window(cursor, self.pool.db_file, days, reference_date, self.cache)
+            columns, rows = report_rows(cursor, self.pool.db_file, window, limit=limit,
+                                        fetch_size=STREAM_BATCH_ROWS, cache=self.cache, **filters)
+            return columns, rows, list(islice(rows, STREAM_BATCH_ROWS))
+        
+        try:
+            # Errors up to here still get a proper error response
+            columns, rows, batch = await self.run(first_batch)
+            write_head(writer, 200, {'Content-Type': 'application/json', 'Transfer-Encoding': 'chunked'})
+            try:
+                prefix = "["
+                while batch:
+                    write_chunk(writer, prefix + ",\n".join(json.dumps(dict(zip(columns, row))) for row in batch))
+                    prefix = ",\n"
+                    # Wait for the client before fetching more rows
+                    await writer.drain()
+                    batch = await self.run(lambda: list(islice(rows, STREAM_BATCH_ROWS)))
+                write_chunk(writer, "[]" if prefix == "[" else "]")
+                writer.write(b'0\r\n\r\n')
+                await writer.drain()
+            except Exception as e:
+                raise StreamAborted(str(e)) from e
+        finally:
+            cursor.close()
+    
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Accept connections until cancelled."""
+        self.admitted = asyncio.Semaphore(self.workers + self.queue_size)
+        self.running = asyncio.Semaphore(self.workers)
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"Serving reports from {self.pool.db_file} on http://{host}:{port} "
+              f"({self.workers} connections, queue {self.queue_size}, timeout {self.timeout}s)")
+        async with server:
+            await server.serve_forever()
+    
+    def close(self):
+        """Wait for running queries and close the connections."""
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='Serve the customer order report over HTTP.')
+    parser.add_argument('--db', default='ecommerce.db', help='SQLite database file (default: ecommerce.db)')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'address to listen on (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_POOL_SIZE,
+                        help=f'query threads, one read-only connection each (default: {DEFAULT_POOL_SIZE})')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f'requests allowed to wait for a thread before answering 503 '
+                             f'(default: {DEFAULT_QUEUE_SIZE})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'seconds before a request\'s query is interrupted (default: {DEFAULT_TIMEOUT})')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep query results in memory until the database changes')
+    parser.add_argument('--wal', action='store_true',
+                        help='switch the database to WAL first so loads can run while serving')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = ReportServer(args.db, args.workers, args.queue_size, args.timeout,
+                          ResultCache() if args.cache else None, args.wal)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    finally:
+        server.close()
+
+if __name__ == '__main__':
+    main()
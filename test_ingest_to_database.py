@@ -0,0 +1,98 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+from ingest_to_database import (create_database_schema, build_daily_sales, create_quarantine_table,
+                                staged_load_csv_to_table)
+from partition_orders import split_database, archive_partitions
+
+CUSTOMERS = [(1, 'Ann Lee', 'ann@example.com', '2023-01-05'),
+             (2, 'Bo Chen', 'bo@example.com', '2023-02-11')]
+PRODUCTS = [(1, 'Coffee', 'Food & Beverages', 12.5),
+            (2, 'Novel', 'Books', 20.0),
+            (3, 'Tea', 'Food & Beverages', 8.25)]
+ORDERS = [(1, 1, '2024-01-10', 0), (2, 2, '2024-01-10', 0),
+          (3, 1, '2024-02-03', 0), (4, 2, '2024-03-21', 0)]
+ORDER_ITEMS = [(1, 1, 1, 2, 25.0), (2, 1, 2, 1, 20.0), (3, 2, 1, 1, 12.5),
+               (4, 2, 3, 4, 33.0), (5, 3, 1, 3, 37.5), (6, 4, 2, 2, 40.0), (7, 4, 1, 1, 12.5)]
+
+CATEGORY_ROLLUP = '''
+    SELECT sale_date, category, line_count, units, round(revenue, 2)
+    FROM daily_sales_by_category WHERE sale_date >= ? ORDER BY 1, 2
+'''
+CATEGORY_JOIN = '''
+    SELECT o.order_date, p.category, COUNT(*), SUM(oi.quantity), round(SUM(oi.price), 2)
+    FROM order_items oi JOIN orders o ON o.order_id = oi.order_id JOIN products p ON p.product_id = oi.product_id
+    WHERE o.order_date >= ? GROUP BY 1, 2 ORDER BY 1, 2
+'''
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'ecommerce.db')
+    conn.execute('PRAGMA foreign_keys = ON')
+    create_database_schema(conn)
+    conn.executemany('INSERT INTO customers VALUES (?, ?, ?, ?)', CUSTOMERS)
+    conn.executemany('INSERT INTO products VALUES (?, ?, ?, ?)', PRODUCTS)
+    conn.executemany('INSERT INTO orders VALUES (?, ?, ?, ?)', ORDERS)
+    conn.executemany('INSERT INTO order_items VALUES (?, ?, ?, ?, ?)', ORDER_ITEMS)
+    conn.commit()
+    build_daily_sales(conn)
+    yield conn
+    conn.close()
+
+def assert_rollup_matches_join(conn, since='0000-00-00'):
+    assert conn.execute(CATEGORY_ROLLUP, (since,)).fetchall() == conn.execute(CATEGORY_JOIN, (since,)).fetchall()
+
+def recategorize(conn, product_id, category):
+    with conn:
+        conn.execute('UPDATE products SET category = ? WHERE product_id = ?', (category, product_id))
+
+def test_category_change_moves_daily_sales(conn):
+    assert_rollup_matches_join(conn)
+    recategorize(conn, 1, 'Books')
+    assert_rollup_matches_join(conn)
+    assert conn.execute("SELECT COUNT(*) FROM daily_sales_by_category "
+                        "WHERE category = 'Food & Beverages'").fetchone()[0] == 1
+    recategorize(conn, 1, 'Garden')
+    recategorize(conn, 2, 'Garden')
+    assert_rollup_matches_join(conn)
+
+def test_category_change_upsert(conn):
+    with conn:
+        conn.execute('''
+            INSERT INTO products VALUES (3, 'Tea', 'Books', 8.25)
+            ON CONFLICT(product_id) DO UPDATE SET category = excluded.category
+        ''')
+    assert_rollup_matches_join(conn)
+
+def test_category_change_on_partitions(conn):
+    split_database(conn)
+    recategorize(conn, 1, 'Books')
+    assert_rollup_matches_join(conn)
+
+def test_category_change_after_archive(conn, tmp_path):
+    split_database(conn)
+    archive_partitions(conn, date(2024, 2, 1), tmp_path / 'archive')
+    recategorize(conn, 1, 'Books')
+    # Archived order lines stay in the rollups as they were
+    assert_rollup_matches_join(conn, since='2024-02-01')
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_staged_load_rejects_wrong_width_rows(tmp_path, compact):
+    conn = sqlite3.connect(tmp_path / 'staged.db')
+    create_database_schema(conn, compact)
+    create_quarantine_table(conn)
+    customers = tmp_path / 'customers.csv'
+    customers.write_text('customer_id,name,email,signup_date\n'
+                         '1,Ann Lee,ann@example.com,2023-01-05\n'
+                         '2,Bo Chen,bo@example.com\n'
+                         '3,Cy Diaz,cy@example.com,2023-03-01,extra\n'
+                         '\n'
+                         '4,Di Eng,di@example.com,2023-04-09\n', encoding='utf-8')
+    assert staged_load_csv_to_table(conn, str(customers), 'customers',
+                                    ['customer_id', 'name', 'email', 'signup_date']) == (2, 2)
+    assert [row[0] for row in conn.execute('SELECT customer_id FROM customers ORDER BY 1')] == [1, 4]
+    assert conn.execute('SELECT source_row, reason FROM ingest_rejects ORDER BY 1').fetchall() == [
+        (2, 'BAD_ROW'), (3, 'BAD_ROW')]
+    conn.close()
@@ -0,0 +1,83 @@
+import json
+import base64
+import sqlite3
+
+import pytest
+
+import generate_ecommerce_data
+from partition_orders import split_database
+from query_orders import (ConnectionPool, decode_page_token, encode_page_token, customer_order_report,
+                          customer_order_report_page)
+
+# Long enough to cover every order of the fixture database
+REPORT_DAYS = 3650
+
+def token(state):
+    """A continuation token carrying any JSON value."""
+    return base64.urlsafe_b64encode(json.dumps(state).encode('utf-8')).decode('ascii')
+
+def test_page_token_round_trip():
+    window = ('2024-01-01', '2024-03-31')
+    # order_date, customer_id, order_id, product_id, quantity, order_item_id
+    key = ['2024-03-01', 7, 12, 31, 2, 41]
+    assert decode_page_token(encode_page_token(window, key)) == (window, key)
+
+@pytest.mark.parametrize('state', [
+    [1, 2],
+    'not an object',
+    {'window': ['2024-01-01', '2024-03-31']},
+    {'window': ['2024-01-01', '2024-03-31'], 'after': 5},
+    {'window': ['2024-01-01', '2024-03-31'], 'after': 'abcdef'},
+    {'window': ['2024-01-01', '2024-03-31'], 'after': [1, 2, 3]},
+    {'window': ['2024-01-01', '2024-03-31'], 'after': [[1], 2, 3, 4, 5, 6]},
+    {'window': ['2024-01-01', '2024-03-31'], 'after': [{}, 2, 3, 4, 5, 6]},
+    {'window': ['a', 'b'], 'after': 5},
+    {'window': ['a', 'b'], 'after': [1, 2, 3, 4, 5, 6]},
+    {'window': [1, 2], 'after': [1, 2, 3, 4, 5, 6]},
+    {'window': '2024-01-01', 'after': [1, 2, 3, 4, 5, 6]},
+])
+def test_malformed_page_token_payload(state):
+    with pytest.raises(ValueError, match='invalid page token'):
+        decode_page_token(token(state))
+
+@pytest.mark.parametrize('text', ['!!!', 'not base64', 'é'])
+def test_undecodable_page_token(text):
+    with pytest.raises(ValueError, match='invalid page token'):
+        decode_page_token(text)
+
+@pytest.fixture(scope='module', params=['standard', 'compact', 'partitioned'])
+def pool(request, tmp_path_factory):
+    db_file = str(tmp_path_factory.mktemp('report') / 'ecommerce.db')
+    generate_ecommerce_data.main(['--db', db_file, '--scale', '4', '--seed', '7']
+                                 + (['--compact'] if request.param == 'compact' else []))
+    if request.param == 'partitioned':
+        conn = sqlite3.connect(db_file)
+        split_database(conn)
+        conn.close()
+    pool = ConnectionPool(db_file)
+    yield pool
+    pool.close()
+
+def all_pages(pool, page_size, **filters):
+    """Rows of every page, following the tokens until the last page."""
+    rows = []
+    token = None
+    while True:
+        _, page, token = customer_order_report_page(pool, page_size, token, days=REPORT_DAYS, **filters)
+        assert len(page) <= page_size
+        rows += page
+        if token is None:
+            return rows
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'customer_ids': list(range(1, 121, 3))},
+    {'categories': ['Books', 'Electronics']},
+    {'customer_ids': list(range(1, 121, 3)), 'categories': ['Books', 'Electronics']},
+])
+@pytest.mark.parametrize('page_size', [1, 7, 1000])
+def test_pages_equal_the_report(pool, page_size, filters):
+    report = list(customer_order_report(pool, days=REPORT_DAYS, **filters))
+    assert report
+    # Pages run in index order, the report by customer name; the rows are the same
+    assert sorted(all_pages(pool, page_size, **filters)) == sorted(report)